@@ -14,13 +14,29 @@
 # limitations under the License.
 #
 
+import atexit
 from datetime import datetime
+import logging
 import sqlite3
+import threading
+from typing import Optional
 
 DATABASE_FILENAME = 'proxy.db'
 
 DATETIME_STRING_FORMAT = '%d.%m.%Y %H:%M:%S'
 
+# Timestamp of the last request is kept in memory and written to the database every PERSIST_INTERVAL seconds
+# (and when the process exits), so proxied requests do not wait for sqlite commits.
+PERSIST_INTERVAL = 10
+
+log = logging.getLogger(__name__)
+
+_last_activity: Optional[datetime] = None
+_persisted_activity: Optional[datetime] = None
+_persist_lock = threading.Lock()
+_persister: Optional[threading.Thread] = None
+_stop_persister = threading.Event()
+
 
 def init_db():
     c = sqlite3.connect(DATABASE_FILENAME)
@@ -38,9 +54,9 @@ def init_db():
         c.close()
 
 
-def update_timestamp():
+def update_timestamp(timestamp: datetime = None):
     c = sqlite3.connect(DATABASE_FILENAME)
-    current_datetime = datetime.utcnow().strftime(DATETIME_STRING_FORMAT)
+    current_datetime = (timestamp or datetime.utcnow()).strftime(DATETIME_STRING_FORMAT)
     c.execute(f"UPDATE main SET datetimestamp='{current_datetime}'")
     c.commit()
     c.close()
@@ -55,3 +71,64 @@ def get_timestamp() -> datetime:
     result = datetime.strptime(db_datetimestamp[0], DATETIME_STRING_FORMAT)
 
     return result
+
+
+def record_activity():
+    global _last_activity
+    _last_activity = datetime.utcnow()
+
+    if _persister is None:
+        _start_persister()
+
+
+def get_last_activity() -> datetime:
+    # proxy is served by several worker processes, each of them keeps its own timestamp in memory - the database
+    # holds the latest timestamp persisted by any of them
+    stored_activity = get_timestamp()
+    last_activity = _last_activity
+    return max(stored_activity, last_activity) if last_activity else stored_activity
+
+
+def persist_activity():
+    global _persisted_activity
+    with _persist_lock:
+        last_activity = _last_activity
+        if last_activity is None or last_activity == _persisted_activity:
+            return
+
+        if last_activity > get_timestamp():
+            update_timestamp(last_activity)
+        _persisted_activity = last_activity
+
+
+def _persist_periodically():
+    while not _stop_persister.wait(PERSIST_INTERVAL):
+        try:
+            persist_activity()
+        except Exception:
+            log.exception('Failed to persist last activity timestamp')
+
+
+def _start_persister():
+    global _persister
+    with _persist_lock:
+        if _persister is None:
+            _persister = threading.Thread(target=_persist_periodically, name='activity-persister', daemon=True)
+            _persister.start()
+
+
+def stop_persister():
+    global _persister
+    _stop_persister.set()
+    if _persister is not None:
+        _persister.join()
+        _persister = None
+    _stop_persister.clear()
+
+    try:
+        persist_activity()
+    except Exception:
+        log.exception('Failed to persist last activity timestamp')
+
+
+atexit.register(stop_persister)
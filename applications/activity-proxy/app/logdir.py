@@ -0,0 +1,67 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+from typing import List, Optional, Tuple
+
+# When activity proxy runs next to a pooled TensorBoard instance, TensorBoard watches the LOGDIR_PATH directory
+# (shared by both containers) and runs are assigned to the instance by creating symlinks to their output
+# directories (mounted at RUNS_OUTPUT_PATH in TensorBoard container) there.
+LOGDIR_PATH = os.environ.get('LOGDIR_PATH')
+RUNS_OUTPUT_PATH = os.environ.get('RUNS_OUTPUT_PATH', '/mnt/output')
+
+ASSIGNED_MARKER_FILENAME = '.assigned'
+
+
+class LogdirError(Exception):
+    pass
+
+
+class LogdirAlreadyAssignedError(LogdirError):
+    pass
+
+
+def is_logdir_assignment_enabled() -> bool:
+    return bool(LOGDIR_PATH)
+
+
+def _validate_path_component(value: Optional[str]) -> str:
+    if not isinstance(value, str) or not value or value in {'.', '..'} or '/' in value or '\0' in value:
+        raise LogdirError(f'invalid owner or run name: {value!r}')
+    return value
+
+
+def assign_runs(runs: List[Tuple[str, str]]):
+    """
+    Links output directories of given runs to TensorBoard's logdir. Runs can be assigned only once,
+    so an instance that already serves some runs cannot be taken over.
+    :param runs: list of (owner, run name) tuples
+    """
+    if not runs:
+        raise LogdirError('at least 1 run is needed')
+    runs = [(_validate_path_component(owner), _validate_path_component(name)) for owner, name in runs]
+
+    try:
+        # O_EXCL makes the check safe across all worker processes of the proxy
+        marker = os.open(os.path.join(LOGDIR_PATH, ASSIGNED_MARKER_FILENAME), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise LogdirAlreadyAssignedError('runs have already been assigned to this TensorBoard instance')
+    os.close(marker)
+
+    for owner, name in runs:
+        owner_dir = os.path.join(LOGDIR_PATH, owner)
+        os.makedirs(owner_dir, exist_ok=True)
+        os.symlink(os.path.join(RUNS_OUTPUT_PATH, owner, name), os.path.join(owner_dir, name))
@@ -14,13 +14,16 @@
 # limitations under the License.
 #
 
+from http import HTTPStatus
 import json
 import logging
 
 from flask import Flask, Response, request
 import requests
+from requests.adapters import HTTPAdapter
 
 import database
+import logdir
 from models import InactivityResponse
 
 app = Flask(__name__)
@@ -28,10 +31,29 @@ logging.basicConfig(level=logging.INFO)
 
 redirect_to = 'http://127.0.0.1:{}/'.format('6006')
 
+# size of pool of keep-alive connections to TensorBoard, should not be lower than number of threads of a worker
+UPSTREAM_POOL_SIZE = 16
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# headers related to a single connection, which must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                      'transfer-encoding', 'upgrade'}
+
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE))
+
 
 database.init_db()
 
 
+def stream_upstream_response(resp: requests.Response):
+    try:
+        # content is passed as it is, so e.g. gzip encoded responses are not decompressed by the proxy
+        yield from resp.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+    finally:
+        resp.close()
+
+
 @app.route('/', defaults={'url': ''})
 @app.route('/<path:url>')
 def proxy(url):
@@ -39,36 +61,65 @@ def proxy(url):
     if request.query_string:
         new_url = new_url + '?' + request.query_string.decode('utf-8')
 
-    headers = dict(request.headers)
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
 
     final_url = str(redirect_to + new_url)
 
-    resp = requests.request(request.method,
-                            final_url,
-                            data=request.get_data(),
-                            headers=headers,
-                            cookies=request.cookies
-                            )
+    resp = session.request(request.method,
+                           final_url,
+                           data=request.get_data(),
+                           headers=headers,
+                           cookies=request.cookies,
+                           stream=True
+                           )
 
-    flask_resp = Response(response=resp.content, content_type=resp.headers['Content-Type'])
+    flask_resp = Response(response=stream_upstream_response(resp), direct_passthrough=True)
 
     flask_resp.status_code = resp.status_code
 
+    for header_key, header_value in resp.headers.items():
+        if header_key.lower() not in HOP_BY_HOP_HEADERS and header_key.lower() != 'set-cookie':
+            flask_resp.headers[header_key] = header_value
+
     for cookie_key, cookie_value in resp.cookies.items():
         flask_resp.set_cookie(cookie_key, value=cookie_value)
 
-    database.update_timestamp()
+    database.record_activity()
 
     return flask_resp
 
 
 @app.route('/inactivity')
 def inactivity():
-    timestamp = database.get_timestamp()
+    timestamp = database.get_last_activity()
     response = InactivityResponse(last_request_datetime=timestamp)
     return Response(response=json.dumps(response.to_dict()), content_type='application/json')
 
 
+@app.route('/logdir', methods=['PUT'])
+def assign_logdir():
+    if not logdir.is_logdir_assignment_enabled():
+        return Response(status=HTTPStatus.NOT_FOUND)
+
+    try:
+        runs = [(run['owner'], run['name']) for run in request.get_json(force=True)['runs']]
+    except (KeyError, TypeError):
+        return Response(response='incorrect request body', status=HTTPStatus.BAD_REQUEST)
+
+    try:
+        logdir.assign_runs(runs)
+    except logdir.LogdirAlreadyAssignedError as ex:
+        return Response(response=str(ex), status=HTTPStatus.CONFLICT)
+    except logdir.LogdirError as ex:
+        return Response(response=str(ex), status=HTTPStatus.BAD_REQUEST)
+
+    # instance may have been waiting in the pool for a long time - it must not be treated as inactive from now on
+    database.record_activity()
+    database.persist_activity()
+
+    return Response(status=HTTPStatus.NO_CONTENT)
+
+
 @app.route('/healthz')
 def healthz():
     resp = requests.get(redirect_to)
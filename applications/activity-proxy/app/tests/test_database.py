@@ -77,3 +77,81 @@ def test_get_timestamp(mocker):
     assert fake_connection.execute.call_count == 1
     assert fake_cursor.fetchone.call_count == 1
     assert fake_connection.close.call_count == 1
+
+
+@pytest.fixture
+def activity_state(mocker):
+    mocker.patch.object(database, '_last_activity', None)
+    mocker.patch.object(database, '_persisted_activity', None)
+    mocker.patch.object(database, '_persister', None)
+    mocker.patch.object(database, '_start_persister')
+
+
+# noinspection PyUnusedLocal,PyShadowingNames
+def test_record_activity(mocker, activity_state):
+    fake_connect = mocker.patch('sqlite3.connect')
+
+    database.record_activity()
+
+    assert database._last_activity is not None
+    assert fake_connect.call_count == 0
+    # noinspection PyUnresolvedReferences
+    assert database._start_persister.call_count == 1
+
+
+# noinspection PyUnusedLocal,PyShadowingNames
+@pytest.mark.parametrize('last_activity,expected_activity', [
+    (None, datetime(year=2018, month=7, day=26, hour=11)),
+    (datetime(year=2018, month=7, day=26, hour=10), datetime(year=2018, month=7, day=26, hour=11)),
+    (datetime(year=2018, month=7, day=26, hour=12), datetime(year=2018, month=7, day=26, hour=12)),
+])
+def test_get_last_activity(mocker, activity_state, last_activity, expected_activity):
+    mocker.patch.object(database, '_last_activity', last_activity)
+    mocker.patch('database.get_timestamp').return_value = datetime(year=2018, month=7, day=26, hour=11)
+
+    assert database.get_last_activity() == expected_activity
+
+
+# noinspection PyUnusedLocal,PyShadowingNames
+def test_persist_activity(mocker, activity_state):
+    last_activity = datetime(year=2018, month=7, day=26, hour=12)
+    mocker.patch.object(database, '_last_activity', last_activity)
+    mocker.patch('database.get_timestamp').return_value = datetime(year=2018, month=7, day=26, hour=11)
+    fake_update_timestamp = mocker.patch('database.update_timestamp')
+
+    database.persist_activity()
+    database.persist_activity()
+
+    fake_update_timestamp.assert_called_once_with(last_activity)
+
+
+# noinspection PyUnusedLocal,PyShadowingNames
+def test_persist_activity_older_than_stored(mocker, activity_state):
+    mocker.patch.object(database, '_last_activity', datetime(year=2018, month=7, day=26, hour=10))
+    mocker.patch('database.get_timestamp').return_value = datetime(year=2018, month=7, day=26, hour=11)
+    fake_update_timestamp = mocker.patch('database.update_timestamp')
+
+    database.persist_activity()
+
+    assert fake_update_timestamp.call_count == 0
+
+
+# noinspection PyUnusedLocal,PyShadowingNames
+def test_persist_activity_no_activity(mocker, activity_state):
+    fake_connect = mocker.patch('sqlite3.connect')
+
+    database.persist_activity()
+
+    assert fake_connect.call_count == 0
+
+
+def test_persister(mocker):
+    mocker.patch.object(database, 'PERSIST_INTERVAL', 0.01)
+    mocker.patch.object(database, '_persister', None)
+    fake_persist_activity = mocker.patch('database.persist_activity')
+
+    database._start_persister()
+    database.stop_persister()
+
+    assert database._persister is None
+    assert fake_persist_activity.call_count >= 1
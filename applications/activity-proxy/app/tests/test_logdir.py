@@ -0,0 +1,64 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+import pytest
+
+import logdir
+
+
+@pytest.fixture
+def logdir_path(mocker, tmpdir):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', str(tmpdir))
+    mocker.patch.object(logdir, 'RUNS_OUTPUT_PATH', '/mnt/output')
+    return str(tmpdir)
+
+
+# noinspection PyShadowingNames
+def test_assign_runs(logdir_path):
+    logdir.assign_runs([('jeanne', 'training1'), ('jeanne', 'training2'), ('abbie', 'training3')])
+
+    assert os.readlink(os.path.join(logdir_path, 'jeanne', 'training1')) == '/mnt/output/jeanne/training1'
+    assert os.readlink(os.path.join(logdir_path, 'jeanne', 'training2')) == '/mnt/output/jeanne/training2'
+    assert os.readlink(os.path.join(logdir_path, 'abbie', 'training3')) == '/mnt/output/abbie/training3'
+
+
+# noinspection PyShadowingNames
+def test_assign_runs_only_once(logdir_path):
+    logdir.assign_runs([('jeanne', 'training1')])
+
+    with pytest.raises(logdir.LogdirAlreadyAssignedError):
+        logdir.assign_runs([('abbie', 'training3')])
+
+    assert not os.path.exists(os.path.join(logdir_path, 'abbie'))
+
+
+# noinspection PyShadowingNames
+@pytest.mark.parametrize('runs', [[], [('jeanne', '../training1')], [('..', 'training1')], [('jeanne', None)]])
+def test_assign_runs_invalid(logdir_path, runs):
+    with pytest.raises(logdir.LogdirError):
+        logdir.assign_runs(runs)
+
+    assert os.listdir(logdir_path) == []
+
+
+def test_is_logdir_assignment_enabled(mocker):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', None)
+    assert not logdir.is_logdir_assignment_enabled()
+
+    mocker.patch.object(logdir, 'LOGDIR_PATH', '/mnt/exp')
+    assert logdir.is_logdir_assignment_enabled()
@@ -23,6 +23,7 @@ from flask.testing import FlaskClient
 import pytest
 
 import database
+import logdir
 
 
 @pytest.fixture
@@ -36,12 +37,10 @@ def flask_client(mocker):
 @pytest.mark.parametrize('url', ['/', '/random/url'])
 # noinspection PyShadowingNames
 def test_proxy(mocker, flask_client: FlaskClient, url):
-    fake_upstream_response = 'hello world!'
-    fake_upstream_response_status_code = HTTPStatus.OK
-    mocker.patch('requests.request').return_value = MagicMock(content=fake_upstream_response.encode('utf-8'),
-                                                              headers={'Content-Type': 'text/html'},
-                                                              status_code=fake_upstream_response_status_code.value)
-    mocker.patch('database.update_timestamp')
+    fake_upstream_response = MagicMock(headers={'Content-Type': 'text/html'}, status_code=HTTPStatus.OK.value)
+    fake_upstream_response.raw.stream.return_value = iter([b'hello ', b'world!'])
+    fake_request = mocker.patch('proxy.session.request', return_value=fake_upstream_response)
+    mocker.patch('database.record_activity')
 
     response = flask_client.get(url)
 
@@ -49,13 +48,37 @@ def test_proxy(mocker, flask_client: FlaskClient, url):
 
     assert response_body == 'hello world!'
     assert response.status_code == HTTPStatus.OK
+    assert response.headers['Content-Type'] == 'text/html'
+    assert fake_request.call_args[1]['stream'] is True
+    assert fake_upstream_response.close.call_count == 1
     # noinspection PyUnresolvedReferences
-    assert database.update_timestamp.call_count == 1
+    assert database.record_activity.call_count == 1
+
+
+# noinspection PyShadowingNames
+def test_proxy_forwards_encoded_content(mocker, flask_client: FlaskClient):
+    fake_upstream_response = MagicMock(headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                                                'Content-Length': '4', 'Connection': 'keep-alive'},
+                                       status_code=HTTPStatus.OK.value)
+    fake_upstream_response.raw.stream.return_value = iter([b'\x1f\x8b', b'\x08\x00'])
+    fake_request = mocker.patch('proxy.session.request', return_value=fake_upstream_response)
+    mocker.patch('database.record_activity')
+
+    response = flask_client.get('/data/plugin/scalars/scalars', headers={'Accept-Encoding': 'gzip',
+                                                                         'Connection': 'keep-alive'})
+
+    assert response.data == b'\x1f\x8b\x08\x00'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Content-Length'] == '4'
+    assert 'Connection' not in response.headers
+    assert fake_upstream_response.raw.stream.call_args[1]['decode_content'] is False
+    assert fake_request.call_args[1]['headers']['Accept-Encoding'] == 'gzip'
+    assert 'Connection' not in fake_request.call_args[1]['headers']
 
 
 def test_inactivity(mocker, flask_client: FlaskClient):
     fake_timestamp = datetime(2018, 7, 26, 12, 19, 34, 867831)
-    mocker.patch('database.get_timestamp').return_value = fake_timestamp
+    mocker.patch('database.get_last_activity').return_value = fake_timestamp
     response = flask_client.get('/inactivity')
 
     response_body = response.data.decode('utf-8')
@@ -64,7 +87,7 @@ def test_inactivity(mocker, flask_client: FlaskClient):
     assert response_json['lastRequestDatetime'] == fake_timestamp.isoformat()
     assert response.status_code == HTTPStatus.OK
     # noinspection PyUnresolvedReferences
-    assert database.get_timestamp.call_count == 1
+    assert database.get_last_activity.call_count == 1
 
 
 def test_healthz(mocker, flask_client: FlaskClient):
@@ -74,3 +97,48 @@ def test_healthz(mocker, flask_client: FlaskClient):
     response = flask_client.get('/healthz')
 
     assert response.status_code == fake_upstream_response_status_code
+
+
+# noinspection PyShadowingNames
+def test_assign_logdir(mocker, flask_client: FlaskClient):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', '/mnt/exp')
+    fake_assign_runs = mocker.patch('logdir.assign_runs')
+    mocker.patch('database.record_activity')
+    mocker.patch('database.persist_activity')
+
+    response = flask_client.put('/logdir', data=json.dumps({'runs': [{'owner': 'jeanne', 'name': 'training1'}]}))
+
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    fake_assign_runs.assert_called_once_with([('jeanne', 'training1')])
+    # noinspection PyUnresolvedReferences
+    assert database.persist_activity.call_count == 1
+
+
+# noinspection PyShadowingNames
+@pytest.mark.parametrize('error,status_code', [(logdir.LogdirAlreadyAssignedError, HTTPStatus.CONFLICT),
+                                               (logdir.LogdirError, HTTPStatus.BAD_REQUEST)])
+def test_assign_logdir_error(mocker, flask_client: FlaskClient, error, status_code):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', '/mnt/exp')
+    mocker.patch('logdir.assign_runs').side_effect = error
+
+    response = flask_client.put('/logdir', data=json.dumps({'runs': [{'owner': 'jeanne', 'name': 'training1'}]}))
+
+    assert response.status_code == status_code
+
+
+# noinspection PyShadowingNames
+def test_assign_logdir_incorrect_body(mocker, flask_client: FlaskClient):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', '/mnt/exp')
+
+    response = flask_client.put('/logdir', data=json.dumps({'runNames': []}))
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+# noinspection PyShadowingNames
+def test_assign_logdir_disabled(mocker, flask_client: FlaskClient):
+    mocker.patch.object(logdir, 'LOGDIR_PATH', None)
+
+    response = flask_client.put('/logdir', data=json.dumps({'runs': [{'owner': 'jeanne', 'name': 'training1'}]}))
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
@@ -15,14 +15,19 @@
 #
 
 import argparse
+import json
+from collections import deque
 from enum import Enum
+from functools import partial
 import logging
 import os
-from time import sleep
+from time import sleep, time
 from threading import Thread
-from typing import Optional
+from typing import BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
 import pickle
+import struct
 
+import numpy as np
 from retry.api import retry_call
 import tensorflow as tf
 
@@ -40,6 +45,17 @@ RUN_VERSION = 'v1'
 LABEL_KEY = "label"
 RESULT_KEY = "result"
 
+PREDICT_TIMEOUT = 30.0  # seconds
+PREDICT_TRIES = 5
+PREDICT_RETRY_DELAY = 30  # seconds
+
+DEFAULT_CONCURRENCY = 1
+DEFAULT_BATCH_SIZE = 1
+
+MANIFEST_FILENAME = '.batch-inference-manifest'
+MANIFEST_RECORDS_SAVE_INTERVAL = 5  # seconds
+PARTIAL_RESULTS_SUFFIX = '.partial'
+
 progress = 0
 max_progress = 1
 stop_thread = False
@@ -51,6 +67,15 @@ class APPLICABLE_FORMATS(Enum):
     TF_RECORD = "tf-record"
 
 
+class OUTPUT_FORMATS(Enum):
+    PICKLE = "pickle"
+    STREAM = "stream"
+
+
+# every record in a stream results file is preceded by its length stored as unsigned 64-bit big-endian integer
+STREAM_RECORD_HEADER = struct.Struct('>Q')
+
+
 if log_level_env_var:
     desired_log_level = logging.getLevelName(log_level_env_var.upper())
     if desired_log_level not in (logging.CRITICAL, logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG):
@@ -67,7 +92,8 @@ k8s_rest_logger.setLevel(logging.INFO)
 
 
 def do_batch_inference(server_address: str, input_dir_path: str, output_dir_path: str, related_run_name: str,
-                       input_format: str):
+                       input_format: str, concurrency: int = DEFAULT_CONCURRENCY,
+                       output_format: str = OUTPUT_FORMATS.PICKLE.value, batch_size: int = DEFAULT_BATCH_SIZE):
     detected_files = []
 
     for root, _, files in os.walk(input_dir_path):
@@ -83,29 +109,69 @@ def do_batch_inference(server_address: str, input_dir_path: str, output_dir_path
     global progress
     max_progress = len(detected_files)
 
-    reverted_progress = try_revert_progress(related_run_name)
-    if reverted_progress:
-        logging.debug(f"new progress for processing: {progress}")
-        progress = reverted_progress
+    manifest_path = os.path.join(output_dir_path, MANIFEST_FILENAME)
+    manifest_exists = os.path.isfile(manifest_path)
+    manifest = ProgressManifest.load(manifest_path)
+
+    if manifest_exists:
+        files_to_process = [data_file for data_file in detected_files
+                            if os.path.relpath(data_file, input_dir_path) not in manifest.completed_files]
+        progress = max_progress - len(files_to_process)
+        logging.debug(f"progress restored from manifest: {progress}")
     else:
-        logging.debug("no progress reverted")
+        # no manifest saved (e.g. run was started by a previous version) - fall back to the progress metric
+        reverted_progress = try_revert_progress(related_run_name)
+        if reverted_progress:
+            progress = reverted_progress
+            logging.debug(f"new progress for processing: {progress}")
+            manifest.files_completed([os.path.relpath(data_file, input_dir_path)
+                                      for data_file in detected_files[:progress]])
+        else:
+            logging.debug("no progress reverted")
+
+        files_to_process = detected_files[progress:]
 
-    files_to_process = detected_files[progress:]
+    pipeline = PredictionPipeline(stub=stub, concurrency=concurrency)
+    batcher = RequestBatcher(pipeline=pipeline, batch_size=batch_size)
 
     for data_file in files_to_process:
         logging.debug(f"processing file: {data_file}")
+        manifest_key = os.path.relpath(data_file, input_dir_path)
 
         if input_format == APPLICABLE_FORMATS.TF_RECORD.value:
             record_iterator = tf.python_io.tf_record_iterator(path=data_file)
 
             id = 0
-            # if tf-record input format is chosen, results are stored in Python list containing dictionary items
-            # each item contains label (key - label) and binary object (key - result)
-            output_list = []
+            output_filename = "{}.result".format(data_file)
+            output_path = f'{output_dir_path}/{os.path.basename(output_filename)}'
+
+            # each result is appended to a stream results file as soon as it arrives, so after a restart
+            # processing of this file continues from the first record without a stored result
+            if output_format == OUTPUT_FORMATS.STREAM.value:
+                stream_path = output_path
+            else:
+                # if pickle output format is chosen, results are gathered in a partial stream file and converted
+                # to a pickled Python list containing dictionary items after the whole file is processed
+                # each item contains label (key - label) and binary object (key - result)
+                stream_path = f'{output_path}{PARTIAL_RESULTS_SUFFIX}'
+
+            output_file, processed_records = open_stream_results(stream_path,
+                                                                 manifest.record_offsets.get(manifest_key))
+            on_record_result = partial(write_stream_result_with_checkpoint, output_file, manifest, manifest_key)
+            if processed_records:
+                logging.info(f"resuming {data_file} from record {processed_records}")
+            # offset journaled in the manifest is replaced also when no results are stored, e.g. when the results
+            # file has been removed - next results are counted from it
+            manifest.records_completed(manifest_key, processed_records, output_file.tell(), output_file=output_file)
+
+            if output_format == OUTPUT_FORMATS.STREAM.value:
+                on_file_finished = partial(close_stream_results, output_file)
+            else:
+                on_file_finished = partial(save_tf_record_results, output_file, stream_path, output_path)
 
             filename, _ = os.path.splitext(data_file)
 
-            for string_record in record_iterator:
+            for record_index, string_record in enumerate(record_iterator):
                 example = tf.train.Example()
                 example.ParseFromString(string_record)
 
@@ -118,27 +184,357 @@ def do_batch_inference(server_address: str, input_dir_path: str, output_dir_path
                         label = "{}_{}".format(filename, id)
                         id += 1
 
-                binary_result = make_prediction(input=example.features.feature['data_pb'].bytes_list.value[0],
-                                                stub=stub)
+                if record_index < processed_records:
+                    continue
 
-                output_list.append({LABEL_KEY: label, RESULT_KEY: binary_result})
+                request = parse_predict_request(input=example.features.feature['data_pb'].bytes_list.value[0])
 
-            output_filename = "{}.result".format(data_file)
+                batcher.submit(request=request, on_result=partial(on_record_result, label))
 
-            with open(f'{output_dir_path}/{os.path.basename(output_filename)}', mode='wb') as fi:
-                pickle.dump(obj=output_list, file=fi, protocol=pickle.HIGHEST_PROTOCOL)
+            batcher.flush()
+            pipeline.then(on_file_finished)
+            pipeline.then(partial(file_processed, manifest, manifest_key))
+
+            if output_format != OUTPUT_FORMATS.STREAM.value:
+                # partial results are needed until completion of the file is stored in the manifest
+                pipeline.then(partial(os.remove, stream_path))
 
         else:
             with open(data_file, mode='rb') as fi:
                 pb_bytes = fi.read()
 
-                make_prediction(input=pb_bytes,
-                                stub=stub,
-                                output_filename=data_file,
-                                output_dir_path=output_dir_path)
+            request = parse_predict_request(input=pb_bytes, output_filename=data_file)
+
+            pipeline.submit(request=request,
+                            on_result=partial(save_result, f'{output_dir_path}/{os.path.basename(data_file)}'))
+            pipeline.then(partial(file_processed, manifest, manifest_key))
+
+    pipeline.drain()
+    manifest.close()
+
+
+def file_processed(manifest: 'ProgressManifest', manifest_key: str):
+    manifest.files_completed([manifest_key])
+
+    global progress
+    progress += 1
+    logging.info(f'progress: {progress}/{max_progress}')
+
+
+def sync_file(output_file: BinaryIO):
+    output_file.flush()
+    os.fsync(output_file.fileno())
+
+
+def save_result(output_path: str, binary_result: bytes):
+    with open(output_path, mode='wb') as fi:
+        fi.write(binary_result)
+        # result has to be on disk before the file is marked as completed in the manifest
+        sync_file(fi)
+
+
+def save_tf_record_results(stream_file: BinaryIO, stream_path: str, output_path: str):
+    stream_file.close()
+    output_list = list(read_stream_results(stream_path))
+
+    with open(output_path, mode='wb') as fi:
+        pickle.dump(obj=output_list, file=fi, protocol=pickle.HIGHEST_PROTOCOL)
+        sync_file(fi)
+
+
+def write_stream_result(output_file: BinaryIO, label: str, binary_result: bytes):
+    record = pickle.dumps({LABEL_KEY: label, RESULT_KEY: binary_result}, protocol=pickle.HIGHEST_PROTOCOL)
+    output_file.write(STREAM_RECORD_HEADER.pack(len(record)))
+    output_file.write(record)
+    output_file.flush()
+
+
+def write_stream_result_with_checkpoint(output_file: BinaryIO, manifest: 'ProgressManifest', manifest_key: str,
+                                        label: str, binary_result: bytes):
+    write_stream_result(output_file, label, binary_result)
+    records, _ = manifest.record_offsets.get(manifest_key, (0, 0))
+    manifest.records_completed(manifest_key, records + 1, output_file.tell(), output_file=output_file)
+
+
+def close_stream_results(output_file: BinaryIO):
+    sync_file(output_file)
+    output_file.close()
+
+
+def open_stream_results(output_path: str, checkpoint: Tuple[int, Optional[int]] = None) -> Tuple[BinaryIO, int]:
+    """
+    Opens stream results file for writing. If the file already exists, results stored in it are kept, an incomplete
+    trailing record (left by an interrupted write) is truncated and new results are appended after the last
+    complete one.
+    :param checkpoint: number of records and size of the file journaled in the progress manifest - if given,
+     only records stored after the checkpoint are scanned
+    :return: opened file and number of complete results already stored in it
+    """
+    if not os.path.isfile(output_path):
+        return open(output_path, mode='wb'), 0
+
+    output_file = open(output_path, mode='r+b')
+    file_size = os.fstat(output_file.fileno()).st_size
+    records_count = 0
+    valid_size = 0
+
+    if checkpoint and checkpoint[1] is not None and checkpoint[1] <= file_size:
+        records_count, valid_size = checkpoint
+        output_file.seek(valid_size)
+
+    while True:
+        header = output_file.read(STREAM_RECORD_HEADER.size)
+        if len(header) < STREAM_RECORD_HEADER.size:
+            break
+
+        record_length, = STREAM_RECORD_HEADER.unpack(header)
+        if valid_size + STREAM_RECORD_HEADER.size + record_length > file_size:
+            break
+
+        output_file.seek(record_length, os.SEEK_CUR)
+        valid_size += STREAM_RECORD_HEADER.size + record_length
+        records_count += 1
+
+    output_file.truncate(valid_size)
+    output_file.seek(valid_size)
+
+    return output_file, records_count
+
+
+def read_stream_results(input_path: str) -> Iterator[dict]:
+    """
+    Reads results stored in stream output format, yielding dictionaries with label (key - label)
+    and binary object (key - result).
+    """
+    with open(input_path, mode='rb') as fi:
+        while True:
+            header = fi.read(STREAM_RECORD_HEADER.size)
+            if len(header) < STREAM_RECORD_HEADER.size:
+                return
+
+            record_length, = STREAM_RECORD_HEADER.unpack(header)
+            record = fi.read(record_length)
+            if len(record) < record_length:
+                return
+
+            yield pickle.loads(record)
+
+
+class ProgressManifest:
+    """
+    Durable journal of batch inference progress kept in the output directory. Each line is a JSON object
+    describing either a completed input file ({"file": ...}) or a number of completed records of an input
+    file in progress together with the size of its results file ({"file": ..., "records": ..., "bytes": ...}).
+    Completed files are synced to disk immediately, record offsets at most every MANIFEST_RECORDS_SAVE_INTERVAL
+    seconds, each time after syncing the results file, so journaled offsets never point past stored results.
+    When loaded, the journal is compacted into a new file which atomically replaces the previous one, so a crash
+    at any moment leaves a readable manifest.
+    """
+
+    def __init__(self, path: str, completed_files: Set[str] = None,
+                 record_offsets: Dict[str, Tuple[int, Optional[int]]] = None):
+        self.path = path
+        self.completed_files: Set[str] = completed_files or set()
+        self.record_offsets: Dict[str, Tuple[int, Optional[int]]] = record_offsets or {}
+        self._records_saved_at = 0.0
+        self._journal = None
+
+    @classmethod
+    def load(cls, path: str) -> 'ProgressManifest':
+        completed_files = set()
+        record_offsets = {}
+
+        if os.path.isfile(path):
+            with open(path, mode='r') as fi:
+                for line in fi:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # line not fully written before a crash
+                        logging.debug(f"skipping malformed manifest entry: {line}")
+                        continue
+
+                    if 'records' in entry:
+                        record_offsets[entry['file']] = (entry['records'], entry.get('bytes'))
+                    else:
+                        completed_files.add(entry['file'])
+                        record_offsets.pop(entry['file'], None)
+
+        manifest = cls(path=path, completed_files=completed_files, record_offsets=record_offsets)
+        manifest._compact()
+
+        return manifest
+
+    def files_completed(self, data_files: List[str]):
+        for data_file in data_files:
+            self.completed_files.add(data_file)
+            self.record_offsets.pop(data_file, None)
+            self._journal.write(json.dumps({'file': data_file}) + '\n')
+
+        self._sync()
+
+    def records_completed(self, data_file: str, records: int, size: int, output_file: BinaryIO = None):
+        self.record_offsets[data_file] = (records, size)
+
+        if time() - self._records_saved_at >= MANIFEST_RECORDS_SAVE_INTERVAL:
+            if output_file:
+                sync_file(output_file)
+            self._journal.write(json.dumps({'file': data_file, 'records': records, 'bytes': size}) + '\n')
+            self._sync()
+            self._records_saved_at = time()
+
+    def close(self):
+        self._journal.close()
+
+    def _compact(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, mode='w') as fi:
+            for completed_file in sorted(self.completed_files):
+                fi.write(json.dumps({'file': completed_file}) + '\n')
+            for data_file, (records, size) in self.record_offsets.items():
+                fi.write(json.dumps({'file': data_file, 'records': records, 'bytes': size}) + '\n')
+            fi.flush()
+            os.fsync(fi.fileno())
+        os.replace(tmp_path, self.path)
+
+        self._journal = open(self.path, mode='a')
+
+    def _sync(self):
+        sync_file(self._journal)
+
+
+class PredictionPipeline:
+    """
+    Keeps up to `concurrency` Predict requests in flight at once. Results are collected in submission order, so
+    callbacks registered with submit() and then() are called in exactly the same order as they were registered.
+    """
+
+    def __init__(self, stub: prediction_service_pb2_grpc.PredictionServiceStub,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be a positive number, got: {concurrency}")
+
+        self._stub = stub
+        self._concurrency = concurrency
+        self._in_flight = 0
+        # each entry: (future, request, callback) - future and request are None for entries added by then()
+        self._queue: Deque[Tuple[Optional[grpc.Future], Optional[predict_pb2.PredictRequest], Callable]] = deque()
+
+    def submit(self, request: predict_pb2.PredictRequest, on_result: Callable[[bytes], None]):
+        while self._in_flight >= self._concurrency:
+            self._collect_oldest()
+
+        future = self._stub.Predict.future(request, timeout=PREDICT_TIMEOUT)
+        self._queue.append((future, request, on_result))
+        self._in_flight += 1
+
+    def then(self, callback: Callable[[], None]):
+        if self._queue:
+            self._queue.append((None, None, callback))
+        else:
+            callback()
+
+    def drain(self):
+        while self._queue:
+            self._collect_oldest()
+
+    def _collect_oldest(self):
+        future, request, callback = self._queue.popleft()
+
+        if future is None:
+            callback()
+            return
+
+        self._in_flight -= 1
 
-        progress += 1
-        logging.info(f'progress: {progress}/{max_progress}')
+        try:
+            result = future.result()
+        except grpc.RpcError:
+            logging.warning("asynchronous prediction failed, retrying synchronously", exc_info=True)
+            result = retry_call(self._stub.Predict, fargs=[request], fkwargs={"timeout": PREDICT_TIMEOUT},
+                                tries=PREDICT_TRIES - 1, delay=PREDICT_RETRY_DELAY)
+
+        callback(result.SerializeToString())
+
+
+class RequestBatcher:
+    """
+    Packs requests of consecutive examples into a single PredictRequest along the batch dimension and splits
+    the response back into results of particular examples. Requires models exported with a dynamic batch dimension.
+    """
+
+    def __init__(self, pipeline: PredictionPipeline, batch_size: int = DEFAULT_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError(f"batch size must be a positive number, got: {batch_size}")
+
+        self._pipeline = pipeline
+        self._batch_size = batch_size
+        self._requests: List[predict_pb2.PredictRequest] = []
+        self._callbacks: List[Callable[[bytes], None]] = []
+
+    def submit(self, request: predict_pb2.PredictRequest, on_result: Callable[[bytes], None]):
+        self._requests.append(request)
+        self._callbacks.append(on_result)
+
+        if len(self._requests) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._requests) == 1:
+            self._pipeline.submit(request=self._requests[0], on_result=self._callbacks[0])
+        elif self._requests:
+            batched_request, batch_sizes = merge_predict_requests(self._requests)
+            self._pipeline.submit(request=batched_request,
+                                  on_result=partial(dispatch_batched_result, self._callbacks, batch_sizes))
+
+        self._requests = []
+        self._callbacks = []
+
+
+def merge_predict_requests(requests: List[predict_pb2.PredictRequest]) \
+        -> Tuple[predict_pb2.PredictRequest, List[int]]:
+    """
+    Concatenates inputs of given requests along the first (batch) dimension.
+    :return: merged request and numbers of examples contributed by each of the given requests
+    """
+    batched_request = predict_pb2.PredictRequest()
+    batched_request.model_spec.CopyFrom(requests[0].model_spec)
+    batched_request.output_filter.extend(requests[0].output_filter)
+
+    batch_sizes = []
+
+    for input_key in requests[0].inputs:
+        arrays = [tf.make_ndarray(request.inputs[input_key]) for request in requests]
+        if not batch_sizes:
+            batch_sizes = [array.shape[0] for array in arrays]
+        batched_request.inputs[input_key].CopyFrom(tf.make_tensor_proto(np.concatenate(arrays)))
+
+    return batched_request, batch_sizes
+
+
+def split_predict_response(response: predict_pb2.PredictResponse, batch_sizes: List[int]) \
+        -> List[predict_pb2.PredictResponse]:
+    results = []
+    for _ in batch_sizes:
+        result = predict_pb2.PredictResponse()
+        result.model_spec.CopyFrom(response.model_spec)
+        results.append(result)
+
+    split_indices = np.cumsum(batch_sizes)[:-1]
+
+    for output_key, tensor in response.outputs.items():
+        for result, array in zip(results, np.split(tf.make_ndarray(tensor), split_indices)):
+            result.outputs[output_key].CopyFrom(tf.make_tensor_proto(array))
+
+    return results
+
+
+def dispatch_batched_result(callbacks: List[Callable[[bytes], None]], batch_sizes: List[int], binary_result: bytes):
+    response = predict_pb2.PredictResponse()
+    response.ParseFromString(binary_result)
+
+    for callback, result in zip(callbacks, split_predict_response(response, batch_sizes)):
+        callback(result.SerializeToString())
 
 
 def build_label_from_filename(filename: str, id: int):
@@ -147,25 +543,14 @@ def build_label_from_filename(filename: str, id: int):
     return "{}_{}".format(name, id)
 
 
-def make_prediction(input: bytes, stub: prediction_service_pb2_grpc.PredictionServiceStub,
-                    output_filename: str = None, output_dir_path: str = None):
+def parse_predict_request(input: bytes, output_filename: str = None) -> predict_pb2.PredictRequest:
     request = predict_pb2.PredictRequest()
     try:
         request.ParseFromString(input)
     except Exception as ex:
         raise RuntimeError(f"failed to parse {output_filename}") from ex
 
-    # actual call without retry:
-    # result = stub.Predict(request, timeout=30.0)  # timeout 30 seconds
-    result = retry_call(stub.Predict, fargs=[request], fkwargs={"timeout": 30.0}, tries=5, delay=30)
-
-    result_pb_serialized: bytes = result.SerializeToString()
-
-    if output_filename:
-        with open(f'{output_dir_path}/{os.path.basename(output_filename)}', mode='wb') as fi:
-            fi.write(result_pb_serialized)
-
-    return result_pb_serialized
+    return request
 
 
 def publish_progress():
@@ -221,6 +606,18 @@ def try_revert_progress(run_name: str) -> Optional[int]:
     return progress
     
 
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not an integer")
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a positive number")
+
+    return number
+
+
 def main():
     related_run_name = os.getenv('RUN_NAME')
     if not related_run_name:
@@ -230,6 +627,16 @@ def main():
     parser.add_argument('--input_dir_path', type=str)
     parser.add_argument('--output_dir_path', type=str)
     parser.add_argument('--input_format', type=str)
+    parser.add_argument('--concurrency', type=positive_int, default=DEFAULT_CONCURRENCY,
+                        help='maximum number of prediction requests sent to the model server at the same time')
+    parser.add_argument('--batch_size', type=positive_int, default=DEFAULT_BATCH_SIZE,
+                        help='number of tf-record examples packed into a single prediction request, model has to '
+                             'be exported with a dynamic batch dimension')
+    parser.add_argument('--output_format', type=str, default=OUTPUT_FORMATS.PICKLE.value,
+                        choices=[output_format.value for output_format in OUTPUT_FORMATS],
+                        help='format of results of tf-record input files: pickle - list of all results pickled '
+                             'after whole file is processed, stream - length-prefixed records written as soon as '
+                             'each result arrives')
 
     args = parser.parse_args()
 
@@ -239,6 +646,9 @@ def main():
     input_dir_path = args.input_dir_path
     output_dir_path = args.output_dir_path if args.output_dir_path else '/mnt/output/experiment'
     input_format = args.input_format
+    concurrency = args.concurrency
+    output_format = args.output_format
+    batch_size = args.batch_size
 
     if not os.path.isdir(input_dir_path) or len(os.listdir(input_dir_path)) == 0:
         raise RuntimeError(f"input directory: '{input_dir_path}' does not exist or is empty!")
@@ -251,7 +661,10 @@ def main():
                            input_dir_path=input_dir_path,
                            output_dir_path=output_dir_path,
                            related_run_name=related_run_name,
-                           input_format=input_format)
+                           input_format=input_format,
+                           concurrency=concurrency,
+                           output_format=output_format,
+                           batch_size=batch_size)
     except Exception:
         global stop_thread
         stop_thread = True
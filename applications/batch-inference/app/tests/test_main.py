@@ -17,34 +17,11 @@
 import main
 
 from grpc._channel import _Rendezvous
+import numpy as np
+import pickle
 import pytest
-
-
-def test_make_prediction_retrying(mocker):
-    mocker.patch('builtins.open')
-    mocker.patch('tensorflow_serving.apis.predict_pb2.PredictRequest')
-    predict_stub_mock = mocker.MagicMock()
-    grpc_exception = _Rendezvous(mocker.MagicMock(), None, None, mocker.MagicMock())
-
-    mocker.patch.object(predict_stub_mock, 'Predict').side_effect = [grpc_exception,
-                                                                     grpc_exception,
-                                                                     mocker.MagicMock(
-                                                                         SerializeToString=lambda: b'result')]
-    result = main.make_prediction(b'', predict_stub_mock)
-
-    assert result == b'result'
-
-
-def test_make_prediction_too_much_retrying(mocker):
-    mocker.patch('builtins.open')
-    mocker.patch('tensorflow_serving.apis.predict_pb2.PredictRequest')
-    predict_stub_mock = mocker.MagicMock()
-    grpc_exception = _Rendezvous(mocker.MagicMock(), None, None, mocker.MagicMock())
-
-    mocker.patch.object(predict_stub_mock, 'Predict').side_effect = grpc_exception
-
-    with pytest.raises(_Rendezvous):
-        main.make_prediction(b'', predict_stub_mock)
+import tensorflow as tf
+from tensorflow_serving.apis import predict_pb2
 
 
 def test_input_dir_does_not_exist(mocker):
@@ -64,3 +41,301 @@ def test_input_dir_is_empty(mocker):
 
     with pytest.raises(RuntimeError):
         main.main()
+
+
+def test_prediction_pipeline_keeps_order_and_limits_in_flight_requests(mocker):
+    predict_stub_mock = mocker.MagicMock()
+    futures = [mocker.MagicMock(result=mocker.MagicMock(return_value=mocker.MagicMock(
+        SerializeToString=mocker.MagicMock(return_value=f'result-{i}'.encode())))) for i in range(5)]
+    predict_stub_mock.Predict.future.side_effect = futures
+
+    collected = []
+    pipeline = main.PredictionPipeline(stub=predict_stub_mock, concurrency=2)
+
+    for i in range(5):
+        pipeline.submit(request=mocker.MagicMock(), on_result=collected.append)
+        assert pipeline._in_flight <= 2
+        if i == 2:
+            pipeline.then(lambda: collected.append('checkpoint'))
+
+    pipeline.drain()
+
+    assert collected == [b'result-0', b'result-1', b'result-2', 'checkpoint', b'result-3', b'result-4']
+    assert predict_stub_mock.Predict.future.call_count == 5
+
+
+def test_prediction_pipeline_retries_failed_request(mocker):
+    retry_call_mock = mocker.patch('main.retry_call', return_value=mocker.MagicMock(
+        SerializeToString=lambda: b'retried'))
+    predict_stub_mock = mocker.MagicMock()
+    grpc_exception = _Rendezvous(mocker.MagicMock(), None, None, mocker.MagicMock())
+    predict_stub_mock.Predict.future.return_value.result.side_effect = grpc_exception
+    request = mocker.MagicMock()
+
+    collected = []
+    pipeline = main.PredictionPipeline(stub=predict_stub_mock)
+    pipeline.submit(request=request, on_result=collected.append)
+    pipeline.drain()
+
+    assert collected == [b'retried']
+    assert retry_call_mock.call_args[1]['fargs'] == [request]
+
+
+def test_prediction_pipeline_then_on_empty_queue(mocker):
+    callback = mocker.MagicMock()
+
+    main.PredictionPipeline(stub=mocker.MagicMock()).then(callback)
+
+    callback.assert_called_once()
+
+
+def test_prediction_pipeline_wrong_concurrency(mocker):
+    with pytest.raises(ValueError):
+        main.PredictionPipeline(stub=mocker.MagicMock(), concurrency=0)
+
+
+def test_stream_results_resume_after_interrupted_write(tmpdir):
+    output_path = str(tmpdir.join('data.tfrecord.result'))
+
+    output_file, processed_records = main.open_stream_results(output_path)
+    assert processed_records == 0
+    main.write_stream_result(output_file, 'label-0', b'result-0')
+    main.write_stream_result(output_file, 'label-1', b'result-1')
+    output_file.close()
+
+    # simulate write interrupted in the middle of a record
+    with open(output_path, mode='ab') as fi:
+        fi.write(main.STREAM_RECORD_HEADER.pack(100) + b'partial')
+
+    output_file, processed_records = main.open_stream_results(output_path)
+    assert processed_records == 2
+    main.write_stream_result(output_file, 'label-2', b'result-2')
+    output_file.close()
+
+    assert list(main.read_stream_results(output_path)) == [
+        {main.LABEL_KEY: f'label-{i}', main.RESULT_KEY: f'result-{i}'.encode()} for i in range(3)
+    ]
+
+
+def test_stream_results_resume_from_checkpoint(tmpdir):
+    output_path = str(tmpdir.join('data.tfrecord.result'))
+
+    output_file, _ = main.open_stream_results(output_path)
+    main.write_stream_result(output_file, 'label-0', b'result-0')
+    checkpoint = (1, output_file.tell())
+    main.write_stream_result(output_file, 'label-1', b'result-1')
+    output_file.close()
+
+    output_file, processed_records = main.open_stream_results(output_path, checkpoint)
+    output_file.close()
+
+    assert processed_records == 2
+
+    # checkpoint pointing past the end of the file (e.g. results file replaced) - whole file is scanned
+    output_file, processed_records = main.open_stream_results(output_path, (5, 10 ** 6))
+    output_file.close()
+
+    assert processed_records == 2
+
+
+def _write_tf_record_input(path: str, records_count: int):
+    with tf.python_io.TFRecordWriter(path) as writer:
+        for i in range(records_count):
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'label': tf.train.Feature(bytes_list=tf.train.BytesList(value=[f'label-{i}'.encode()])),
+                'data_pb': tf.train.Feature(bytes_list=tf.train.BytesList(value=[b'']))
+            }))
+            writer.write(example.SerializeToString())
+
+
+def test_do_batch_inference_stream_output_resumes_from_record(mocker, tmpdir):
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    _write_tf_record_input(str(input_dir.join('data.tfrecord')), records_count=3)
+
+    output_file, _ = main.open_stream_results(str(output_dir.join('data.tfrecord.result')))
+    main.write_stream_result(output_file, 'label-0', b'result-0')
+    output_file.close()
+
+    mocker.patch('main.try_revert_progress', return_value=None)
+    mocker.patch('grpc.insecure_channel')
+    stub_mock = mocker.patch('tensorflow_serving.apis.prediction_service_pb2_grpc.PredictionServiceStub').return_value
+    stub_mock.Predict.future.return_value.result.side_effect = [
+        mocker.MagicMock(SerializeToString=lambda: b'result-1'),
+        mocker.MagicMock(SerializeToString=lambda: b'result-2')
+    ]
+    mocker.patch.object(main, 'progress', 0)
+
+    main.do_batch_inference(server_address='', input_dir_path=str(input_dir), output_dir_path=str(output_dir),
+                            related_run_name='run', input_format=main.APPLICABLE_FORMATS.TF_RECORD.value,
+                            concurrency=2, output_format=main.OUTPUT_FORMATS.STREAM.value)
+
+    assert stub_mock.Predict.future.call_count == 2
+    assert main.progress == 1
+    assert list(main.read_stream_results(str(output_dir.join('data.tfrecord.result')))) == [
+        {main.LABEL_KEY: f'label-{i}', main.RESULT_KEY: f'result-{i}'.encode()} for i in range(3)
+    ]
+
+
+def test_do_batch_inference_pickle_output_resumes_from_record(mocker, tmpdir):
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    _write_tf_record_input(str(input_dir.join('data.tfrecord')), records_count=3)
+
+    partial_path = str(output_dir.join(f'data.tfrecord.result{main.PARTIAL_RESULTS_SUFFIX}'))
+    output_file, _ = main.open_stream_results(partial_path)
+    main.write_stream_result(output_file, 'label-0', b'result-0')
+    output_file.close()
+
+    mocker.patch('main.try_revert_progress', return_value=None)
+    mocker.patch('grpc.insecure_channel')
+    stub_mock = mocker.patch('tensorflow_serving.apis.prediction_service_pb2_grpc.PredictionServiceStub').return_value
+    stub_mock.Predict.future.return_value.result.side_effect = [
+        mocker.MagicMock(SerializeToString=lambda: b'result-1'),
+        mocker.MagicMock(SerializeToString=lambda: b'result-2')
+    ]
+    mocker.patch.object(main, 'progress', 0)
+
+    main.do_batch_inference(server_address='', input_dir_path=str(input_dir), output_dir_path=str(output_dir),
+                            related_run_name='run', input_format=main.APPLICABLE_FORMATS.TF_RECORD.value)
+
+    assert stub_mock.Predict.future.call_count == 2
+    assert sorted(path.basename for path in output_dir.listdir()) == [main.MANIFEST_FILENAME, 'data.tfrecord.result']
+    with open(str(output_dir.join('data.tfrecord.result')), mode='rb') as fi:
+        assert pickle.load(fi) == [
+            {main.LABEL_KEY: f'label-{i}', main.RESULT_KEY: f'result-{i}'.encode()} for i in range(3)
+        ]
+    assert main.ProgressManifest.load(str(output_dir.join(main.MANIFEST_FILENAME))).completed_files == \
+        {'data.tfrecord'}
+
+
+def test_do_batch_inference_results_file_removed(mocker, tmpdir):
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    _write_tf_record_input(str(input_dir.join('data.tfrecord')), records_count=3)
+
+    # manifest holds an offset of a results file which doesn't exist anymore
+    manifest = main.ProgressManifest.load(str(output_dir.join(main.MANIFEST_FILENAME)))
+    manifest.records_completed('data.tfrecord', 2, 100)
+    manifest.close()
+
+    mocker.patch.object(main, 'MANIFEST_RECORDS_SAVE_INTERVAL', 0)
+    mocker.patch('main.try_revert_progress', return_value=None)
+    mocker.patch('grpc.insecure_channel')
+    stub_mock = mocker.patch('tensorflow_serving.apis.prediction_service_pb2_grpc.PredictionServiceStub').return_value
+    stub_mock.Predict.future.return_value.result.side_effect = [
+        mocker.MagicMock(SerializeToString=lambda i=i: f'result-{i}'.encode()) for i in range(3)
+    ]
+    records_completed_spy = mocker.spy(main.ProgressManifest, 'records_completed')
+    mocker.patch.object(main, 'progress', 0)
+
+    main.do_batch_inference(server_address='', input_dir_path=str(input_dir), output_dir_path=str(output_dir),
+                            related_run_name='run', input_format=main.APPLICABLE_FORMATS.TF_RECORD.value,
+                            concurrency=1, output_format=main.OUTPUT_FORMATS.STREAM.value)
+
+    assert stub_mock.Predict.future.call_count == 3
+    assert [call[0][2] for call in records_completed_spy.call_args_list] == [0, 1, 2, 3]
+    assert list(main.read_stream_results(str(output_dir.join('data.tfrecord.result')))) == [
+        {main.LABEL_KEY: f'label-{i}', main.RESULT_KEY: f'result-{i}'.encode()} for i in range(3)
+    ]
+
+
+def _make_predict_request(values):
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = 'model'
+    request.inputs['x'].CopyFrom(tf.make_tensor_proto(np.array(values, dtype=np.float32)))
+    return request
+
+
+def test_merge_predict_requests():
+    batched_request, batch_sizes = main.merge_predict_requests([_make_predict_request([[1, 2]]),
+                                                                _make_predict_request([[3, 4], [5, 6]])])
+
+    assert batch_sizes == [1, 2]
+    assert batched_request.model_spec.name == 'model'
+    assert tf.make_ndarray(batched_request.inputs['x']).tolist() == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_dispatch_batched_result(mocker):
+    response = predict_pb2.PredictResponse()
+    response.outputs['y'].CopyFrom(tf.make_tensor_proto(np.array([[1], [2], [3]], dtype=np.float32)))
+    callbacks = [mocker.MagicMock(), mocker.MagicMock()]
+
+    main.dispatch_batched_result(callbacks, [1, 2], response.SerializeToString())
+
+    results = []
+    for callback in callbacks:
+        result = predict_pb2.PredictResponse()
+        result.ParseFromString(callback.call_args[0][0])
+        results.append(tf.make_ndarray(result.outputs['y']).tolist())
+
+    assert results == [[[1]], [[2], [3]]]
+
+
+def test_request_batcher(mocker):
+    pipeline_mock = mocker.MagicMock()
+    batcher = main.RequestBatcher(pipeline=pipeline_mock, batch_size=2)
+
+    for i in range(3):
+        batcher.submit(request=_make_predict_request([[i]]), on_result=mocker.MagicMock())
+    batcher.flush()
+    batcher.flush()
+
+    assert pipeline_mock.submit.call_count == 2
+    assert tf.make_ndarray(pipeline_mock.submit.call_args_list[0][1]['request'].inputs['x']).tolist() == [[0], [1]]
+    assert tf.make_ndarray(pipeline_mock.submit.call_args_list[1][1]['request'].inputs['x']).tolist() == [[2]]
+
+
+def test_progress_manifest_load_after_crash(mocker, tmpdir):
+    mocker.patch.object(main, 'MANIFEST_RECORDS_SAVE_INTERVAL', 0)
+    manifest_path = str(tmpdir.join(main.MANIFEST_FILENAME))
+
+    manifest = main.ProgressManifest.load(manifest_path)
+    manifest.files_completed(['a.tfrecord'])
+    manifest.records_completed('b.tfrecord', 10, 100)
+    manifest.close()
+
+    # simulate entry not fully written before a crash
+    with open(manifest_path, mode='a') as fi:
+        fi.write('{"file": "b.tfr')
+
+    manifest = main.ProgressManifest.load(manifest_path)
+
+    assert manifest.completed_files == {'a.tfrecord'}
+    assert manifest.record_offsets == {'b.tfrecord': (10, 100)}
+    assert not tmpdir.join(f'{main.MANIFEST_FILENAME}.tmp').exists()
+
+    manifest.files_completed(['b.tfrecord'])
+    manifest.close()
+
+    manifest = main.ProgressManifest.load(manifest_path)
+
+    assert manifest.completed_files == {'a.tfrecord', 'b.tfrecord'}
+    assert manifest.record_offsets == {}
+
+
+def test_do_batch_inference_skips_files_completed_in_manifest(mocker, tmpdir):
+    input_dir = tmpdir.mkdir('input')
+    output_dir = tmpdir.mkdir('output')
+    for name in ('a.pb', 'b.pb', 'c.pb'):
+        input_dir.join(name).write_binary(b'')
+
+    manifest = main.ProgressManifest.load(str(output_dir.join(main.MANIFEST_FILENAME)))
+    manifest.files_completed(['b.pb'])
+    manifest.close()
+
+    try_revert_progress_mock = mocker.patch('main.try_revert_progress')
+    mocker.patch('grpc.insecure_channel')
+    stub_mock = mocker.patch('tensorflow_serving.apis.prediction_service_pb2_grpc.PredictionServiceStub').return_value
+    stub_mock.Predict.future.return_value.result.return_value = mocker.MagicMock(SerializeToString=lambda: b'result')
+    mocker.patch.object(main, 'progress', 0)
+
+    main.do_batch_inference(server_address='', input_dir_path=str(input_dir), output_dir_path=str(output_dir),
+                            related_run_name='run', input_format=None)
+
+    assert try_revert_progress_mock.call_count == 0
+    assert stub_mock.Predict.future.call_count == 2
+    assert main.progress == 3
+    assert sorted(path.basename for path in output_dir.listdir()) == [main.MANIFEST_FILENAME, 'a.pb', 'c.pb']
+    assert main.ProgressManifest.load(str(output_dir.join(main.MANIFEST_FILENAME))).completed_files == \
+        {'a.pb', 'b.pb', 'c.pb'}
@@ -104,6 +104,7 @@ class CmdsCommonTexts:
     LOGS_STORING_CANCEL_MESSAGE = "Logs have not been written to the file mentioned above, cancelled by user." 
     MORE_EXP_LOGS_MESSAGE = "There is more than one log to be stored. Each log will be stored in a separate file."
     SAVING_LOGS_TO_FILE_PROGRESS_MSG = "Saving logs to a file..."
+    LOGS_STORING_THROUGHPUT_MESSAGE = "{size:.1f} MB of logs saved in {time:.1f} s ({throughput:.1f} MB/s)."
 
 
 class VerifyCmdTexts:
@@ -377,6 +378,24 @@ class ExperimentTemplateListCmdTexts:
     LACK_OF_PACKS_ERROR_MSG = "Lack of installed packs."
 
 
+class ExperimentMetricsCmdTexts:
+    SHORT_HELP = "Displays history of metrics published by an experiment."
+    HELP = """
+    Displays history of metrics published by an experiment with publish_async() method of
+    experiment_metrics library. Long series are downsampled, so they always cover the whole training.
+
+    EXPERIMENT_NAME - Experiment’s name.
+    """
+    HELP_K = "Name of a metric to be displayed. Can be given many times. By default all metrics are displayed."
+    HELP_O = "Stores history of metrics in a CSV file with a given path instead of displaying it."
+    HELP_U = "Name of a user who owns the experiment."
+    NOT_FOUND_ERROR_MSG = "Experiment \"{experiment_name}\" not found."
+    NO_HISTORY_MSG = "No history of metrics was saved for experiment \"{experiment_name}\"."
+    OUTPUT_SAVED_MSG = "History of metrics was saved in {path} file."
+    OTHER_ERROR_MSG = "Failed to get history of metrics of experiment {name}."
+    TABLE_HEADERS = ["Metric", "Step", "Time", "Value"]
+
+
 class ExperimentLogsCmdTexts:
     SHORT_HELP = "Displays experiment logs."
     HELP = """
@@ -393,6 +412,7 @@ class ExperimentLogsCmdTexts:
     HELP_M = "Searches for logs from experiments matching the value of this option. Cannot be used with the " \
              "experiment_name argument. "
     HELP_O = "Stores file-named experiment logs."
+    HELP_C = "Compresses stored logs with gzip. Used along with the -o option."
     HELP_F = "Specifies if logs should be streamed. Streams only logs from a single experiment."
     HELP_PAGER = "Display logs in interactive pager."
 
@@ -413,6 +433,7 @@ class PredictLogsCmdTexts:
     HELP_M = "If given, command searches for logs from prediction instances matching the value of this option. " \
              "This option cannot be used along with the NAME argument."
     HELP_O = "If given - logs are stored in a file with a name derived from a name of a prediction instance."
+    HELP_C = "Compresses stored logs with gzip. Used along with the -o option."
     HELP_F = "Specify if logs should be streamed. Only logs from a single prediction instance can be streamed."
     HELP_PAGER = "Display logs in interactive pager."
 
@@ -597,7 +618,10 @@ class ExperimentCancelCmdTexts:
     OTHER_POD_CANCELLING_ERROR_MSG = "Error occurred during deletion of the pod."
     UNINITIALIZED_EXPERIMENT_CANCEL_MSG = "Experiment {experiment_name} has no resources submitted for creation."
     PURGING_PROGRESS_MSG = 'Purging experiment {run_name}...'
-    PURGING_LOGS_PROGRESS_MSG = 'Purging experiment {run_name} logs...'
+    PURGING_RUNS_LOGS_PROGRESS_MSG = 'Purging logs of {runs_count} experiment(s)...'
+    PURGING_RUNS_LOGS_PROGRESS_DETAILS_MSG = 'Purging logs of {runs_count} experiment(s)... ({deleted}/{total})'
+    PURGING_LOGS_IN_BACKGROUND_MSG = "Removal of experiments' logs takes longer than expected, it will be " \
+                                     "continued in the background (task: {task_id})."
 
 
 class ExperimentViewCmdTexts:
@@ -15,9 +15,14 @@
 #
 
 
+from contextlib import ExitStack
+import gzip
+import io
 import os
+import re
 from sys import exit
-from typing import List, Generator
+import time
+from typing import List, Generator, IO, Optional
 
 import click
 import dateutil.parser
@@ -25,8 +30,10 @@ import dateutil.parser
 from cli_text_consts import CmdsCommonTexts as Texts, SPINNER_COLOR
 from logs_aggregator.k8s_es_client import K8sElasticSearchClient
 from logs_aggregator.k8s_log_entry import LogEntry
+from logs_aggregator.log_cache import LogCache, LOG_CACHE_DIR_NAME
 from logs_aggregator.log_filters import SeverityLevel
 from platform_resources.run import RunKinds, Run
+from util.config import Config, ConfigInitError
 from util.k8s.k8s_info import PodStatus, get_kubectl_host, get_api_key, get_kubectl_current_context_namespace
 from util.logger import initialize_logger
 from util.spinner import spinner, NctlSpinner
@@ -34,10 +41,15 @@ from util.system import handle_error
 
 logger = initialize_logger(__name__)
 
+# timestamps of logs are stored by fluentd in this format, other formats are parsed with dateutil
+LOG_DATE_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.\d+)?(Z|[+-]\d{2}:\d{2})$')
+LOG_FILE_BUFFER_SIZE = 1024 * 1024
+LOG_FILE_COMPRESS_LEVEL = 6
+
 
 def get_logs(experiment_name: str, min_severity: SeverityLevel, start_date: str,
              end_date: str, pod_ids: str, pod_status: PodStatus, match: str, output: bool,
-             pager: bool, follow: bool, runs_kinds: List[RunKinds], instance_type: str):
+             pager: bool, follow: bool, runs_kinds: List[RunKinds], instance_type: str, compress: bool = False):
     """
     Show logs for a given experiment.
     """
@@ -65,21 +77,45 @@ def get_logs(experiment_name: str, min_severity: SeverityLevel, start_date: str,
             raise ValueError(f'Run with given name: {experiment_name} does not exists in namespace {namespace}.')
         pod_ids = pod_ids.split(',') if pod_ids else None  # type: ignore
         follow_logs = True if follow and not output else False
-        if output and len(runs) > 1:
-            click.echo(Texts.MORE_EXP_LOGS_MESSAGE)
-        for run in runs:
-            start_date = start_date if start_date else run.creation_timestamp
-            run_logs_generator = es_client.get_experiment_logs_generator(run=run, namespace=namespace,
-                                                                         min_severity=min_severity,
-                                                                         start_date=start_date, end_date=end_date,
-                                                                         pod_ids=pod_ids, pod_status=pod_status,
-                                                                         follow=follow_logs)
+        if len(runs) > 1:
+            # logs of all runs are retrieved with a single query and demultiplexed
+            if output:
+                click.echo(Texts.MORE_EXP_LOGS_MESSAGE)
+                runs = [run for run in runs if confirm_logs_storing(instance_name=run.name,
+                                                                    instance_type=instance_type,
+                                                                    compress=compress)]
+                if not runs:
+                    return
+            runs_logs_generator = es_client.get_runs_logs_generator(runs=runs, namespace=namespace,
+                                                                    min_severity=min_severity,
+                                                                    start_date=start_date, end_date=end_date,
+                                                                    pod_ids=pod_ids, pod_status=pod_status,
+                                                                    follow=follow_logs)
+            if output:
+                save_runs_logs_to_files(logs_generator=runs_logs_generator, instance_names=[run.name for run in runs],
+                                        compress=compress)
+            else:
+                print_logs(run_logs_generator=runs_logs_generator, pager=pager, with_run_name=True)
+        else:
+            run = runs[0]
+            run_logs_generator = None
+            if not follow_logs:
+                run_logs_generator = get_cached_run_logs(es_client=es_client, run=run, namespace=namespace,
+                                                         min_severity=min_severity,
+                                                         start_date=start_date or run.creation_timestamp,
+                                                         end_date=end_date, pod_ids=pod_ids, pod_status=pod_status)
+            if run_logs_generator is None:
+                run_logs_generator = es_client.get_experiment_logs_generator(run=run, namespace=namespace,
+                                                                             min_severity=min_severity,
+                                                                             start_date=start_date or
+                                                                             run.creation_timestamp,
+                                                                             end_date=end_date,
+                                                                             pod_ids=pod_ids, pod_status=pod_status,
+                                                                             follow=follow_logs)
             if output:
                 save_logs_to_file(logs_generator=run_logs_generator, instance_name=run.name,
-                                  instance_type=instance_type)
+                                  instance_type=instance_type, compress=compress)
             else:
-                if len(runs) > 1:
-                    click.echo(f'Experiment : {run.name}')
                 print_logs(run_logs_generator=run_logs_generator, pager=pager)
     except ValueError:
         handle_error(logger, Texts.EXPERIMENT_NOT_EXISTS_ERROR_MSG.format(experiment_name=experiment_name,
@@ -93,19 +129,49 @@ def get_logs(experiment_name: str, min_severity: SeverityLevel, start_date: str,
         exit(1)
 
 
+def get_cached_run_logs(es_client: K8sElasticSearchClient, run: Run, namespace: str, min_severity: SeverityLevel,
+                        start_date: str, end_date: str, pod_ids: List[str],
+                        pod_status: PodStatus) -> Optional[Generator[LogEntry, None, None]]:
+    """
+    Returns logs of a run from a local cache, updated with logs indexed since its previous update. Returns None if
+    the cache cannot be used. If logs are filtered by severity or pods, cached logs are used only when all logs
+    of a run are cached, as updating the cache would download also logs which are filtered out.
+    """
+    try:
+        log_cache = LogCache(cache_dir=os.path.join(Config().config_path, LOG_CACHE_DIR_NAME))
+        return log_cache.get_run_logs_generator(es_client=es_client, run=run, namespace=namespace,
+                                                min_severity=min_severity, start_date=start_date,
+                                                end_date=end_date, pod_ids=pod_ids, pod_status=pod_status,
+                                                cached_only=bool(min_severity or pod_ids or pod_status))
+    except (OSError, ConfigInitError):
+        logger.exception('Failed to use local log cache, logs will be retrieved without it.')
+        return None
+
+
 def format_log_date(date: str):
+    match = LOG_DATE_REGEX.match(date)
+    if match:
+        timezone = match.group(2)
+        return match.group(1) + ('+00:00' if timezone == 'Z' else timezone)
+
     log_date = dateutil.parser.parse(date)
     log_date = log_date.replace(microsecond=0)
     formatted_date = log_date.isoformat()
     return formatted_date
 
 
-def print_logs(run_logs_generator: Generator[LogEntry, None, None], pager=False):
+def format_log_entry(log_entry: LogEntry) -> str:
+    return f'{format_log_date(log_entry.date)} {log_entry.pod_name} {log_entry.content}'
+
+
+def print_logs(run_logs_generator: Generator[LogEntry, None, None], pager=False, with_run_name=False):
     def formatted_logs():
         for log_entry in run_logs_generator:
             if not log_entry.content.isspace():
-                formatted_date = format_log_date(log_entry.date)
-                yield f'{formatted_date} {log_entry.pod_name} {log_entry.content}'
+                if with_run_name:
+                    yield f'{log_entry.run_name} {format_log_entry(log_entry)}'
+                else:
+                    yield format_log_entry(log_entry)
 
     if pager:
         # set -K option for less, so ^C will be respected
@@ -116,9 +182,12 @@ def print_logs(run_logs_generator: Generator[LogEntry, None, None], pager=False)
             click.echo(formatted_log, nl=False)
 
 
-def save_logs_to_file(logs_generator: Generator[LogEntry, None, None], instance_name: str,
-                      instance_type: str):
-    filename = instance_name + ".log"
+def get_log_filename(instance_name: str, compress: bool = False) -> str:
+    return instance_name + (".log.gz" if compress else ".log")
+
+
+def confirm_logs_storing(instance_name: str, instance_type: str, compress: bool = False) -> bool:
+    filename = get_log_filename(instance_name=instance_name, compress=compress)
     confirmation_message = Texts.LOGS_STORING_CONF.format(filename=filename,
                                                           instance_name=instance_name,
                                                           instance_type=instance_type)
@@ -128,18 +197,55 @@ def save_logs_to_file(logs_generator: Generator[LogEntry, None, None], instance_
                                                                           instance_type=instance_type)
 
     if click.get_current_context().obj.force or click.confirm(confirmation_message, default=True):
-        try:
-            with open(filename, 'w') as file, spinner(spinner=NctlSpinner,
-                                                      text=Texts.SAVING_LOGS_TO_FILE_PROGRESS_MSG, color=SPINNER_COLOR):
-                for log_entry in logs_generator:
-                    if not log_entry.content.isspace():
-                        formatted_date = format_log_date(log_entry.date)
-                        file.write(f'{formatted_date} {log_entry.pod_name} {log_entry.content}')
+        return True
+
+    click.echo(Texts.LOGS_STORING_CANCEL_MESSAGE)
+    return False
+
+
+def save_logs_to_file(logs_generator: Generator[LogEntry, None, None], instance_name: str,
+                      instance_type: str, compress: bool = False):
+    if confirm_logs_storing(instance_name=instance_name, instance_type=instance_type, compress=compress):
+        save_runs_logs_to_files(logs_generator=logs_generator, instance_names=[instance_name], compress=compress)
+
+
+def open_log_file(stack: ExitStack, filename: str, compress: bool) -> IO[str]:
+    file = stack.enter_context(open(filename, 'wb'))
+    if compress:
+        file = stack.enter_context(gzip.GzipFile(fileobj=file, mode='wb', compresslevel=LOG_FILE_COMPRESS_LEVEL))
+    # compression is done in large chunks instead of line by line
+    return stack.enter_context(io.TextIOWrapper(io.BufferedWriter(file, buffer_size=LOG_FILE_BUFFER_SIZE),
+                                                encoding='utf-8'))
+
+
+def save_runs_logs_to_files(logs_generator: Generator[LogEntry, None, None], instance_names: List[str],
+                            compress: bool = False):
+    """
+    Stores logs in files named after instances. If logs of more than one instance are given, run_name field
+    of each log determines its file.
+    """
+    try:
+        start_time = time.monotonic()
+        filenames = {instance_name: get_log_filename(instance_name=instance_name, compress=compress)
+                     for instance_name in instance_names}
+        with ExitStack() as stack:
+            files = {instance_name: open_log_file(stack=stack, filename=filename, compress=compress)
+                     for instance_name, filename in filenames.items()}
+            stack.enter_context(spinner(spinner=NctlSpinner, text=Texts.SAVING_LOGS_TO_FILE_PROGRESS_MSG,
+                                        color=SPINNER_COLOR))
+            for log_entry in logs_generator:
+                if not log_entry.content.isspace():
+                    file = files[log_entry.run_name] if len(files) > 1 else files[instance_names[0]]
+                    file.write(format_log_entry(log_entry))
+        for _ in instance_names:
             click.echo(Texts.LOGS_STORING_FINAL_MESSAGE)
-        except Exception:
-            handle_error(logger,
-                         Texts.LOGS_STORING_ERROR,
-                         Texts.LOGS_STORING_ERROR)
-            exit(1)
-    else:
-        click.echo(Texts.LOGS_STORING_CANCEL_MESSAGE)
+        saving_time = max(time.monotonic() - start_time, 0.001)
+        # size of the stored files - it is the size after compression, if logs are compressed
+        saved_megabytes = sum(os.path.getsize(filename) for filename in filenames.values()) / 1024 / 1024
+        click.echo(Texts.LOGS_STORING_THROUGHPUT_MESSAGE.format(size=saved_megabytes, time=saving_time,
+                                                                throughput=saved_megabytes / saving_time))
+    except Exception:
+        handle_error(logger,
+                     Texts.LOGS_STORING_ERROR,
+                     Texts.LOGS_STORING_ERROR)
+        exit(1)
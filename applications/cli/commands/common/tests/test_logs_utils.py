@@ -0,0 +1,61 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+
+import pytest
+
+from cli_text_consts import CmdsCommonTexts as Texts
+from commands.common.logs_utils import format_log_date, save_runs_logs_to_files
+from logs_aggregator.k8s_log_entry import LogEntry
+
+TEST_LOG_ENTRIES = [LogEntry(date='2018-04-17T09:28:39.123456789+00:00', content='first log\n',
+                             pod_name='pod-1', namespace='default', run_name='run-1'),
+                    LogEntry(date='2018-04-17T09:28:40Z', content='second log\n',
+                             pod_name='pod-2', namespace='default', run_name='run-2'),
+                    LogEntry(date='2018-04-17T09:28:41+00:00', content=' \n',
+                             pod_name='pod-2', namespace='default', run_name='run-2')]
+
+
+@pytest.mark.parametrize('date,expected_date', [('2018-04-17T09:28:39+00:00', '2018-04-17T09:28:39+00:00'),
+                                                ('2018-04-17T09:28:39.123456789+00:00', '2018-04-17T09:28:39+00:00'),
+                                                ('2018-04-17T09:28:39.5Z', '2018-04-17T09:28:39+00:00'),
+                                                ('2018-04-17T09:28:39-05:30', '2018-04-17T09:28:39-05:30'),
+                                                ('2018-04-17 09:28:39.5', '2018-04-17T09:28:39')])
+def test_format_log_date(date, expected_date):
+    assert format_log_date(date) == expected_date
+
+
+def test_save_runs_logs_to_files(tmpdir):
+    with tmpdir.as_cwd():
+        save_runs_logs_to_files(logs_generator=iter(TEST_LOG_ENTRIES), instance_names=['run-1', 'run-2'])
+
+        assert tmpdir.join('run-1.log').read() == '2018-04-17T09:28:39+00:00 pod-1 first log\n'
+        assert tmpdir.join('run-2.log').read() == '2018-04-17T09:28:40+00:00 pod-2 second log\n'
+
+
+def test_save_runs_logs_to_files_compressed(tmpdir, mocker):
+    mocker.patch.object(Texts, 'LOGS_STORING_THROUGHPUT_MESSAGE', '{size}')
+    echo_mock = mocker.patch('commands.common.logs_utils.click.echo')
+    with tmpdir.as_cwd():
+        save_runs_logs_to_files(logs_generator=iter(TEST_LOG_ENTRIES), instance_names=['run'], compress=True)
+
+        # size of the compressed file is reported
+        echo_mock.assert_called_with(str(tmpdir.join('run.log.gz').size() / 1024 / 1024))
+
+        with gzip.open(str(tmpdir.join('run.log.gz')), 'rt') as file:
+            assert file.read() == '2018-04-17T09:28:39+00:00 pod-1 first log\n' \
+                                  '2018-04-17T09:28:40+00:00 pod-2 second log\n'
@@ -47,6 +47,9 @@ logger = initialize_logger(__name__)
 experiment_name = 'experiment'
 experiment_name_plural = 'experiments'
 
+# maximal time (in seconds) of waiting for removal of logs of purged experiments
+PURGE_LOGS_TIMEOUT = 30
+
 
 @click.command(help=Texts.HELP, short_help=Texts.SHORT_HELP, cls=AliasCmd, alias='c', options_metavar='[options]')
 @click.argument("name", required=False, metavar="[name]")
@@ -305,39 +308,43 @@ def purge_experiment(exp_name: str, runs_to_purge: List[Run],
                 handle_error(logger, Texts.GIT_REPO_MANAGER_ERROR_MSG, Texts.GIT_REPO_MANAGER_ERROR_MSG)
                 raise
 
-        for run in cancelled_runs:
-            logger.debug(f"Purging {run.name} run ...")
-            click.echo(Texts.PURGING_START_MSG.format(run_name=run.name))
-            try:
-                with spinner(text=Texts.PURGING_PROGRESS_MSG.format(run_name=run.name)):
-                    # purge helm release
-                    delete_helm_release(run.name, namespace=namespace, purge=True)
-                    # delete run
-                    kubectl.delete_k8s_object("run", run.name)
-                    purged_runs.append(run)
-            except Exception as exe:
-                not_purged_runs.append(run)
-                logger.exception("Error during purging runs.")
-                # occurence of NotFound error may mean, that run has been removed earlier
-                if "NotFound" not in str(exe):
-                    click.echo(Texts.INCOMPLETE_PURGE_ERROR_MSG.format(experiment_name=experiment_name))
-                    raise exe
+        # logs of runs which have been removed are purged also if purging of a next run fails
+        runs_with_logs_to_purge: List[Run] = []
+        try:
+            for run in cancelled_runs:
+                logger.debug(f"Purging {run.name} run ...")
+                click.echo(Texts.PURGING_START_MSG.format(run_name=run.name))
+                try:
+                    with spinner(text=Texts.PURGING_PROGRESS_MSG.format(run_name=run.name)):
+                        # purge helm release
+                        delete_helm_release(run.name, namespace=namespace, purge=True)
+                        # delete run
+                        kubectl.delete_k8s_object("run", run.name)
+                        purged_runs.append(run)
+                except Exception as exe:
+                    not_purged_runs.append(run)
+                    logger.exception("Error during purging runs.")
+                    # occurence of NotFound error may mean, that run has been removed earlier
+                    if "NotFound" not in str(exe):
+                        click.echo(Texts.INCOMPLETE_PURGE_ERROR_MSG.format(experiment_name=experiment_name))
+                        raise exe
+                runs_with_logs_to_purge.append(run)
+
+                # CAN-1099 - docker garbage collector has errors that prevent from correct removal of images
+                # try:
+                #    try to remove images from docker registry
+                #    delete_images_for_experiment(exp_name=run.name)
+                # except Exception:
+                #    logger.exception("Error during removing images.")
+        finally:
             try:
-                # clear run logs
-                if is_current_user_administrator():
-                    logger.debug(f"Clearing logs for {run.name} run.")
-                    with spinner(text=Texts.PURGING_LOGS_PROGRESS_MSG.format(run_name=run.name)):
-                        k8s_es_client.delete_logs_for_run(run=run.name, namespace=namespace)
+                # clear logs of all runs with a single query
+                if runs_with_logs_to_purge and is_current_user_administrator():
+                    purge_runs_logs(run_names=[run.name for run in runs_with_logs_to_purge],
+                                    k8s_es_client=k8s_es_client, namespace=namespace)
             except Exception:
                 logger.exception("Error during clearing run logs.")
 
-            # CAN-1099 - docker garbage collector has errors that prevent from correct removal of images
-            # try:
-                # try to remove images from docker registry
-            #    delete_images_for_experiment(exp_name=run.name)
-            # except Exception:
-            #    logger.exception("Error during removing images.")
-
         if cancel_whole_experiment and not not_purged_runs:
             try:
                 kubectl.delete_k8s_object("experiment", exp_name)
@@ -353,6 +360,31 @@ def purge_experiment(exp_name: str, runs_to_purge: List[Run],
     return purged_runs, not_purged_runs
 
 
+def purge_runs_logs(run_names: List[str], k8s_es_client: K8sElasticSearchClient, namespace: str):
+    """
+    Starts removal of logs of given runs and waits at most PURGE_LOGS_TIMEOUT seconds for its completion.
+    If logs weren't removed in that time - their removal is continued in the background by ElasticSearch.
+
+    :param run_names: names of runs which logs should be removed
+    :param k8s_es_client: Kubernetes ElasticSearch client
+    :param namespace: namespace where runs are located
+    """
+    logger.debug(f"Clearing logs for {run_names} runs.")
+    with spinner(text=Texts.PURGING_RUNS_LOGS_PROGRESS_MSG.format(runs_count=len(run_names))) as logs_spinner:
+        task_id = k8s_es_client.delete_logs_for_runs(runs=run_names, namespace=namespace)
+
+        def show_progress(status: dict):
+            if status.get('total'):
+                logs_spinner.text = Texts.PURGING_RUNS_LOGS_PROGRESS_DETAILS_MSG.format(
+                    runs_count=len(run_names), deleted=status.get('deleted', 0), total=status['total'])
+
+        completed = k8s_es_client.wait_for_task(task_id=task_id, timeout=PURGE_LOGS_TIMEOUT,
+                                                progress_callback=show_progress)
+    if not completed:
+        logger.debug(f"Logs removal task {task_id} hasn't completed in {PURGE_LOGS_TIMEOUT} seconds.")
+        click.echo(Texts.PURGING_LOGS_IN_BACKGROUND_MSG.format(task_id=task_id))
+
+
 def cancel_experiment(exp_name: str, runs_to_cancel: List[Run], namespace: str) -> Tuple[List[Run], List[Run]]:
     """
     Cancel experiment with a given name by cancelling runs given as a parameter. If given experiment
@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import csv
+from datetime import datetime, timezone
+from http import HTTPStatus
+import json
+from sys import exit
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import click
+from kubernetes.client.rest import ApiException
+from tabulate import tabulate
+
+from cli_text_consts import ExperimentMetricsCmdTexts as Texts
+from platform_resources.run import Run
+from util.aliascmd import AliasCmd
+from util.cli_state import common_options
+from util.config import TBLT_TABLE_FORMAT
+from util.k8s.k8s_info import get_k8s_api, get_kubectl_current_context_namespace
+from util.logger import initialize_logger
+from util.system import handle_error
+
+logger = initialize_logger(__name__)
+
+# history of metrics is stored by experiment_metrics library in this config map, one entry per metric
+HISTORY_CONFIG_MAP_SUFFIX = '-metrics-history'
+HISTORY_SERIES_KEY = 'key'
+
+
+def get_metrics_history(run_name: str, namespace: str) -> Optional[Dict[str, dict]]:
+    """
+    Returns history of metrics saved for a given run - a dictionary with metric names as keys and series,
+    with 'step', 'time' and 'value' columns, as values. Returns None if no history was saved for the run.
+    """
+    try:
+        config_map = get_k8s_api().read_namespaced_config_map(name=f'{run_name}{HISTORY_CONFIG_MAP_SUFFIX}',
+                                                              namespace=namespace)
+    except ApiException as exe:
+        if exe.status == HTTPStatus.NOT_FOUND:
+            return None
+        raise
+
+    history = {}
+    for data in (config_map.data or {}).values():
+        series = json.loads(data)
+        history[series.pop(HISTORY_SERIES_KEY)] = series
+    return history
+
+
+def history_to_rows(history: Dict[str, dict], keys: List[str] = None) -> Iterator[Tuple[str, int, str, str]]:
+    for key in sorted(history):
+        if keys and key not in keys:
+            continue
+
+        series = history[key]
+        for step, wall_time, value in zip(series['step'], series['time'], series['value']):
+            timestamp = datetime.fromtimestamp(wall_time, tz=timezone.utc).astimezone().strftime("%Y-%m-%d %I:%M:%S %p")
+            yield key, step, timestamp, value
+
+
+@click.command(help=Texts.HELP, short_help=Texts.SHORT_HELP, cls=AliasCmd, alias='m', options_metavar='[options]')
+@click.argument('experiment_name')
+@click.option('-k', '--key', multiple=True, help=Texts.HELP_K)
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help=Texts.HELP_O)
+@click.option('-u', '--username', help=Texts.HELP_U)
+@common_options(admin_command=False)
+@click.pass_context
+def metrics(ctx: click.Context, experiment_name: str, key: Tuple[str], output: str, username: str):
+    """
+    Displays history of metrics of an experiment.
+    """
+    try:
+        namespace = username if username else get_kubectl_current_context_namespace()
+
+        if not Run.get(name=experiment_name, namespace=namespace):
+            handle_error(user_msg=Texts.NOT_FOUND_ERROR_MSG.format(experiment_name=experiment_name))
+            exit(2)
+
+        history = get_metrics_history(run_name=experiment_name, namespace=namespace)
+        if not history:
+            click.echo(Texts.NO_HISTORY_MSG.format(experiment_name=experiment_name))
+            exit(0)
+
+        rows = history_to_rows(history, keys=list(key))
+
+        if output:
+            with open(output, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(Texts.TABLE_HEADERS)
+                writer.writerows(rows)
+            click.echo(Texts.OUTPUT_SAVED_MSG.format(path=output))
+        else:
+            click.echo(tabulate(rows, headers=Texts.TABLE_HEADERS, tablefmt=TBLT_TABLE_FORMAT))
+    except Exception:
+        handle_error(logger, Texts.OTHER_ERROR_MSG.format(name=experiment_name),
+                     Texts.OTHER_ERROR_MSG.format(name=experiment_name), add_verbosity_msg=ctx.obj.verbosity == 0)
+        exit(1)
@@ -422,6 +422,57 @@ def test_cancel_experiment_with_purge_delete_failure(prepare_cancel_experiment_m
                                     delete_k8s_object_count=2)
 
 
+def test_cancel_experiment_with_purge_logs_single_query(prepare_cancel_experiment_mocks: CancelExperimentMocks):
+    runs = [copy.deepcopy(RUN_QUEUED), copy.deepcopy(RUN_QUEUED)]
+    runs[1].name = 'exp-1-2'
+    prepare_cancel_experiment_mocks.mocker.patch('commands.experiment.cancel.cancel_experiment_runs').return_value \
+        = runs, []
+    prepare_cancel_experiment_mocks.get_experiment.return_value = TEST_EXPERIMENTS[0]
+    prepare_cancel_experiment_mocks.list_runs.return_value = runs
+    prepare_cancel_experiment_mocks.is_current_user_administrator.return_value = True
+    prepare_cancel_experiment_mocks.mocker.patch.object(TEST_EXPERIMENTS[0], 'update')
+    es_client = prepare_cancel_experiment_mocks.k8s_es_client
+    es_client.wait_for_task.return_value = True
+
+    cancel.purge_experiment(exp_name="experiment-1", runs_to_purge=runs, namespace="namespace",
+                            k8s_es_client=es_client)
+
+    es_client.delete_logs_for_runs.assert_called_once_with(runs=[run.name for run in runs], namespace="namespace")
+    assert es_client.wait_for_task.call_count == 1
+
+
+def test_cancel_experiment_with_purge_logs_after_failure(prepare_cancel_experiment_mocks: CancelExperimentMocks):
+    runs = [copy.deepcopy(RUN_QUEUED), copy.deepcopy(RUN_QUEUED)]
+    runs[1].name = 'exp-1-2'
+    prepare_cancel_experiment_mocks.mocker.patch('commands.experiment.cancel.cancel_experiment_runs').return_value \
+        = runs, []
+    prepare_cancel_experiment_mocks.get_experiment.return_value = TEST_EXPERIMENTS[0]
+    prepare_cancel_experiment_mocks.list_runs.return_value = runs
+    prepare_cancel_experiment_mocks.is_current_user_administrator.return_value = True
+    prepare_cancel_experiment_mocks.mocker.patch.object(TEST_EXPERIMENTS[0], 'update')
+    prepare_cancel_experiment_mocks.delete_helm_release.side_effect = [None, RuntimeError]
+    es_client = prepare_cancel_experiment_mocks.k8s_es_client
+
+    purged_runs, not_purged_runs = cancel.purge_experiment(exp_name="experiment-1", runs_to_purge=runs,
+                                                           namespace="namespace", k8s_es_client=es_client)
+
+    assert purged_runs == [runs[0]]
+    assert not_purged_runs == [runs[1]]
+    es_client.delete_logs_for_runs.assert_called_once_with(runs=[runs[0].name], namespace="namespace")
+
+
+def test_purge_runs_logs_timeout(mocker):
+    es_client = mocker.MagicMock()
+    es_client.delete_logs_for_runs.return_value = 'node:1'
+    es_client.wait_for_task.return_value = False
+    echo_mock = mocker.patch('commands.experiment.cancel.click.echo')
+
+    cancel.purge_runs_logs(run_names=['exp-1'], k8s_es_client=es_client, namespace="namespace")
+
+    assert es_client.wait_for_task.call_args[1]['timeout'] == cancel.PURGE_LOGS_TIMEOUT
+    echo_mock.assert_called_with(cancel.Texts.PURGING_LOGS_IN_BACKGROUND_MSG.format(task_id='node:1'))
+
+
 def test_cancel_experiment_one_cancelled_one_not(prepare_cancel_experiment_mocks: CancelExperimentMocks):
     prepare_cancel_experiment_mocks.delete_helm_release.side_effect = [DEFAULT, RuntimeError(), DEFAULT, DEFAULT]
     prepare_cancel_experiment_mocks.list_runs.return_value = TEST_RUNS_CORRECT
@@ -35,6 +35,11 @@ TEST_LOG_ENTRIES = [LogEntry(date='2018-04-17T09:28:39+00:00',
                              namespace='default')]
 
 
+@pytest.fixture(autouse=True)
+def no_log_cache(mocker):
+    return mocker.patch('commands.common.logs_utils.get_cached_run_logs', return_value=None)
+
+
 def test_show_logs_success(mocker):
     es_client_mock = mocker.patch('commands.common.logs_utils.K8sElasticSearchClient')
     es_client_instance = es_client_mock.return_value
@@ -184,15 +189,18 @@ def test_show_logs_to_file_success(mocker):
 def test_show_logs_match(mocker):
     es_client_mock = mocker.patch("commands.common.logs_utils.K8sElasticSearchClient")
 
+    fake_experiment_1_name = 'fake-experiment-1'
+    fake_experiment_2_name = 'fake-experiment-2'
+
     es_client_instance = es_client_mock.return_value
-    es_client_instance.get_experiment_logs_generator.return_value = TEST_LOG_ENTRIES
+    es_client_instance.get_runs_logs_generator.return_value = [
+        TEST_LOG_ENTRIES[0]._replace(run_name=fake_experiment_1_name),
+        TEST_LOG_ENTRIES[1]._replace(run_name=fake_experiment_2_name)]
 
     get_kubectl_host_mock = mocker.patch('commands.common.logs_utils.get_kubectl_host')
     get_api_key_mock = mocker.patch('commands.common.logs_utils.get_api_key')
 
     get_current_namespace_mock = mocker.patch('commands.common.logs_utils.get_kubectl_current_context_namespace')
-    fake_experiment_1_name = 'fake-experiment-1'
-    fake_experiment_2_name = 'fake-experiment-2'
     list_runs_mock = mocker.patch('commands.common.logs_utils.Run.list')
     list_runs_mock.return_value = [Run(name=fake_experiment_1_name, experiment_name=fake_experiment_1_name),
                                    Run(name=fake_experiment_2_name, experiment_name=fake_experiment_2_name)]
@@ -204,7 +212,79 @@ def test_show_logs_match(mocker):
     assert get_api_key_mock.call_count == 1, 'k8s api key was not retrieved'
     assert get_current_namespace_mock.call_count == 1, 'namespace was not retrieved'
     assert list_runs_mock.call_count == 1, 'run was not retrieved'
-    assert es_client_instance.get_experiment_logs_generator.call_count == 2, 'Experiment logs were not retrieved'
+    assert es_client_instance.get_runs_logs_generator.call_count == 1, 'Experiment logs were not retrieved'
+    assert es_client_instance.get_experiment_logs_generator.call_count == 0
+
+    assert f'{fake_experiment_1_name} 2018-04-17T09:28:39+00:00' in result.output
+    assert f'{fake_experiment_2_name} 2018-04-17T09:28:49+00:00' in result.output
+
+
+def test_show_logs_match_to_files(mocker):
+    es_client_mock = mocker.patch("commands.common.logs_utils.K8sElasticSearchClient")
+
+    fake_experiment_1_name = 'fake-experiment-1'
+    fake_experiment_2_name = 'fake-experiment-2'
+
+    es_client_instance = es_client_mock.return_value
+    es_client_instance.get_runs_logs_generator.return_value = [
+        TEST_LOG_ENTRIES[0]._replace(run_name=fake_experiment_1_name),
+        TEST_LOG_ENTRIES[1]._replace(run_name=fake_experiment_2_name)]
+
+    mocker.patch('commands.common.logs_utils.get_kubectl_host')
+    mocker.patch('commands.common.logs_utils.get_api_key')
+    mocker.patch('commands.common.logs_utils.get_kubectl_current_context_namespace')
+    list_runs_mock = mocker.patch('commands.common.logs_utils.Run.list')
+    list_runs_mock.return_value = [Run(name=fake_experiment_1_name, experiment_name=fake_experiment_1_name),
+                                   Run(name=fake_experiment_2_name, experiment_name=fake_experiment_2_name)]
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        runner.invoke(logs.logs, ['-m', 'fake-experiment', '-o'], input='y\ny\n')
+
+        with open(f'{fake_experiment_1_name}.log') as file:
+            assert file.read() == f'2018-04-17T09:28:39+00:00 {TEST_LOG_ENTRIES[0].pod_name} ' \
+                                  f'{TEST_LOG_ENTRIES[0].content}'
+        with open(f'{fake_experiment_2_name}.log') as file:
+            assert file.read() == f'2018-04-17T09:28:49+00:00 {TEST_LOG_ENTRIES[1].pod_name} ' \
+                                  f'{TEST_LOG_ENTRIES[1].content}'
+
+    assert es_client_instance.get_runs_logs_generator.call_count == 1
+
+
+def test_show_logs_cached(mocker, no_log_cache):
+    es_client_mock = mocker.patch('commands.common.logs_utils.K8sElasticSearchClient')
+    es_client_instance = es_client_mock.return_value
+    no_log_cache.return_value = TEST_LOG_ENTRIES
+
+    mocker.patch('commands.common.logs_utils.get_kubectl_host')
+    mocker.patch('commands.common.logs_utils.get_api_key')
+    mocker.patch('commands.common.logs_utils.get_kubectl_current_context_namespace')
+    fake_experiment_name = 'fake-experiment'
+    list_runs_mock = mocker.patch('commands.common.logs_utils.Run.list')
+    list_runs_mock.return_value = [Run(name=fake_experiment_name, experiment_name=fake_experiment_name)]
+
+    runner = CliRunner()
+    result = runner.invoke(logs.logs, [fake_experiment_name])
+
+    assert no_log_cache.call_count == 1
+    assert es_client_instance.get_experiment_logs_generator.call_count == 0
+    assert TEST_LOG_ENTRIES[1].content in result.output
+
+
+def test_show_logs_follow_not_cached(mocker, no_log_cache):
+    es_client_mock = mocker.patch('commands.common.logs_utils.K8sElasticSearchClient')
+    es_client_instance = es_client_mock.return_value
+    es_client_instance.get_experiment_logs_generator.return_value = TEST_LOG_ENTRIES
+
+    mocker.patch('commands.common.logs_utils.get_kubectl_host')
+    mocker.patch('commands.common.logs_utils.get_api_key')
+    mocker.patch('commands.common.logs_utils.get_kubectl_current_context_namespace')
+    fake_experiment_name = 'fake-experiment'
+    list_runs_mock = mocker.patch('commands.common.logs_utils.Run.list')
+    list_runs_mock.return_value = [Run(name=fake_experiment_name, experiment_name=fake_experiment_name)]
+
+    runner = CliRunner()
+    runner.invoke(logs.logs, [fake_experiment_name, '-fl'])
 
-    assert fake_experiment_1_name in result.output
-    assert fake_experiment_2_name in result.output
+    assert no_log_cache.call_count == 0
+    assert es_client_instance.get_experiment_logs_generator.call_count == 1
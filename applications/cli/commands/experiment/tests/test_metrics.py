@@ -0,0 +1,102 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from click.testing import CliRunner
+from kubernetes.client import V1ConfigMap
+from kubernetes.client.rest import ApiException
+import pytest
+
+from commands.experiment import metrics
+from cli_text_consts import ExperimentMetricsCmdTexts as Texts
+
+
+TEST_HISTORY = {
+    'accuracy': {'stride': 1, 'count': 2, 'step': [1, 2], 'time': [1556000000.0, 1556000001.0],
+                 'value': ['0.5', '0.75']},
+    'loss': {'stride': 1, 'count': 1, 'step': [1], 'time': [1556000000.0], 'value': ['2.5']}
+}
+
+
+class MetricsMocks:
+    def __init__(self, mocker):
+        self.get_run = mocker.patch('commands.experiment.metrics.Run.get')
+        self.get_namespace = mocker.patch('commands.experiment.metrics.get_kubectl_current_context_namespace')
+        self.get_namespace.return_value = 'namespace'
+        self.k8s_api = mocker.patch('commands.experiment.metrics.get_k8s_api').return_value
+        self.k8s_api.read_namespaced_config_map.return_value = \
+            V1ConfigMap(data={key: json.dumps(dict(series, key=key)) for key, series in TEST_HISTORY.items()})
+
+
+@pytest.fixture
+def prepare_mocks(mocker) -> MetricsMocks:
+    return MetricsMocks(mocker=mocker)
+
+
+def test_metrics(prepare_mocks: MetricsMocks):
+    result = CliRunner().invoke(metrics.metrics, ['experiment'], catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert prepare_mocks.k8s_api.read_namespaced_config_map.call_args[1]['name'] == \
+        f'experiment{metrics.HISTORY_CONFIG_MAP_SUFFIX}'
+    assert '0.75' in result.output
+    assert '2.5' in result.output
+
+
+def test_metrics_filter_by_key(prepare_mocks: MetricsMocks):
+    result = CliRunner().invoke(metrics.metrics, ['experiment', '-k', 'loss'], catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert '0.75' not in result.output
+    assert '2.5' in result.output
+
+
+def test_metrics_to_csv(prepare_mocks: MetricsMocks, tmpdir):
+    output = tmpdir.join('metrics.csv')
+
+    result = CliRunner().invoke(metrics.metrics, ['experiment', '-o', str(output)], catch_exceptions=False)
+
+    assert result.exit_code == 0
+    lines = output.read().splitlines()
+    assert len(lines) == 4
+    assert lines[1].startswith('accuracy,1,')
+    assert lines[3].endswith(',2.5')
+
+
+def test_metrics_no_history(prepare_mocks: MetricsMocks):
+    prepare_mocks.k8s_api.read_namespaced_config_map.side_effect = ApiException(status=404)
+
+    result = CliRunner().invoke(metrics.metrics, ['experiment'], catch_exceptions=False)
+
+    assert result.exit_code == 0
+    assert Texts.NO_HISTORY_MSG.format(experiment_name='experiment') in result.output
+
+
+def test_metrics_experiment_not_found(prepare_mocks: MetricsMocks):
+    prepare_mocks.get_run.return_value = None
+
+    result = CliRunner().invoke(metrics.metrics, ['experiment'])
+
+    assert result.exit_code == 2
+
+
+def test_metrics_other_error(prepare_mocks: MetricsMocks):
+    prepare_mocks.k8s_api.read_namespaced_config_map.side_effect = ApiException(status=500)
+
+    result = CliRunner().invoke(metrics.metrics, ['experiment'])
+
+    assert result.exit_code == 1
@@ -40,12 +40,14 @@ LOG_RUNS_KINDS = [RunKinds.INFERENCE]
               help=Texts.HELP_P)
 @click.option('-m', '--match', help=Texts.HELP_M)
 @click.option('-o', '--output', help=Texts.HELP_O, is_flag=True)
+@click.option('-c', '--compress', help=Texts.HELP_C, is_flag=True, default=False)
 @click.option('-pa', '--pager', help=Texts.HELP_PAGER, is_flag=True, default=False)
 @click.option('-fl', '--follow', help=Texts.HELP_F, is_flag=True, default=False)
 @common_options(admin_command=False)
 @click.pass_context
 def logs(ctx: click.Context, name: str, min_severity: str, start_date: str,
-         end_date: str, pod_ids: str, pod_status: str, match: str, output: bool, pager: bool, follow: bool):
+         end_date: str, pod_ids: str, pod_status: str, match: str, output: bool, compress: bool, pager: bool,
+         follow: bool):
     """
     Show logs for a given experiment.
     """
@@ -54,4 +56,4 @@ def logs(ctx: click.Context, name: str, min_severity: str, start_date: str,
     pod_status = PodStatus[pod_status] if pod_status else None
     get_logs(experiment_name=name, min_severity=min_severity, start_date=start_date, end_date=end_date,
              pod_ids=pod_ids, pod_status=pod_status, match=match, output=output, pager=pager, follow=follow,
-             runs_kinds=LOG_RUNS_KINDS, instance_type='prediction instance')
+             runs_kinds=LOG_RUNS_KINDS, compress=compress, instance_type='prediction instance')
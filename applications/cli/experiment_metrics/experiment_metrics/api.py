@@ -18,8 +18,14 @@ try:
     from http import HTTPStatus  # python3.5+ import
 except ImportError:
     import httplib as HTTPStatus  # python2.7 import
+import atexit
+import hashlib
+import json
 import logging
 import os
+import re
+import threading
+import time
 
 from kubernetes import config, client
 from kubernetes.client.rest import ApiException
@@ -31,6 +37,14 @@ RUN_VERSION = 'v1'
 
 MAX_RETRIES_COUNT = 3
 
+DEFAULT_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # seconds
+
+HISTORY_CONFIG_MAP_SUFFIX = '-metrics-history'
+# maximal number of points stored for each metric
+HISTORY_MAX_POINTS = int(os.getenv('METRICS_HISTORY_MAX_POINTS', 500))
+# maximal size of the whole history in bytes - config map cannot be bigger than 1MB
+HISTORY_MAX_SIZE = int(os.getenv('METRICS_HISTORY_MAX_SIZE', 900000))
+
 ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
 logger = logging.getLogger('metrics')
@@ -42,6 +56,12 @@ run_k8s_name = os.getenv('RUN_NAME')
 if run_k8s_name:
     config.load_incluster_config()
     api = client.CustomObjectsApi(client.ApiClient())
+    core_api = client.CoreV1Api(client.ApiClient())
+
+
+def get_namespace():
+    with open('/var/run/secrets/kubernetes.io/serviceaccount/namespace', 'r') as ns_file:
+        return ns_file.read()
 
 
 def publish(metrics, raise_exception=False):
@@ -55,8 +75,7 @@ def publish(metrics, raise_exception=False):
         logger.info('[no-persist mode] Metrics: {}'.format(metrics))
         return
 
-    with open('/var/run/secrets/kubernetes.io/serviceaccount/namespace', 'r') as ns_file:
-        namespace = ns_file.read()
+    namespace = get_namespace()
 
     body = {
         "spec": {
@@ -74,3 +93,277 @@ def publish(metrics, raise_exception=False):
                 logger.exception("Exception during saving metrics. All {} retries failed!".format(MAX_RETRIES_COUNT), e)
                 if raise_exception:
                     raise e
+
+
+class MetricsHistory(object):
+    """
+    Time series of published metrics. For each metric key, points (step, wall time, value) are stored in columns.
+    To keep the size bounded, when a series reaches max_points, every other point is dropped and from then on only
+    every other new point is recorded - so a series always covers the whole training, with resolution decreasing
+    as the training goes on. The same happens to the longest series when serialized history exceeds max_size.
+    Each series is serialized separately, so only series modified since the last save have to be stored again.
+    """
+
+    def __init__(self, max_points=HISTORY_MAX_POINTS, max_size=HISTORY_MAX_SIZE):
+        self.max_points = max_points
+        self.max_size = max_size
+        self.series = {}
+        self.modified_keys = set()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def add(self, metrics, step=None, wall_time=None):
+        """
+        Add points to the history
+        :param metrics Dict[str,str] of a data to apply
+        :param step number of training step, if not given - number of values published for a given key is used
+        :param wall_time unix timestamp of points, current time by default
+        """
+        wall_time = round(time.time(), 3) if wall_time is None else wall_time
+        with self._lock:
+            for key, value in metrics.items():
+                series = self.series.setdefault(key, self._empty_series())
+                if self._append(series, step, wall_time, value):
+                    self.modified_keys.add(key)
+
+    def restore(self, series):
+        """
+        Put previously saved series (e.g. by a restarted training) before points added to this history
+        """
+        with self._lock:
+            for key, restored_series in series.items():
+                current_series = self.series.get(key, self._empty_series())
+                for step, wall_time, value in zip(current_series['step'], current_series['time'],
+                                                  current_series['value']):
+                    self._append(restored_series, step, wall_time, value)
+                self.series[key] = restored_series
+                self.modified_keys.add(key)
+
+    def pop_modified(self):
+        """
+        Serialize series modified since the last call, downsampling the longest series as long as the whole
+        history exceeds max_size
+        :return: Dict[str, str] with metric keys and serialized series
+        """
+        with self._lock:
+            serialized = {key: self._serialize(key) for key in self.modified_keys}
+
+            while sum(self._sizes.values()) > self.max_size:
+                key = max(self.series, key=lambda series_key: len(self.series[series_key]['step']))
+                series = self.series[key]
+                if len(series['step']) < 2:
+                    logger.warning('Metrics history exceeds {} bytes and cannot be downsampled.'
+                                   .format(self.max_size))
+                    break
+                self._downsample(series)
+                serialized[key] = self._serialize(key)
+
+            self.modified_keys = set()
+            return serialized
+
+    def mark_modified(self, keys):
+        """
+        Mark series as modified again, e.g. when saving them failed
+        """
+        with self._lock:
+            self.modified_keys.update(keys)
+
+    @staticmethod
+    def _empty_series():
+        return {'stride': 1, 'count': 0, 'step': [], 'time': [], 'value': []}
+
+    def _append(self, series, step, wall_time, value):
+        index = series['count']
+        series['count'] += 1
+
+        downsampled = len(series['step']) >= self.max_points and index % series['stride'] == 0
+        if downsampled:
+            self._downsample(series)
+
+        if index % series['stride']:
+            return downsampled
+
+        series['step'].append(index if step is None else step)
+        series['time'].append(wall_time)
+        series['value'].append(value)
+        return True
+
+    @staticmethod
+    def _downsample(series):
+        for column in ('step', 'time', 'value'):
+            series[column] = series[column][::2]
+        series['stride'] *= 2
+
+    def _serialize(self, key):
+        data = json.dumps(dict(self.series[key], key=key), separators=(',', ':'))
+        self._sizes[key] = len(data)
+        return data
+
+
+def history_data_key(key):
+    """
+    Name of the config map entry storing a series of a given metric - config map keys may contain only
+    alphanumeric characters, '-', '_' and '.', so other characters are replaced and a hash of the metric
+    name is added to keep keys unique
+    """
+    data_key = re.sub(r'[^-._a-zA-Z0-9]', '_', key)[:200]
+    if data_key != key:
+        data_key = '{}-{}'.format(data_key, hashlib.sha1(key.encode('utf-8')).hexdigest()[:8])
+    return data_key
+
+
+def load_history():
+    """
+    Read history of metrics saved for the current Run
+    :return: Dict[str, dict] with saved series, empty if history was not saved yet
+    """
+    try:
+        config_map = core_api.read_namespaced_config_map(name=run_k8s_name + HISTORY_CONFIG_MAP_SUFFIX,
+                                                         namespace=get_namespace())
+    except ApiException as e:
+        if e.status == HTTPStatus.NOT_FOUND:
+            return {}
+        raise
+
+    history = {}
+    for data in (config_map.data or {}).values():
+        series = json.loads(data)
+        history[series.pop('key')] = series
+    return history
+
+
+def save_history(history):
+    """
+    Store series modified since the last save in a config map owned by the current Run, so it is removed
+    together with the Run. Each series is stored in a separate entry of the config map.
+    :param history MetricsHistory to save
+    """
+    if not run_k8s_name:
+        logger.debug('[no-persist mode] Metrics history not saved')
+        return
+
+    namespace = get_namespace()
+    name = run_k8s_name + HISTORY_CONFIG_MAP_SUFFIX
+    serialized = history.pop_modified()
+    data = {history_data_key(key): series for key, series in serialized.items()}
+
+    try:
+        _store_history(name=name, namespace=namespace, data=data)
+    except Exception:
+        history.mark_modified(serialized.keys())
+        raise
+
+
+def _store_history(name, namespace, data):
+    try:
+        # entries which are not given in a patch remain intact
+        core_api.patch_namespaced_config_map(name=name, namespace=namespace, body={'data': data})
+    except ApiException as e:
+        if e.status != HTTPStatus.NOT_FOUND:
+            raise
+
+        run = api.get_namespaced_custom_object(group=API_GROUP_NAME, namespace=namespace, plural=RUN_PLURAL,
+                                               version=RUN_VERSION, name=run_k8s_name)
+        owner_reference = client.V1OwnerReference(api_version='{}/{}'.format(API_GROUP_NAME, RUN_VERSION),
+                                                  kind=run['kind'], name=run_k8s_name, uid=run['metadata']['uid'])
+        body = client.V1ConfigMap(data=data,
+                                  metadata=client.V1ObjectMeta(name=name, labels={'runName': run_k8s_name},
+                                                               owner_references=[owner_reference]))
+        core_api.create_namespaced_config_map(namespace=namespace, body=body)
+
+
+class AsyncPublisher(object):
+    """
+    Publishes metrics from a background thread. Metrics passed to publish() are merged with metrics
+    waiting for publication (newer values of the same key replace older ones) and sent in a single update
+    every flush_interval seconds, so calling publish() never waits for the kubernetes API. All published values
+    are also recorded in a MetricsHistory, saved in the same intervals.
+    """
+
+    def __init__(self, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.history = MetricsHistory()
+        self._history_restored = not run_k8s_name
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # guarantees that updates are sent one at a time and in order
+        self._publish_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-publisher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def publish(self, metrics, step=None):
+        """
+        Schedule metrics for publication
+        :param metrics Dict[str,str] of a data to apply
+        :param step number of training step stored in the history of metrics
+        """
+        with self._pending_lock:
+            self._pending.update(metrics)
+        self.history.add(metrics, step=step)
+
+    def flush(self):
+        """
+        Publish all pending metrics immediately, in a calling thread
+        """
+        with self._publish_lock:
+            with self._pending_lock:
+                metrics, self._pending = self._pending, {}
+            if metrics:
+                publish(metrics)
+            if self.history.modified_keys and self._history_restored:
+                save_history(self.history)
+
+    def stop(self):
+        """
+        Stop background thread and publish all pending metrics
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        if not self._history_restored:
+            try:
+                # continue history saved before e.g. the training pod was restarted
+                self.history.restore(load_history())
+            except Exception:
+                logger.exception('Unexpected error during loading metrics history, it will be overwritten.')
+            self._history_restored = True
+
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Unexpected error during publishing metrics in background.')
+
+
+_async_publisher = None
+_async_publisher_lock = threading.Lock()
+
+
+def publish_async(metrics, step=None):
+    """
+    Update metrics in specific Run object without blocking the caller. Metrics are merged and
+    published by a background thread every METRICS_FLUSH_INTERVAL seconds (5 by default)
+    and when the program exits. Every published value is also recorded in the history of metrics.
+    :param metrics Dict[str,str] of a data to apply
+    :param step number of training step stored in the history of metrics
+    """
+    global _async_publisher
+    with _async_publisher_lock:
+        if not _async_publisher:
+            _async_publisher = AsyncPublisher()
+            # waits for the history loaded by the background thread, so it's not overwritten
+            atexit.register(_async_publisher.stop)
+
+    _async_publisher.publish(metrics, step=step)
+
+
+def flush():
+    """
+    Publish all metrics passed to publish_async() and not published yet
+    """
+    if _async_publisher:
+        _async_publisher.flush()
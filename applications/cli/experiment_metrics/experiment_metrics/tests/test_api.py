@@ -0,0 +1,110 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from kubernetes.client.rest import ApiException
+import pytest
+
+from experiment_metrics import api
+
+
+def test_history_downsampling():
+    history = api.MetricsHistory(max_points=4)
+
+    for step in range(10):
+        history.add({'loss': str(step)}, wall_time=0)
+
+    series = history.series['loss']
+    assert series['stride'] == 4
+    assert series['count'] == 10
+    assert series['step'] == [0, 4, 8]
+    assert series['value'] == ['0', '4', '8']
+
+
+def test_history_pop_modified():
+    history = api.MetricsHistory()
+    history.add({'loss': '1', 'accuracy': '0.5'}, step=1, wall_time=0)
+
+    assert set(history.pop_modified()) == {'loss', 'accuracy'}
+
+    history.add({'loss': '0.5'}, step=2, wall_time=0)
+    serialized = history.pop_modified()
+
+    assert set(serialized) == {'loss'}
+    assert json.loads(serialized['loss']) == {'key': 'loss', 'stride': 1, 'count': 2, 'step': [1, 2],
+                                              'time': [0, 0], 'value': ['1', '0.5']}
+    assert history.pop_modified() == {}
+
+
+def test_history_total_size_bounded():
+    history = api.MetricsHistory(max_points=1000, max_size=5000)
+
+    for step in range(200):
+        history.add({'metric-{}'.format(i): '0.123456' for i in range(5)}, step=step, wall_time=0)
+        history.pop_modified()
+
+    assert sum(history._sizes.values()) <= 5000
+    assert all(len(series['step']) < 200 for series in history.series.values())
+    # recording continues with the decreased resolution
+    assert all(series['stride'] > 1 for series in history.series.values())
+
+
+def test_history_restore():
+    history = api.MetricsHistory()
+    history.add({'loss': '0.5'}, step=3, wall_time=0)
+
+    history.restore({'loss': {'stride': 1, 'count': 2, 'step': [1, 2], 'time': [0, 0], 'value': ['2', '1']}})
+
+    assert history.series['loss']['step'] == [1, 2, 3]
+    assert history.modified_keys == {'loss'}
+
+
+def test_history_data_key():
+    assert api.history_data_key('loss') == 'loss'
+    assert api.history_data_key('val/loss').startswith('val_loss-')
+    assert api.history_data_key('val/loss') != api.history_data_key('val_loss')
+
+
+def test_save_history_failure_keeps_series_modified(mocker):
+    mocker.patch.object(api, 'run_k8s_name', 'run')
+    mocker.patch.object(api, 'get_namespace', return_value='namespace')
+    core_api = mocker.patch.object(api, 'core_api', create=True)
+    core_api.patch_namespaced_config_map.side_effect = ApiException(status=500)
+    history = api.MetricsHistory()
+    history.add({'val/loss': '1'}, step=1, wall_time=0)
+
+    with pytest.raises(ApiException):
+        api.save_history(history)
+
+    assert list(core_api.patch_namespaced_config_map.call_args[1]['body']['data']) == \
+        [api.history_data_key('val/loss')]
+    assert history.modified_keys == {'val/loss'}
+
+
+def test_async_publisher_merges_pending_metrics(mocker):
+    publish_mock = mocker.patch.object(api, 'publish')
+    save_history_mock = mocker.patch.object(api, 'save_history')
+    publisher = api.AsyncPublisher(flush_interval=60)
+
+    publisher.publish({'loss': '2', 'accuracy': '0.5'}, step=1)
+    publisher.publish({'loss': '1'}, step=2)
+    publisher.stop()
+
+    publish_mock.assert_called_once_with({'loss': '1', 'accuracy': '0.5'})
+    save_history_mock.assert_called_once_with(publisher.history)
+    assert publisher.history.series['loss']['value'] == ['2', '1']
+    assert not publisher._thread.is_alive()
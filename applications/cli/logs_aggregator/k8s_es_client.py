@@ -14,16 +14,17 @@
 # limitations under the License.
 #
 
-from functools import partial
+import heapq
+from queue import Queue, Full
+from threading import Thread, Event
 import time
-from typing import List, Callable, Generator, Dict
+from typing import List, Callable, Generator, Dict, Iterator
 
 import elasticsearch
 import elasticsearch.helpers
 import elasticsearch.client
 
-from logs_aggregator.log_filters import SeverityLevel, filter_log_by_severity, \
-    filter_log_by_pod_status, filter_log_by_pod_ids
+from logs_aggregator.log_filters import SeverityLevel, severity_query, pod_names_query, get_run_pod_names_by_status
 from logs_aggregator.k8s_log_entry import LogEntry
 from platform_resources.workflow import ArgoWorkflow
 from util.logger import initialize_logger
@@ -37,6 +38,23 @@ class K8sElasticSearchClient(elasticsearch.Elasticsearch):
 
     ES_PROXY_SECRET_NAME = "es-proxy-secret"
 
+    FOLLOW_PAGE_SIZE = 1000
+    # logs are not always indexed in order of their timestamps, e.g. when they are sent by different nodes
+    FOLLOW_OVERLAP_MS = 5000
+    FOLLOW_MAX_INTERVAL = 4  # seconds
+    # maximal number of slices of a scroll downloaded in parallel, when logs of many runs are retrieved
+    MAX_SCROLL_SLICES = 4
+    SLICE_QUEUE_SIZE = 2000
+    SLICE_PUT_TIMEOUT = 1  # seconds
+    # only fields of logs needed to create LogEntry are retrieved
+    LOG_SOURCE_FIELDS = ['@timestamp', 'log', 'kubernetes.pod_name', 'kubernetes.namespace_name',
+                         'kubernetes.labels.runName']
+    # logs are paged on (timestamp, pod name, log id) sort key - log id is generated by fluentd and, unlike _id,
+    # it has doc values, so sorting on it does not load fielddata onto the ElasticSearch heap
+    SORTED_LOGS_SORT = [{"@timestamp": {"order": "asc"}},
+                        {"kubernetes.pod_name.keyword": {"order": "asc", "unmapped_type": "keyword"}},
+                        {"log_id.keyword": {"order": "asc", "unmapped_type": "keyword"}}]
+
     def __init__(self, host: str, use_ssl=True, verify_certs=True,
                  with_admin_privledges=False, headers: Dict[str, str] = None,
                  **kwargs):
@@ -49,8 +67,67 @@ class K8sElasticSearchClient(elasticsearch.Elasticsearch):
             headers["ES-Authorization"] = f"Basic ${admin_token}"
         super().__init__(hosts=hosts, use_ssl=use_ssl, verify_certs=verify_certs, headers=headers, **kwargs)
 
+    @staticmethod
+    def create_log_entry(log: dict) -> LogEntry:
+        return LogEntry(date=log['_source']['@timestamp'],
+                        content=log['_source']['log'],
+                        pod_name=log['_source']['kubernetes']['pod_name'],
+                        namespace=log['_source']['kubernetes']['namespace_name'],
+                        run_name=log['_source']['kubernetes'].get('labels', {}).get('runName'))
+
+    def _scan_slice(self, query_body: dict, index: str, scroll: str, slice_id: int, slices: int, output: Queue,
+                    stop: Event):
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=self.SLICE_PUT_TIMEOUT)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        try:
+            for log in elasticsearch.helpers.scan(self, query=dict(query_body, slice={"id": slice_id, "max": slices}),
+                                                  index=index, scroll=scroll, size=1000, preserve_order=True,
+                                                  clear_scroll=False):
+                if not put(log):
+                    # consumer has stopped - the scroll is not continued, so it expires after its lifetime
+                    return
+        except Exception as ex:
+            put(ex)
+            return
+        put(None)
+
+    def _scan_sliced(self, query_body: dict, index: str, scroll: str, slices: int) -> Iterator[dict]:
+        """
+        Downloads slices of a scroll in parallel and merges them, keeping order of logs defined by sort of the query.
+        Downloading of slices stops when the returned generator is closed.
+        """
+        def read_slice(queue: Queue) -> Iterator[dict]:
+            while True:
+                log = queue.get()
+                if log is None:
+                    return
+                elif isinstance(log, Exception):
+                    raise log
+                yield log
+
+        stop = Event()
+        queues = []
+        for slice_id in range(slices):
+            queue: Queue = Queue(maxsize=self.SLICE_QUEUE_SIZE)
+            Thread(target=self._scan_slice, args=(query_body, index, scroll, slice_id, slices, queue, stop),
+                   daemon=True).start()
+            queues.append(queue)
+
+        try:
+            yield from heapq.merge(*(read_slice(queue) for queue in queues), key=lambda log: log['sort'])
+        finally:
+            stop.set()
+
     def get_log_generator(self, query_body: dict = None, index='_all', scroll='1m',
-                          filters: List[Callable[[LogEntry], bool]] = None) -> Generator[LogEntry, None, None]:
+                          filters: List[Callable[[LogEntry], bool]] = None,
+                          slices: int = 1) -> Generator[LogEntry, None, None]:
         """
         A generator that yields LogEntry objects constructed from Kubernetes resource logs.
         Logs to be returned are defined by passed query and filtered according to passed
@@ -59,42 +136,84 @@ class K8sElasticSearchClient(elasticsearch.Elasticsearch):
         :param index: ElasticSearch index from which logs will be retrieved, defaults to all indices
         :param scroll: ElasticSearch scroll lifetime
         :param filters: List of filter functions with signatures f(LogEntry) -> Bool
+        :param slices: number of slices of a scroll downloaded in parallel
         :return: Generator yielding LogEntry (date, log_content, pod_name, namespace) named tuples.
         """
-        for log in elasticsearch.helpers.scan(self, query=query_body, index=index, scroll=scroll, size=1000,
-                                              preserve_order=True, clear_scroll=False):
-            log_entry = LogEntry(date=log['_source']['@timestamp'],
-                                 content=log['_source']['log'],
-                                 pod_name=log['_source']['kubernetes']['pod_name'],
-                                 namespace=log['_source']['kubernetes']['namespace_name'])
+        query_body = dict(query_body or {}, _source=self.LOG_SOURCE_FIELDS)
+        if slices > 1:
+            logs = self._scan_sliced(query_body=query_body, index=index, scroll=scroll, slices=slices)
+        else:
+            logs = elasticsearch.helpers.scan(self, query=query_body, index=index, scroll=scroll, size=1000,
+                                              preserve_order=True, clear_scroll=False)
+        for log in logs:
+            log_entry = self.create_log_entry(log)
             if not filters or all(f(log_entry) for f in filters):
                 yield log_entry
 
-    def get_stream_log_generator(self, query_body: dict = None, index='_all', scroll='1m', time_interval=0.5,
+    def get_sorted_raw_logs(self, query: dict, index='_all') -> Iterator[dict]:
+        """
+        Yields logs matching the query as returned by ElasticSearch, ordered by (timestamp, pod name, log id) sort
+        key, which is given in the sort field of each log. Logs are paged with search_after, so no scroll contexts are
+        left on the cluster.
+        :param query: ES query
+        :param index: ElasticSearch index from which logs will be retrieved, defaults to all indices
+        """
+        body = {"query": query,
+                "sort": self.SORTED_LOGS_SORT,
+                "size": self.FOLLOW_PAGE_SIZE,
+                "_source": self.LOG_SOURCE_FIELDS}
+        while True:
+            hits = self.search(index=index, body=body)['hits']['hits']
+            yield from hits
+            if len(hits) < self.FOLLOW_PAGE_SIZE:
+                return
+            body = dict(body, search_after=hits[-1]['sort'])
+
+    def get_stream_log_generator(self, query_body: dict = None, index='_all', time_interval=0.5,
                                  filters: List[Callable[[LogEntry], bool]] = None) -> Generator[LogEntry, None, None]:
         """
         A generator that yields LogEntry objects constructed from Kubernetes resource logs.
         Logs to be returned are defined by passed query and filtered according to passed
         filter functions, which have to accept LogEntry as argument and return a boolean value.
         Generator will always try to obtain new log entries, whenever it will be iterated over.
+        Logs are paged with search_after on (timestamp, pod name, log id) sort key, so no scroll contexts are left on
+        the cluster. Each poll starts FOLLOW_OVERLAP_MS before the newest log seen so far, to get logs indexed
+        late, and already yielded logs are skipped by their document ids.
         :param query_body: ES search query
         :param index: ElasticSearch index from which logs will be retrieved, defaults to all indices
-        :param scroll: ElasticSearch scroll lifetime
-        :param time_interval: Time interval between attempting to get a new batch of logs
+        :param time_interval: Minimal time interval between attempting to get a new batch of logs, it grows up to
+         FOLLOW_MAX_INTERVAL while no new logs appear
         :param filters: List of filter functions with signatures f(LogEntry) -> Bool
         :return: Generator yielding LogEntry (date, log_content, pod_name, namespace) named tuples.
         """
-        last_timestamp = None
+        query = (query_body or {}).get('query', {"match_all": {}})
+        seen_ids: Dict[str, int] = {}  # document id: timestamp in epoch millis
+        newest_timestamp = None
+        interval = time_interval
         while True:
-            for log in self.get_log_generator(query_body=query_body, index=index, scroll=scroll, filters=filters):
-                last_timestamp = log.date
-                yield log
-            else:
-                # Scan is exhausted - try to fetch a new batch of logs
-                # Note that we expect specific query structure here
-                if last_timestamp:
-                    query_body['query']['bool']['filter']['range']['@timestamp']['gt'] = last_timestamp
-                time.sleep(time_interval)
+            search_query = query
+            if newest_timestamp is not None:
+                lower_bound = newest_timestamp - self.FOLLOW_OVERLAP_MS
+                search_query = {"bool": {"must": [query], "filter": {"range": {"@timestamp": {
+                    "gte": lower_bound, "format": "epoch_millis"}}}}}
+                seen_ids = {doc_id: timestamp for doc_id, timestamp in seen_ids.items() if timestamp >= lower_bound}
+
+            new_logs_found = False
+            for log in self.get_sorted_raw_logs(query=search_query, index=index):
+                timestamp = log['sort'][0]
+                newest_timestamp = timestamp if newest_timestamp is None else max(newest_timestamp, timestamp)
+                if log['_id'] in seen_ids:
+                    continue
+                seen_ids[log['_id']] = timestamp
+                new_logs_found = True
+                log_entry = self.create_log_entry(log)
+                if not filters or all(f(log_entry) for f in filters):
+                    yield log_entry
+
+            if new_logs_found:
+                interval = time_interval
+            time.sleep(interval)
+            interval = min(interval * 2, max(time_interval, self.FOLLOW_MAX_INTERVAL))
 
     def get_experiment_logs_generator(self, run: Run, namespace: str, start_date: str, end_date: str = None,
                                       index='_all', pod_ids: List[str] = None, pod_status: PodStatus = None,
@@ -118,28 +237,91 @@ class K8sElasticSearchClient(elasticsearch.Elasticsearch):
         if end_date:
             timestamp_range_filter = {"range": {"@timestamp": {"gte": start_date, "lte": end_date}}}
 
-        filters: List[Callable] = []
-        if min_severity:
-            filters.append(partial(filter_log_by_severity, min_severity=min_severity))
-        if pod_status:
-            filters.append(partial(filter_log_by_pod_status, pod_status=pod_status))
-        if pod_ids:
-            filters.append(partial(filter_log_by_pod_ids, pod_ids=set(pod_ids)))
+        must_queries = [{'term': {'kubernetes.labels.runName.keyword': run.name}},
+                        {'term': {'kubernetes.namespace_name.keyword': namespace}}]
+        must_queries.extend(self._get_log_filter_queries(run_names=[run.name], namespace=namespace,
+                                                         pod_ids=pod_ids, pod_status=pod_status,
+                                                         min_severity=min_severity))
 
         log_generator = self.get_stream_log_generator if follow else self.get_log_generator
 
         experiment_logs_generator = log_generator(query_body={  #type: ignore
-            "query": {"bool": {"must":
-                                   [{'term': {'kubernetes.labels.runName.keyword': run.name}},
-                                    {'term': {'kubernetes.namespace_name.keyword': namespace}}
-                                    ],
+            "query": {"bool": {"must": must_queries,
                                "filter": timestamp_range_filter
                                }},
             "sort": {"@timestamp": {"order": "asc"}}},
-            index=index, filters=filters)
+            index=index)
 
         return experiment_logs_generator
 
+    @staticmethod
+    def _get_log_filter_queries(run_names: List[str], namespace: str, pod_ids: List[str] = None,
+                                pod_status: PodStatus = None, min_severity: SeverityLevel = None) -> List[dict]:
+        """
+        Returns ES queries for given filtering criteria. Filters are applied by ElasticSearch, so only matching logs
+        are transferred.
+        """
+        queries = []
+        if min_severity:
+            queries.append(severity_query(min_severity))
+        if pod_status:
+            pod_names: List[str] = []
+            for run_name in run_names:
+                pod_names.extend(get_run_pod_names_by_status(run_name=run_name, namespace=namespace,
+                                                             pod_status=pod_status))
+            queries.append(pod_names_query(pod_names))
+        if pod_ids:
+            queries.append(pod_names_query(pod_ids))
+
+        return queries
+
+    def get_runs_logs_generator(self, runs: List[Run], namespace: str, start_date: str = None, end_date: str = None,
+                                index='_all', pod_ids: List[str] = None, pod_status: PodStatus = None,
+                                min_severity: SeverityLevel = None, follow=False) -> Generator[LogEntry, None, None]:
+        """
+        Return logs of many runs, retrieved with a single query and ordered by their timestamps. Run of each log
+        is given by its run_name field.
+        :param runs: instances of Run resource
+        :param namespace: Name of namespace where runs were started
+        :param index: ElasticSearch index from which logs will be retrieved, defaults to all indices
+        :param start_date: if provided, only logs produced after this date will be returned, otherwise logs
+         produced after creation of each run are returned
+        :param end_date: if provided, only logs produced before this date will be returned
+        :param pod_ids: filter logs by pod ids
+        :param pod_status: filter logs by pod status
+        :param min_severity: yield logs with minimum provided severity
+        :param follow: if True, generator will stream logs tail
+        :return: Generator yielding LogEntry (date, log_content, pod_name, namespace, run_name) named tuples.
+        """
+        run_names = [run.name for run in runs]
+        logger.debug(f'Searching for {run_names} Runs logs.')
+
+        run_filters = []
+        for run in runs:
+            timestamp_range = {"gte": start_date or run.creation_timestamp}
+            if end_date:
+                timestamp_range["lte"] = end_date
+            run_filters.append({"bool": {"filter": [{'term': {'kubernetes.labels.runName.keyword': run.name}},
+                                                    {"range": {"@timestamp": timestamp_range}}]}})
+
+        must_queries = [{'terms': {'kubernetes.labels.runName.keyword': run_names}},
+                        {'term': {'kubernetes.namespace_name.keyword': namespace}}]
+        must_queries.extend(self._get_log_filter_queries(run_names=run_names, namespace=namespace,
+                                                         pod_ids=pod_ids, pod_status=pod_status,
+                                                         min_severity=min_severity))
+
+        query_body = {
+            "query": {"bool": {"must": must_queries,
+                               "filter": {"bool": {"should": run_filters, "minimum_should_match": 1}}
+                               }},
+            "sort": {"@timestamp": {"order": "asc"}}}
+
+        if follow:
+            return self.get_stream_log_generator(query_body=query_body, index=index)
+
+        return self.get_log_generator(query_body=query_body, index=index,
+                                      slices=min(len(runs), self.MAX_SCROLL_SLICES))
+
     def get_argo_workflow_logs_generator(self, workflow: ArgoWorkflow, namespace: str,
                                          start_date: str, end_date: str = None,
                                          index='_all', follow=False):
@@ -184,29 +366,56 @@ class K8sElasticSearchClient(elasticsearch.Elasticsearch):
         logger.debug(f'Deleting logs for {namespace} namespace.')
 
         delete_query = {"query": {"term": {'kubernetes.namespace_name.keyword': namespace}}}
-        output = self.delete_by_query(index=index, body=delete_query)
+        output = self.delete_by_query(index=index, body=delete_query, slices='auto', conflicts='proceed')
 
         logger.debug(f"Deleting logs - result: {str(output)}")
 
-    def delete_logs_for_run(self, run: str, namespace: str, index='_all'):
+    def delete_logs_for_runs(self, runs: List[str], namespace: str, index='_all') -> str:
         """
-        Removes logs for a given run.
-        :param run: run for which logs should be deleted
+        Starts removal of logs for given runs with a single query. Logs are removed by a task running in
+        the background on ElasticSearch, its progress can be checked with wait_for_task method.
+        :param runs: runs for which logs should be deleted
         :param namespace: namespace for which logs should be deleted
         :param index: ElasticSearch index from which logs will be retrieved, defaults to all indices
-        Throws exception in case of any errors during removing of logs.
+        :return: id of the ElasticSearch task removing logs
+        Throws exception in case of any errors during starting removal of logs.
         """
-        logger.debug(f'Deleting logs for {run} run and namespace {namespace}.')
+        logger.debug(f'Deleting logs for {runs} runs and namespace {namespace}.')
 
         delete_query = {"query": {"bool": {"must":
             [
-                {"term": {'kubernetes.labels.runName.keyword': run}},
+                {"terms": {'kubernetes.labels.runName.keyword': runs}},
                 {"term": {'kubernetes.namespace_name.keyword': namespace}}
             ]
         }
         }
         }
 
-        output = self.delete_by_query(index=index, body=delete_query)
+        output = self.delete_by_query(index=index, body=delete_query, wait_for_completion=False, slices='auto',
+                                      conflicts='proceed')
 
-        logger.debug(f"Deleting logs - result: {str(output)}")
+        logger.debug(f"Deleting logs - task: {str(output)}")
+        return output['task']
+
+    def wait_for_task(self, task_id: str, timeout: float = None, poll_interval: float = 1.0,
+                      progress_callback: Callable[[dict], None] = None) -> bool:
+        """
+        Waits until a given ElasticSearch task completes.
+        :param task_id: id of the task
+        :param timeout: maximal time of waiting in seconds, if not provided - waits until the task completes
+        :param poll_interval: time interval between checks of the task status
+        :param progress_callback: function called with status of the task (e.g. total and deleted documents
+         counts) after each check
+        :return: True if the task completed, False if timeout was reached
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            task = self.tasks.get(task_id=task_id)
+            if progress_callback:
+                progress_callback(task['task'].get('status', {}))
+            if task.get('completed'):
+                logger.debug(f"Task {task_id} completed - result: {str(task.get('response'))}")
+                return True
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                return False
+            time.sleep(poll_interval)
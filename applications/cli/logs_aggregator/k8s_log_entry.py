@@ -15,6 +15,12 @@
 #
 
 
-from collections import namedtuple
+from typing import NamedTuple, Optional
 
-LogEntry = namedtuple('LogEntry', ['date', 'content', 'pod_name', 'namespace'])
+
+class LogEntry(NamedTuple):
+    date: str
+    content: str
+    pod_name: str
+    namespace: str
+    run_name: Optional[str] = None
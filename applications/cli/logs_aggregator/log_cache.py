@@ -0,0 +1,324 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from datetime import datetime, timezone
+import gzip
+import heapq
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Tuple
+
+import dateutil.parser
+
+from logs_aggregator.k8s_es_client import K8sElasticSearchClient
+from logs_aggregator.k8s_log_entry import LogEntry
+from logs_aggregator.log_filters import SeverityLevel, filter_log_by_severity, filter_log_by_pod_ids, \
+    get_run_pod_names_by_status
+from platform_resources.run import Run, RunStatus
+from util.k8s.k8s_info import PodStatus
+from util.logger import initialize_logger
+
+logger = initialize_logger(__name__)
+
+LOG_CACHE_DIR_NAME = 'log-cache'
+
+CachedLog = Tuple[int, str, LogEntry]  # (timestamp in epoch millis, document id, log entry)
+
+
+def to_epoch_millis(date: str) -> int:
+    parsed_date = dateutil.parser.parse(date)
+    if not parsed_date.tzinfo:
+        parsed_date = parsed_date.replace(tzinfo=timezone.utc)
+    return int(parsed_date.timestamp() * 1000)
+
+
+class LogCache:
+    """
+    Local cache of runs logs, stored in the nctl config directory. Logs of each run are stored in gzip compressed
+    segments, each holding logs retrieved by a single update. Only logs indexed since the previous update are
+    retrieved from ElasticSearch, and logs of finished runs are not retrieved again at all. Runs used least
+    recently are evicted when the cache exceeds its maximal size.
+    Logs of a run are updated by one nctl process at a time - other processes do not use the cache of this run
+    until the update is done.
+    """
+    MAX_SIZE = 512 * 1024 * 1024  # bytes
+    STATE_FILE_NAME = 'state.json'
+    LOCK_FILE_NAME = 'update.lock'
+    # lock of a process that did not finish an update in this time is assumed to be left by a killed process
+    STALE_LOCK_AGE = 600  # seconds
+    FINISHED_RUN_STATES = {RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED}
+    # logs of a finished run are still retrieved for some time, as they may be indexed with a delay
+    FINISHED_RUN_GRACE_PERIOD = 120  # seconds
+
+    def __init__(self, cache_dir: str, max_size: int = MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _get_run_dir(self, run_name: str, namespace: str) -> str:
+        return os.path.join(self.cache_dir, namespace, run_name)
+
+    @staticmethod
+    def _load_state(run_dir: str, run: Run) -> dict:
+        try:
+            with open(os.path.join(run_dir, LogCache.STATE_FILE_NAME)) as file:
+                state = json.load(file)
+            # run with the same name may have been created again
+            if state['creation_timestamp'] == run.creation_timestamp:
+                return state
+        except (OSError, ValueError, KeyError):
+            pass
+
+        return {'creation_timestamp': run.creation_timestamp, 'segments': [], 'newest_timestamp': None,
+                'recent_ids': {}, 'finished': False}
+
+    @staticmethod
+    def _save_state(run_dir: str, state: dict):
+        tmp_path = os.path.join(run_dir, f'{LogCache.STATE_FILE_NAME}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, os.path.join(run_dir, LogCache.STATE_FILE_NAME))
+
+    @staticmethod
+    def _is_run_finished(run: Run) -> bool:
+        if run.state not in LogCache.FINISHED_RUN_STATES or not run.end_timestamp:
+            return False
+        finished_for = datetime.now(timezone.utc).timestamp() - to_epoch_millis(run.end_timestamp) / 1000
+        return finished_for >= LogCache.FINISHED_RUN_GRACE_PERIOD
+
+    def _lock(self, run_dir: str) -> bool:
+        lock_path = os.path.join(run_dir, self.LOCK_FILE_NAME)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < self.STALE_LOCK_AGE:
+                        return False
+                    os.remove(lock_path)
+                except OSError:
+                    return False
+        return False
+
+    def _unlock(self, run_dir: str):
+        os.remove(os.path.join(run_dir, self.LOCK_FILE_NAME))
+
+    def _remove_unused_files(self, run_dir: str, state: dict):
+        """
+        Removes segments which are not listed in the state, e.g. segments of a previous run with the same name or
+        segments left by a killed process.
+        """
+        used_files = set(state['segments']) | {self.STATE_FILE_NAME, self.LOCK_FILE_NAME}
+        for file_name in os.listdir(run_dir):
+            if file_name not in used_files:
+                try:
+                    os.remove(os.path.join(run_dir, file_name))
+                except OSError:
+                    # segment may be still read by another process, it is removed by a later update
+                    pass
+
+    @staticmethod
+    def _get_run_query(run: Run, namespace: str, newest_timestamp: int = None) -> dict:
+        timestamp_filters = [{"range": {"@timestamp": {"gte": run.creation_timestamp}}}]
+        if newest_timestamp is not None:
+            # logs may be indexed with a delay, so logs from a short period before the newest one are checked again
+            timestamp_filters.append({"range": {"@timestamp": {
+                "gte": newest_timestamp - K8sElasticSearchClient.FOLLOW_OVERLAP_MS,
+                "format": "epoch_millis"}}})
+        return {"bool": {"must": [{'term': {'kubernetes.labels.runName.keyword': run.name}},
+                                  {'term': {'kubernetes.namespace_name.keyword': namespace}}],
+                         "filter": timestamp_filters}}
+
+    @staticmethod
+    def _write_segment(es_client: K8sElasticSearchClient, query: dict, index: str, run_dir: str, state: dict,
+                       recent_ids: Dict[str, int]) -> Optional[str]:
+        """
+        Stores logs matching the query, which are not in recent_ids, in a new segment. Returns name of the segment
+        or None, if there were no new logs.
+        """
+        segment_name = f'segment-{len(state["segments"]):06d}-{os.getpid()}.jsonl.gz'
+        segment_path = os.path.join(run_dir, segment_name)
+        new_logs_count = 0
+        try:
+            with gzip.open(segment_path, 'wt', encoding='utf-8') as segment:
+                for log in es_client.get_sorted_raw_logs(query=query, index=index):
+                    timestamp, doc_id = log['sort'][0], log['_id']
+                    if doc_id in recent_ids:
+                        continue
+                    log_entry = es_client.create_log_entry(log)
+                    segment.write(json.dumps([timestamp, doc_id, log_entry.date, log_entry.content,
+                                              log_entry.pod_name, log_entry.namespace]) + '\n')
+                    recent_ids[doc_id] = timestamp
+                    new_logs_count += 1
+        except Exception:
+            os.remove(segment_path)
+            raise
+
+        if not new_logs_count:
+            os.remove(segment_path)
+            return None
+        return segment_name
+
+    @staticmethod
+    def _set_recent_ids(state: dict, recent_ids: Dict[str, int]):
+        state['newest_timestamp'] = max(recent_ids.values()) if recent_ids else None
+        if recent_ids:
+            lower_bound = state['newest_timestamp'] - K8sElasticSearchClient.FOLLOW_OVERLAP_MS
+            recent_ids = {doc_id: timestamp for doc_id, timestamp in recent_ids.items() if timestamp >= lower_bound}
+        state['recent_ids'] = recent_ids
+
+    def _update(self, es_client: K8sElasticSearchClient, run: Run, namespace: str, run_dir: str, state: dict,
+                index: str):
+        run_finished = self._is_run_finished(run)
+        recent_ids: Dict[str, int] = dict(state['recent_ids'])  # document id: timestamp in epoch millis
+        segment_name = self._write_segment(es_client=es_client, index=index, run_dir=run_dir, state=state,
+                                           query=self._get_run_query(run=run, namespace=namespace,
+                                                                     newest_timestamp=state['newest_timestamp']),
+                                           recent_ids=recent_ids)
+        if segment_name:
+            state['segments'].append(segment_name)
+            self._set_recent_ids(state=state, recent_ids=recent_ids)
+
+        # logs indexed later than FOLLOW_OVERLAP_MS after newer logs are not retrieved by updates, so before logs of
+        # a run are considered complete, number of cached logs is compared with number of logs in ElasticSearch
+        run_query = self._get_run_query(run=run, namespace=namespace)
+        if run_finished and self._count_cached_logs(run_dir=run_dir, state=state) != \
+                es_client.count(index=index, body={"query": run_query})['count']:
+            logger.debug(f'Cached logs of {run.name} Run are incomplete, all of them are retrieved again.')
+            recent_ids = {}
+            segment_name = self._write_segment(es_client=es_client, query=run_query, index=index, run_dir=run_dir,
+                                               state=state, recent_ids=recent_ids)
+            state['segments'] = [segment_name] if segment_name else []
+            self._set_recent_ids(state=state, recent_ids=recent_ids)
+        state['finished'] = run_finished
+
+        self._save_state(run_dir=run_dir, state=state)
+        self._remove_unused_files(run_dir=run_dir, state=state)
+
+    def _read_segment(self, run_dir: str, segment_name: str, run_name: str) -> Iterator[CachedLog]:
+        with gzip.open(os.path.join(run_dir, segment_name), 'rt', encoding='utf-8') as segment:
+            for line in segment:
+                timestamp, doc_id, date, content, pod_name, namespace = json.loads(line)
+                yield timestamp, doc_id, LogEntry(date=date, content=content, pod_name=pod_name, namespace=namespace,
+                                                  run_name=run_name)
+
+    def _count_cached_logs(self, run_dir: str, state: dict) -> int:
+        count = 0
+        for segment_name in state['segments']:
+            with gzip.open(os.path.join(run_dir, segment_name), 'rt', encoding='utf-8') as segment:
+                count += sum(1 for _ in segment)
+        return count
+
+    def _get_size(self, path: str) -> int:
+        size = 0
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in file_names:
+                try:
+                    size += os.path.getsize(os.path.join(dir_path, file_name))
+                except OSError:
+                    pass
+        return size
+
+    def evict(self, keep_run_dir: str = None):
+        """
+        Removes least recently used runs logs, until size of the cache does not exceed its maximal size.
+        """
+        run_dirs: List[Tuple[float, int, str]] = []  # (last use time, size, path)
+        for namespace in os.listdir(self.cache_dir):
+            namespace_dir = os.path.join(self.cache_dir, namespace)
+            if not os.path.isdir(namespace_dir):
+                continue
+            for run_name in os.listdir(namespace_dir):
+                run_dir = os.path.join(namespace_dir, run_name)
+                try:
+                    last_used = os.path.getmtime(os.path.join(run_dir, self.STATE_FILE_NAME))
+                except OSError:
+                    last_used = 0
+                run_dirs.append((last_used, self._get_size(run_dir), run_dir))
+
+        total_size = sum(size for _, size, _ in run_dirs)
+        for _, size, run_dir in sorted(run_dirs):
+            if total_size <= self.max_size:
+                break
+            if run_dir == keep_run_dir or os.path.exists(os.path.join(run_dir, self.LOCK_FILE_NAME)):
+                continue
+            logger.debug(f'Evicting {run_dir} from log cache.')
+            shutil.rmtree(run_dir, ignore_errors=True)
+            total_size -= size
+
+    def get_run_logs_generator(self, es_client: K8sElasticSearchClient, run: Run, namespace: str,
+                               start_date: str = None, end_date: str = None, index='_all', pod_ids: List[str] = None,
+                               pod_status: PodStatus = None, min_severity: SeverityLevel = None,
+                               cached_only=False) -> Optional[Generator[LogEntry, None, None]]:
+        """
+        Updates cached logs of a given run and returns them, filtered by given criteria. Arguments have the same
+        meaning as in K8sElasticSearchClient.get_experiment_logs_generator. Returns None, if cached logs cannot be
+        used, because they are being updated by another process, or they are not complete and cached_only is set.
+        :param cached_only: if set, logs are returned only if logs of a finished run are cached - logs are not
+         updated
+        """
+        run_dir = self._get_run_dir(run_name=run.name, namespace=namespace)
+        state = self._load_state(run_dir=run_dir, run=run)
+        if state['finished']:
+            logger.debug(f'Logs of {run.name} Run are served from cache.')
+            os.utime(os.path.join(run_dir, self.STATE_FILE_NAME))
+        elif cached_only:
+            return None
+        else:
+            os.makedirs(run_dir, exist_ok=True)
+            if not self._lock(run_dir):
+                logger.debug(f'Cached logs of {run.name} Run are being updated by another process.')
+                return None
+            try:
+                logger.debug(f'Updating cached logs of {run.name} Run.')
+                # state might have been changed by another process, before the lock was acquired
+                state = self._load_state(run_dir=run_dir, run=run)
+                self._update(es_client=es_client, run=run, namespace=namespace, run_dir=run_dir, state=state,
+                             index=index)
+            finally:
+                self._unlock(run_dir)
+            self.evict(keep_run_dir=run_dir)
+
+        filters: List[Callable[[LogEntry], bool]] = []
+        if min_severity:
+            filters.append(lambda log_entry: filter_log_by_severity(log_entry, min_severity=min_severity))
+        if pod_ids:
+            filters.append(lambda log_entry: filter_log_by_pod_ids(log_entry, pod_ids=set(pod_ids)))
+        if pod_status:
+            pod_names = set(get_run_pod_names_by_status(run_name=run.name, namespace=namespace, pod_status=pod_status))
+            filters.append(lambda log_entry: log_entry.pod_name in pod_names)
+        start_timestamp = to_epoch_millis(start_date) if start_date else None
+        end_timestamp = to_epoch_millis(end_date) if end_date else None
+
+        return self._filter_logs(segments=[self._read_segment(run_dir=run_dir, segment_name=segment_name,
+                                                              run_name=run.name)
+                                           for segment_name in state['segments']],
+                                 filters=filters, start_timestamp=start_timestamp, end_timestamp=end_timestamp)
+
+    @staticmethod
+    def _filter_logs(segments: List[Iterator[CachedLog]], filters: List[Callable[[LogEntry], bool]],
+                     start_timestamp: Optional[int],
+                     end_timestamp: Optional[int]) -> Generator[LogEntry, None, None]:
+        # logs indexed with a delay may be stored in a later segment, so segments are merged
+        for timestamp, _, log_entry in heapq.merge(*segments, key=lambda log: (log[0], log[1])):
+            if start_timestamp is not None and timestamp < start_timestamp:
+                continue
+            if end_timestamp is not None and timestamp > end_timestamp:
+                break
+            if all(f(log_entry) for f in filters):
+                yield log_entry
@@ -15,15 +15,18 @@
 #
 
 from enum import Enum
-from functools import lru_cache
-from typing import Set
+import re
+from typing import Iterable, List, Set
 
 from logs_aggregator.k8s_log_entry import LogEntry
 from util.logger import initialize_logger
-from util.k8s.k8s_info import PodStatus, get_pod_status
+from util.k8s.k8s_info import PodStatus, get_namespaced_pods
 
 log = initialize_logger(__name__)
 
+# approximates tokens of log content produced by ElasticSearch standard analyzer
+WORD_REGEX = re.compile(r'\w+')
+
 
 class SeverityLevel(Enum):
     """
@@ -38,20 +41,38 @@ class SeverityLevel(Enum):
 
 def filter_log_by_severity(log_entry: LogEntry,
                            min_severity: SeverityLevel) -> bool:
-    return any(severity in log_entry.content.upper() for severity in min_severity.value)
+    """
+    Checks whether log content contains a severity level of at least a given importance as a separate word
+    (case insensitive), the same way as severity_query does.
+    """
+    return not min_severity.value.isdisjoint(WORD_REGEX.findall(log_entry.content.upper()))
+
+
+def filter_log_by_pod_ids(log_entry: LogEntry, pod_ids: Set[str]) -> bool:
+    return log_entry.pod_name in pod_ids
 
 
-@lru_cache(maxsize=128)
-def cached_pod_status(pod_name: str, namespace: str) -> PodStatus:
+def severity_query(min_severity: SeverityLevel) -> dict:
     """
-    Wrapper for caching Pod status calls in LRU cache.
+    ElasticSearch counterpart of filter_log_by_severity. Log field is stored as lowercase tokens, so severity levels
+    are looked up directly in the terms index of the field, instead of scanning all of its terms.
     """
-    return get_pod_status(pod_name=pod_name, namespace=namespace)
+    return {"match": {"log": {"query": ' '.join(sorted(severity.lower() for severity in min_severity.value)),
+                              "operator": "or"}}}
 
 
-def filter_log_by_pod_status(log_entry: LogEntry, pod_status: PodStatus) -> bool:
-    return cached_pod_status(pod_name=log_entry.pod_name, namespace=log_entry.namespace) == pod_status
+def pod_names_query(pod_names: Iterable[str]) -> dict:
+    """
+    ElasticSearch counterpart of filter_log_by_pod_ids.
+    """
+    return {"terms": {"kubernetes.pod_name.keyword": sorted(pod_names)}}
 
 
-def filter_log_by_pod_ids(log_entry: LogEntry, pod_ids: Set[str]) -> bool:
-    return log_entry.pod_name in pod_ids
+def get_run_pod_names_by_status(run_name: str, namespace: str, pod_status: PodStatus) -> List[str]:
+    """
+    Returns names of pods of a given run, which have a given status. Pods are fetched with a single request,
+    instead of checking status of each pod found in logs.
+    """
+    pods = get_namespaced_pods(label_selector=f'runName={run_name}', namespace=namespace)
+    return [pod.metadata.name for pod in pods
+            if pod.status.phase and pod.status.phase.upper() == pod_status.value]
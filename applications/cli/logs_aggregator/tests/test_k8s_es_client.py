@@ -14,14 +14,18 @@
 # limitations under the License.
 #
 
+from itertools import islice
+from threading import Event
 from unittest.mock import MagicMock
 
 import pytest
 
 from logs_aggregator.k8s_es_client import K8sElasticSearchClient
 from logs_aggregator.k8s_log_entry import LogEntry
+from logs_aggregator.log_filters import SeverityLevel
 from platform_resources.run import Run
 from platform_resources.workflow import ArgoWorkflow
+from util.k8s.k8s_info import PodStatus
 
 TEST_SCAN_OUTPUT = [{'_index': 'fluentd-20180417',
                                     '_type': 'access_log',
@@ -129,6 +133,56 @@ def test_full_log_search_filter_idempotent(mock_k8s_info, mocker):
     assert filter_all_results == TEST_LOG_ENTRIES
 
 
+def make_hit(doc_id: str, timestamp: int) -> dict:
+    return {'_id': doc_id, 'sort': [timestamp, 'pod', doc_id],
+            '_source': {'log': f'log {doc_id}', '@timestamp': str(timestamp),
+                        'kubernetes': {'pod_name': 'pod', 'namespace_name': 'default'}}}
+
+
+def make_search_output(*hits: dict) -> dict:
+    return {'hits': {'hits': list(hits)}}
+
+
+def test_stream_log_search_after(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocker.patch.object(K8sElasticSearchClient, 'FOLLOW_PAGE_SIZE', 2)
+    mocker.patch('logs_aggregator.k8s_es_client.time.sleep')
+    es_search_mock = mocker.patch.object(client, 'search')
+    es_search_mock.side_effect = [
+        make_search_output(make_hit('a', 1000), make_hit('b', 1000)),
+        make_search_output(make_hit('c', 2000)),
+        # d shares timestamp with already returned logs, but it was indexed later
+        make_search_output(make_hit('b', 1000), make_hit('d', 1000)),
+        make_search_output(make_hit('c', 2000), make_hit('e', 3000)),
+        make_search_output(),
+    ]
+    query = {"bool": {"must": [{"term": {"kubernetes.labels.runName.keyword": "run"}}]}}
+
+    logs = client.get_stream_log_generator(query_body={"query": query})
+
+    assert [log.content for log in islice(logs, 5)] == ['log a', 'log b', 'log c', 'log d', 'log e']
+    search_bodies = [call[1]['body'] for call in es_search_mock.call_args_list]
+    assert search_bodies[0]['query'] == query
+    assert search_bodies[0]['sort'] == K8sElasticSearchClient.SORTED_LOGS_SORT
+    assert 'search_after' not in search_bodies[0]
+    assert search_bodies[1]['search_after'] == [1000, 'pod', 'b']
+    assert search_bodies[2]['query'] == {"bool": {"must": [query], "filter": {"range": {"@timestamp": {
+        "gte": 2000 - K8sElasticSearchClient.FOLLOW_OVERLAP_MS, "format": "epoch_millis"}}}}}
+    assert search_bodies[3]['search_after'] == [1000, 'pod', 'd']
+
+
+def test_stream_log_backoff(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocker.patch.object(client, 'search').return_value = make_search_output()
+    sleep_mock = mocker.patch('logs_aggregator.k8s_es_client.time.sleep')
+    sleep_mock.side_effect = [None] * 5 + [RuntimeError]
+
+    with pytest.raises(RuntimeError):
+        next(client.get_stream_log_generator(query_body={}, time_interval=0.5))
+
+    assert [call[0][0] for call in sleep_mock.call_args_list] == [0.5, 1, 2, 4, 4, 4]
+
+
 def test_get_experiment_logs(mock_k8s_info, mocker):
     client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
     mocked_log_search = mocker.patch.object(client, 'get_log_generator')
@@ -156,7 +210,112 @@ def test_get_experiment_logs(mock_k8s_info, mocker):
                            "filter": {"range": {"@timestamp": {"gte": run_start_date}}}
                            }},
         "sort": {"@timestamp": {"order": "asc"}}},
-        filters=[], index='_all')
+        index='_all')
+
+
+def test_get_experiment_logs_filters(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocked_log_search = mocker.patch.object(client, 'get_log_generator')
+    mocked_log_search.return_value = iter(TEST_LOG_ENTRIES)
+    mocked_get_pod_names = mocker.patch('logs_aggregator.k8s_es_client.get_run_pod_names_by_status',
+                                        return_value=['pod-b'])
+
+    experiment_name = 'fake-experiment'
+    namespace = 'fake-namespace'
+
+    run_mock = MagicMock(spec=Run)
+    run_mock.name = experiment_name
+
+    run_start_date = '2018-04-17T09:28:39+00:00'
+
+    list(client.get_experiment_logs_generator(run=run_mock, namespace=namespace, start_date=run_start_date,
+                                              pod_ids=['pod-a', 'pod-b'], pod_status=PodStatus.RUNNING,
+                                              min_severity=SeverityLevel.CRITICAL))
+
+    mocked_get_pod_names.assert_called_once_with(run_name=experiment_name, namespace=namespace,
+                                                 pod_status=PodStatus.RUNNING)
+    query_body = mocked_log_search.call_args[1]['query_body']
+    assert query_body["query"]["bool"]["must"] == [
+        {'term': {'kubernetes.labels.runName.keyword': experiment_name}},
+        {'term': {'kubernetes.namespace_name.keyword': namespace}},
+        {"match": {"log": {"query": "critical", "operator": "or"}}},
+        {"terms": {"kubernetes.pod_name.keyword": ['pod-b']}},
+        {"terms": {"kubernetes.pod_name.keyword": ['pod-a', 'pod-b']}}
+    ]
+    assert 'filters' not in mocked_log_search.call_args[1]
+
+
+def test_get_runs_logs(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocked_log_search = mocker.patch.object(client, 'get_log_generator')
+    mocked_log_search.return_value = iter(TEST_LOG_ENTRIES)
+
+    namespace = 'fake-namespace'
+    runs = []
+    for i in range(6):
+        run_mock = MagicMock(spec=Run)
+        run_mock.name = f'fake-experiment-{i}'
+        run_mock.creation_timestamp = f'2018-04-17T09:28:3{i}+00:00'
+        runs.append(run_mock)
+    end_date = '2018-04-17T09:28:49+00:00'
+
+    assert list(client.get_runs_logs_generator(runs=runs, namespace=namespace, end_date=end_date)) == \
+        TEST_LOG_ENTRIES
+
+    mocked_log_search.assert_called_with(query_body={
+        "query": {"bool": {"must":
+                               [{'terms': {'kubernetes.labels.runName.keyword': [run.name for run in runs]}},
+                                {'term': {'kubernetes.namespace_name.keyword': namespace}}
+                                ],
+                           "filter": {"bool": {"should": [
+                               {"bool": {"filter": [
+                                   {'term': {'kubernetes.labels.runName.keyword': run.name}},
+                                   {"range": {"@timestamp": {"gte": run.creation_timestamp, "lte": end_date}}}]}}
+                               for run in runs], "minimum_should_match": 1}}
+                           }},
+        "sort": {"@timestamp": {"order": "asc"}}},
+        index='_all', slices=K8sElasticSearchClient.MAX_SCROLL_SLICES)
+
+
+def test_full_log_search_sliced(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    es_scan_mock = mocker.patch('logs_aggregator.k8s_es_client.elasticsearch.helpers.scan')
+    slices_output = {0: [TEST_SCAN_OUTPUT[1]], 1: [TEST_SCAN_OUTPUT[0]]}
+    es_scan_mock.side_effect = lambda *args, query, **kwargs: iter(slices_output[query['slice']['id']])
+
+    assert list(client.get_log_generator(query_body={}, slices=2)) == TEST_LOG_ENTRIES
+    assert es_scan_mock.call_count == 2
+
+
+def test_full_log_search_sliced_error(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    es_scan_mock = mocker.patch('logs_aggregator.k8s_es_client.elasticsearch.helpers.scan')
+    es_scan_mock.side_effect = RuntimeError
+
+    with pytest.raises(RuntimeError):
+        list(client.get_log_generator(query_body={}, slices=2))
+
+
+def test_full_log_search_sliced_stopped(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocker.patch.object(K8sElasticSearchClient, 'SLICE_QUEUE_SIZE', 1)
+    mocker.patch.object(K8sElasticSearchClient, 'SLICE_PUT_TIMEOUT', 0.01)
+    scans_finished = [Event(), Event()]
+
+    def scan(*args, query, **kwargs):
+        try:
+            while True:
+                yield TEST_SCAN_OUTPUT[0]
+        finally:
+            scans_finished[query['slice']['id']].set()
+
+    mocker.patch('logs_aggregator.k8s_es_client.elasticsearch.helpers.scan', side_effect=scan)
+
+    logs = client.get_log_generator(query_body={}, slices=2)
+    assert next(logs) == TEST_LOG_ENTRIES[0]
+    logs.close()
+
+    assert all(scan_finished.wait(timeout=5) for scan_finished in scans_finished)
 
 
 def test_get_workflow_logs(mocker):
@@ -221,7 +380,7 @@ def test_get_experiment_logs_time_range(mock_k8s_info, mocker):
                            "filter": {"range": {"@timestamp":{"gte": start_date, "lte": end_date}}}
                            }},
         "sort": {"@timestamp": {"order": "asc"}}},
-        filters=[], index='_all')
+        index='_all')
 
 
 def test_delete_logs_for_namespace(mock_k8s_info, mocker):
@@ -233,23 +392,48 @@ def test_delete_logs_for_namespace(mock_k8s_info, mocker):
     assert mocked_delete_logs.call_count == 1
 
 
-def test_delete_logs_for_run(mock_k8s_info, mocker):
+def test_delete_logs_for_runs(mock_k8s_info, mocker):
     client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
-    mocked_delete_logs = mocker.patch.object(client, 'delete_by_query')
+    mocked_delete_logs = mocker.patch.object(client, 'delete_by_query', return_value={'task': 'node:1'})
 
-    run_name = 'test_run'
+    runs = ['test_run', 'test_run_2']
     namespace = 'fake-namespace'
 
-    client.delete_logs_for_run(run_name, namespace)
+    task_id = client.delete_logs_for_runs(runs, namespace)
 
     delete_query = {"query": {"bool": {"must":
         [
-            {"term": {'kubernetes.labels.runName.keyword': run_name}},
+            {"terms": {'kubernetes.labels.runName.keyword': runs}},
             {"term": {'kubernetes.namespace_name.keyword': namespace}}
         ]
     }
     }
     }
 
-    mocked_delete_logs.assert_called_with(index='_all',
-                                          body=delete_query)
+    assert task_id == 'node:1'
+    mocked_delete_logs.assert_called_once_with(index='_all', body=delete_query, wait_for_completion=False,
+                                               slices='auto', conflicts='proceed')
+
+
+def test_wait_for_task(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocker.patch('time.sleep')
+    statuses = [{'total': 10, 'deleted': 5}, {'total': 10, 'deleted': 10}]
+    mocked_get_task = mocker.patch.object(client.tasks, 'get', side_effect=[
+        {'completed': False, 'task': {'status': statuses[0]}},
+        {'completed': True, 'task': {'status': statuses[1]}, 'response': {'deleted': 10}}
+    ])
+    progress_callback = mocker.MagicMock()
+
+    assert client.wait_for_task('node:1', progress_callback=progress_callback)
+
+    assert mocked_get_task.call_count == 2
+    assert [call[0][0] for call in progress_callback.call_args_list] == statuses
+
+
+def test_wait_for_task_timeout(mock_k8s_info, mocker):
+    client = K8sElasticSearchClient(host='fake', port=8080, namespace='kube-system')
+    mocker.patch('time.sleep')
+    mocker.patch.object(client.tasks, 'get', return_value={'completed': False, 'task': {'status': {}}})
+
+    assert not client.wait_for_task('node:1', timeout=0)
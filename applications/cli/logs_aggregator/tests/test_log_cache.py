@@ -0,0 +1,202 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from logs_aggregator.k8s_es_client import K8sElasticSearchClient
+from logs_aggregator.log_cache import LogCache, to_epoch_millis
+from logs_aggregator.log_filters import SeverityLevel
+from platform_resources.run import Run, RunStatus
+
+RUN_CREATION_TIMESTAMP = '2018-04-17T09:28:00+00:00'
+
+
+def make_hit(doc_id: str, date: str, content: str = None, pod_name: str = 'pod-1') -> dict:
+    return {'_id': doc_id, 'sort': [to_epoch_millis(date), pod_name, doc_id],
+            '_source': {'log': content or f'log {doc_id}\n', '@timestamp': date,
+                        'kubernetes': {'pod_name': pod_name, 'namespace_name': 'namespace',
+                                       'labels': {'runName': 'run'}}}}
+
+
+@pytest.fixture
+def es_client():
+    client = MagicMock()
+    client.create_log_entry = K8sElasticSearchClient.create_log_entry
+    return client
+
+
+def make_run(state: RunStatus = RunStatus.RUNNING, end_timestamp: str = None,
+             creation_timestamp: str = RUN_CREATION_TIMESTAMP) -> Run:
+    return Run(name='run', experiment_name='run', state=state, creation_timestamp=creation_timestamp,
+               end_timestamp=end_timestamp)
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_incremental(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [make_hit('a', '2018-04-17T09:28:39+00:00'),
+                                                  make_hit('b', '2018-04-17T09:28:40+00:00')]
+
+    logs = list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace'))
+
+    assert [log.content for log in logs] == ['log a\n', 'log b\n']
+    assert logs[0].run_name == 'run'
+    query = es_client.get_sorted_raw_logs.call_args[1]['query']
+    assert query['bool']['filter'] == [{"range": {"@timestamp": {"gte": RUN_CREATION_TIMESTAMP}}}]
+
+    # b is returned again as it was indexed within overlap period, c was indexed with a delay
+    es_client.get_sorted_raw_logs.return_value = [make_hit('c', '2018-04-17T09:28:39+00:00'),
+                                                  make_hit('b', '2018-04-17T09:28:40+00:00'),
+                                                  make_hit('d', '2018-04-17T09:28:41+00:00')]
+
+    logs = list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace'))
+
+    assert [log.content for log in logs] == ['log a\n', 'log c\n', 'log b\n', 'log d\n']
+    query = es_client.get_sorted_raw_logs.call_args[1]['query']
+    assert query['bool']['filter'][1] == {"range": {"@timestamp": {
+        "gte": to_epoch_millis('2018-04-17T09:28:40+00:00') - K8sElasticSearchClient.FOLLOW_OVERLAP_MS,
+        "format": "epoch_millis"}}}
+    assert len(os.listdir(str(tmpdir.join('namespace', 'run')))) == 3
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_finished(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [make_hit('a', '2018-04-17T09:28:39+00:00')]
+    es_client.count.return_value = {'count': 1}
+    finished_run = make_run(state=RunStatus.COMPLETE, end_timestamp='2018-04-17T10:00:00+00:00')
+
+    assert len(list(log_cache.get_run_logs_generator(es_client=es_client, run=finished_run,
+                                                     namespace='namespace'))) == 1
+    assert len(list(log_cache.get_run_logs_generator(es_client=es_client, run=finished_run,
+                                                     namespace='namespace'))) == 1
+    assert es_client.get_sorted_raw_logs.call_count == 1
+
+    # run with the same name was created again
+    assert len(list(log_cache.get_run_logs_generator(es_client=es_client,
+                                                     run=make_run(creation_timestamp='2018-04-18T09:28:00+00:00'),
+                                                     namespace='namespace'))) == 1
+    assert es_client.get_sorted_raw_logs.call_count == 2
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_finished_incomplete(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [make_hit('a', '2018-04-17T09:28:39+00:00'),
+                                                  make_hit('b', '2018-04-17T09:28:50+00:00')]
+    list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace'))
+
+    # c was indexed after b, but it is older than the overlap period
+    es_client.get_sorted_raw_logs.side_effect = [[make_hit('b', '2018-04-17T09:28:50+00:00')],
+                                                 [make_hit('a', '2018-04-17T09:28:39+00:00'),
+                                                  make_hit('c', '2018-04-17T09:28:40+00:00'),
+                                                  make_hit('b', '2018-04-17T09:28:50+00:00')]]
+    es_client.count.return_value = {'count': 3}
+    finished_run = make_run(state=RunStatus.COMPLETE, end_timestamp='2018-04-17T10:00:00+00:00')
+
+    logs = list(log_cache.get_run_logs_generator(es_client=es_client, run=finished_run, namespace='namespace'))
+
+    assert [log.content for log in logs] == ['log a\n', 'log c\n', 'log b\n']
+    query = es_client.get_sorted_raw_logs.call_args[1]['query']
+    assert query['bool']['filter'] == [{"range": {"@timestamp": {"gte": RUN_CREATION_TIMESTAMP}}}]
+    assert es_client.count.call_args[1]['body'] == {"query": query}
+    assert len(os.listdir(str(tmpdir.join('namespace', 'run')))) == 2
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_cached_only(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [make_hit('a', '2018-04-17T09:28:39+00:00')]
+    es_client.count.return_value = {'count': 1}
+    finished_run = make_run(state=RunStatus.COMPLETE, end_timestamp='2018-04-17T10:00:00+00:00')
+
+    assert log_cache.get_run_logs_generator(es_client=es_client, run=finished_run, namespace='namespace',
+                                            cached_only=True) is None
+    assert es_client.get_sorted_raw_logs.call_count == 0
+
+    list(log_cache.get_run_logs_generator(es_client=es_client, run=finished_run, namespace='namespace'))
+
+    assert len(list(log_cache.get_run_logs_generator(es_client=es_client, run=finished_run,
+                                                     namespace='namespace', cached_only=True))) == 1
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_locked(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [make_hit('a', '2018-04-17T09:28:39+00:00')]
+    lock = tmpdir.join('namespace').ensure('run', dir=True).join(LogCache.LOCK_FILE_NAME)
+    lock.write('')
+
+    assert log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace') is None
+    assert es_client.get_sorted_raw_logs.call_count == 0
+
+    # lock left by a killed process
+    os.utime(str(lock), (1000, 1000))
+    tmpdir.join('namespace', 'run', 'segment-000000-1.jsonl.gz').write('orphaned segment')
+
+    assert len(list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(),
+                                                     namespace='namespace'))) == 1
+    assert sorted(os.listdir(str(tmpdir.join('namespace', 'run')))) == \
+        [f'segment-000000-{os.getpid()}.jsonl.gz', LogCache.STATE_FILE_NAME]
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_filters(tmpdir, es_client, mocker):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.return_value = [
+        make_hit('a', '2018-04-17T09:28:39+00:00', content='[ERROR] a\n'),
+        make_hit('b', '2018-04-17T09:28:40+00:00', content='[INFO] b\n'),
+        make_hit('c', '2018-04-17T09:28:41+00:00', content='[ERROR] c\n', pod_name='pod-2'),
+        make_hit('d', '2018-04-17T09:28:42+00:00', content='[ERROR] d\n'),
+        make_hit('e', '2018-04-17T09:28:43+00:00', content='[ERROR] e\n')]
+    mocker.patch('logs_aggregator.log_cache.get_run_pod_names_by_status', return_value=['pod-1'])
+
+    logs = list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace',
+                                                 start_date='2018-04-17T09:28:39.5+00:00',
+                                                 end_date='2018-04-17T09:28:42+00:00',
+                                                 min_severity=SeverityLevel.ERROR, pod_ids=['pod-1', 'pod-2']))
+    assert [log.content for log in logs] == ['[ERROR] c\n', '[ERROR] d\n']
+
+    logs = list(log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace',
+                                                 pod_status=MagicMock()))
+    assert [log.pod_name for log in logs] == ['pod-1'] * 4
+
+
+# noinspection PyShadowingNames
+def test_get_run_logs_failure(tmpdir, es_client):
+    log_cache = LogCache(cache_dir=str(tmpdir))
+    es_client.get_sorted_raw_logs.side_effect = RuntimeError
+
+    with pytest.raises(RuntimeError):
+        log_cache.get_run_logs_generator(es_client=es_client, run=make_run(), namespace='namespace')
+
+    assert os.listdir(str(tmpdir.join('namespace', 'run'))) == []
+
+
+def test_evict(tmpdir):
+    for i, run_name in enumerate(('run-1', 'run-2', 'run-3')):
+        run_dir = tmpdir.join('namespace').ensure(run_name, dir=True)
+        run_dir.join('segment').write('x' * 100)
+        run_dir.join(LogCache.STATE_FILE_NAME).write('{}')
+        os.utime(str(run_dir.join(LogCache.STATE_FILE_NAME)), (1000 + i, 1000 + i))
+    log_cache = LogCache(cache_dir=str(tmpdir), max_size=250)
+
+    log_cache.evict(keep_run_dir=str(tmpdir.join('namespace', 'run-1')))
+
+    assert sorted(os.listdir(str(tmpdir.join('namespace')))) == ['run-1', 'run-3']
@@ -14,11 +14,13 @@
 # limitations under the License.
 #
 
+from unittest.mock import MagicMock
+
 import pytest
 
 
-from logs_aggregator.log_filters import filter_log_by_severity,filter_log_by_pod_status,\
-    SeverityLevel, filter_log_by_pod_ids
+from logs_aggregator.log_filters import filter_log_by_severity, \
+    SeverityLevel, filter_log_by_pod_ids, severity_query, pod_names_query, get_run_pod_names_by_status
 from logs_aggregator.k8s_log_entry import LogEntry
 from util.k8s.k8s_info import PodStatus
 
@@ -91,18 +93,11 @@ def test_filter_log_by_severity_critical_negative(log_entry):
     assert filter_log_by_severity(log_entry, SeverityLevel.CRITICAL) == False
 
 
-@pytest.mark.parametrize("status", list(PodStatus))
-def test_filter_log_by_pod_status(status, mocker):
-
-    log_entry = LogEntry(date='2018-04-19T14:27:46+00:00',
-                        pod_name='test-pod',
-                        namespace='default',
-                        content='bla')
-
-    mocked_get_pod_status = mocker.patch('logs_aggregator.log_filters.cached_pod_status')
-    mocked_get_pod_status.return_value = status
-
-    assert filter_log_by_pod_status(log_entry, status) == True
+def test_filter_log_by_severity_word():
+    assert filter_log_by_severity(LogEntry(date='2018-04-19T14:27:46+00:00', content='2018 error: bla',
+                                           pod_name='pod', namespace='default'), SeverityLevel.ERROR)
+    assert not filter_log_by_severity(LogEntry(date='2018-04-19T14:27:46+00:00', content='ValueError: bla',
+                                               pod_name='pod', namespace='default'), SeverityLevel.ERROR)
 
 
 def test_filter_log_by_pod_ids():
@@ -115,3 +110,25 @@ def test_filter_log_by_pod_ids():
 
     assert filter_log_by_pod_ids(pod_ids={pod_id}, log_entry=log_entry) == True
     assert filter_log_by_pod_ids(pod_ids={'another-pod-id'}, log_entry=log_entry) == False
+
+
+def test_severity_query():
+    assert severity_query(SeverityLevel.ERROR) == {"match": {"log": {"query": "critical error", "operator": "or"}}}
+
+
+def test_pod_names_query():
+    assert pod_names_query({'pod-b', 'pod-a'}) == {"terms": {"kubernetes.pod_name.keyword": ['pod-a', 'pod-b']}}
+
+
+def test_get_run_pod_names_by_status(mocker):
+    pods = []
+    for name, phase in (('pod-a', 'Running'), ('pod-b', 'Failed'), ('pod-c', None), ('pod-d', 'Running')):
+        pod = MagicMock()
+        pod.metadata.name = name
+        pod.status.phase = phase
+        pods.append(pod)
+    mocked_get_pods = mocker.patch('logs_aggregator.log_filters.get_namespaced_pods', return_value=pods)
+
+    assert get_run_pod_names_by_status(run_name='run', namespace='default',
+                                       pod_status=PodStatus.RUNNING) == ['pod-a', 'pod-d']
+    mocked_get_pods.assert_called_once_with(label_selector='runName=run', namespace='default')
@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import copy
+from collections import Counter
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional, Tuple
+
+from kubernetes_asyncio.client import V1ObjectMeta, V1Pod, V1PodList, V1PodStatus
+from kubernetes_asyncio.client.rest import ApiException
+
+from nauta_resources.platform_resource import merge_patch_bodies
+
+
+class FakeKubernetesApi:
+    """
+    In-process stand-in for the parts of CustomObjectsApi and CoreV1Api used by the operator. Objects are kept in
+    memory, every call is counted and optionally delayed by `latency` seconds. Callbacks registered with
+    on_custom_object_patched() are called with a patched object, so that a caller can emulate a watch.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.custom_objects: Dict[Tuple[str, str, str], dict] = {}  # (plural, namespace, name): object
+        self.pods: Dict[Tuple[str, str], V1Pod] = {}  # (namespace, name): pod
+        self._patch_callbacks: List[Callable[[dict], None]] = []
+
+    def on_custom_object_patched(self, callback: Callable[[dict], None]):
+        self._patch_callbacks.append(callback)
+
+    def add_custom_object(self, plural: str, body: dict):
+        self.custom_objects[(plural, body['metadata']['namespace'], body['metadata']['name'])] = copy.deepcopy(body)
+
+    def set_pod(self, namespace: str, name: str, labels: dict, phase: Optional[str]):
+        if phase is None:
+            self.pods.pop((namespace, name), None)
+        else:
+            self.pods[(namespace, name)] = V1Pod(metadata=V1ObjectMeta(name=name, namespace=namespace, labels=labels),
+                                                 status=V1PodStatus(phase=phase))
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, name: str):
+        await self._call('get_namespaced_custom_object')
+        try:
+            return copy.deepcopy(self.custom_objects[(plural, namespace, name)])
+        except KeyError:
+            raise ApiException(status=HTTPStatus.NOT_FOUND)
+
+    async def list_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, **kwargs):
+        await self._call('list_namespaced_custom_object')
+        return {'items': [copy.deepcopy(body) for (object_plural, object_namespace, _), body
+                          in self.custom_objects.items() if object_plural == plural and object_namespace == namespace]}
+
+    async def patch_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, name: str,
+                                             body: dict):
+        await self._call('patch_namespaced_custom_object')
+        try:
+            stored_object = self.custom_objects[(plural, namespace, name)]
+        except KeyError:
+            raise ApiException(status=HTTPStatus.NOT_FOUND)
+
+        merge_patch_bodies(stored_object, copy.deepcopy(body))
+        for callback in self._patch_callbacks:
+            callback(copy.deepcopy(stored_object))
+        return copy.deepcopy(stored_object)
+
+    async def list_namespaced_pod(self, namespace: str, label_selector: str = '', **kwargs):
+        await self._call('list_namespaced_pod')
+        labels = dict(selector.split('=', 1) for selector in label_selector.split(',') if selector)
+        return V1PodList(items=[pod for (pod_namespace, _), pod in self.pods.items() if pod_namespace == namespace
+                                and all(pod.metadata.labels.get(key) == value for key, value in labels.items())])
+
+    async def list_pod_for_all_namespaces(self, label_selector: str = '', **kwargs):
+        await self._call('list_pod_for_all_namespaces')
+        # only selectors checking existence of labels are supported
+        labels = [selector for selector in label_selector.split(',') if selector]
+        return V1PodList(items=[pod for pod in self.pods.values()
+                                if all(label in pod.metadata.labels for label in labels)])
+
+    @property
+    def calls_count(self) -> int:
+        return sum(self.calls.values())
@@ -0,0 +1,226 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Benchmark of Run monitoring done by nauta_operator. Handlers of the operator are called directly with events of N
+runs with M pods each, which go through random phase transitions, while kubernetes API is replaced with an
+in-process fake. Usage:
+
+    python -m benchmarks.run_monitoring --runs 200 --pods 4
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import math
+import random
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+
+from benchmarks.fake_k8s_api import FakeKubernetesApi
+from nauta_resources.platform_resource import CustomResourceApiClient, CustomResourceUpdateQueue, K8SApiClient
+from nauta_resources.run import Run, RunStatus
+
+with patch('pykube.KubeConfig'), patch('pykube.HTTPClient'):
+    import nauta_operator
+
+
+NAMESPACE = 'benchmark'
+POD_PHASES = ['Pending', 'Running']
+
+logger = logging.getLogger('benchmark')
+
+
+class BenchmarkResult:
+    def __init__(self, runs_count: int, pods_per_run: int, duration: float, api_calls: Counter,
+                 latencies: List[float], memory_per_run: float, final_states: Counter):
+        self.runs_count = runs_count
+        self.pods_per_run = pods_per_run
+        self.duration = duration
+        self.api_calls = api_calls
+        self.latencies = sorted(latencies)
+        self.memory_per_run = memory_per_run
+        self.final_states = final_states
+
+    @property
+    def api_calls_count(self) -> int:
+        return sum(self.api_calls.values())
+
+    @property
+    def api_calls_per_second(self) -> float:
+        return self.api_calls_count / self.duration if self.duration else 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        if not self.latencies:
+            return 0.0
+        index = max(math.ceil(percentile / 100 * len(self.latencies)) - 1, 0)
+        return self.latencies[index]
+
+    def report(self) -> str:
+        lines = [f'Runs: {self.runs_count}, pods per run: {self.pods_per_run}',
+                 f'Duration: {self.duration:.3f} s',
+                 f'API calls: {self.api_calls_count} ({self.api_calls_per_second:.1f}/s)']
+        lines += [f'    {method}: {count}' for method, count in sorted(self.api_calls.items())]
+        lines.append('Event-to-status latency: ' +
+                     ', '.join(f'p{percentile} {self.latency_percentile(percentile) * 1000:.1f} ms'
+                               for percentile in (50, 90, 99)) +
+                     f', max {self.latency_percentile(100) * 1000:.1f} ms')
+        lines.append(f'Memory per tracked run: {self.memory_per_run / 1024:.2f} KiB')
+        lines.append('Final states: ' + ', '.join(f'{state}: {count}'
+                                                  for state, count in sorted(self.final_states.items())))
+        return '\n'.join(lines)
+
+
+def run_body(name: str, state: RunStatus) -> dict:
+    return Run(name=name, namespace=NAMESPACE, state=state)._body
+
+
+def pod_event(event_type: str, run_name: str, pod_name: str, phase: str) -> dict:
+    return {'event': {'type': event_type}, 'meta': {'name': pod_name, 'labels': {'runName': run_name}},
+            'status': {'phase': phase}, 'namespace': NAMESPACE, 'name': pod_name, 'logger': logger}
+
+
+def generate_pod_transitions(runs: List[str], pods_per_run: int, failure_probability: float,
+                             rng: random.Random) -> List[Tuple[str, str, str]]:
+    """
+    Returns list of (run name, pod name, phase) tuples. Each pod goes through Pending, Running and then
+    Succeeded or Failed phase, transitions of different pods are randomly interleaved.
+    """
+    pod_phases: Dict[Tuple[str, str], List[str]] = {}
+    for run_name in runs:
+        for pod_index in range(pods_per_run):
+            final_phase = 'Failed' if rng.random() < failure_probability else 'Succeeded'
+            # Pending phase was already reported when the pod was created
+            pod_phases[(run_name, f'{run_name}-{pod_index}')] = POD_PHASES[1:] + [final_phase]
+
+    transitions = []
+    pods = list(pod_phases)
+    while pods:
+        pod_index = rng.randrange(len(pods))
+        run_name, pod_name = pods[pod_index]
+        transitions.append((run_name, pod_name, pod_phases[(run_name, pod_name)].pop(0)))
+        if not pod_phases[(run_name, pod_name)]:
+            pods[pod_index] = pods[-1]
+            pods.pop()
+    return transitions
+
+
+async def run_benchmark(runs_count: int = 100, pods_per_run: int = 2, failure_probability: float = 0.1,
+                        api_latency: float = 0.0, api_rate: float = CustomResourceUpdateQueue.DEFAULT_RATE,
+                        api_burst: int = CustomResourceUpdateQueue.DEFAULT_BURST, seed: int = 0) -> BenchmarkResult:
+    rng = random.Random(seed)
+    fake_api = FakeKubernetesApi(latency=api_latency)
+    runs = [f'run-{index}' for index in range(runs_count)]
+
+    last_pod_event_times: Dict[str, float] = {}
+    latencies: List[float] = []
+    tasks: List[asyncio.Future] = []
+
+    def run_patched(body: dict):
+        # Emulate watch of runs - operator receives its own changes as MODIFIED events
+        name = body['metadata']['name']
+        latencies.append(time.monotonic() - last_pod_event_times[name])
+        tasks.append(asyncio.ensure_future(nauta_operator.run_event(event={'type': 'MODIFIED'}, body=body,
+                                                                    namespace=NAMESPACE, name=name, logger=logger)))
+
+    fake_api.on_custom_object_patched(run_patched)
+
+    original_custom_object_api = CustomResourceApiClient.k8s_custom_object_api
+    original_core_api = K8SApiClient.core_api
+    original_update_queue = CustomResourceUpdateQueue.instance
+    CustomResourceApiClient.k8s_custom_object_api = fake_api
+    K8SApiClient.core_api = fake_api
+    CustomResourceUpdateQueue.instance = CustomResourceUpdateQueue(rate=api_rate, burst=api_burst)
+    for cache in (nauta_operator.runs, nauta_operator.run_pods, nauta_operator.run_locks, nauta_operator.run_retries,
+                  nauta_operator.finished_runs):
+        cache.clear()
+    nauta_operator.pods_listed = False
+
+    try:
+        for run_name in runs:
+            fake_api.add_custom_object(Run.crd_plural_name, run_body(run_name, RunStatus.QUEUED))
+            for pod_index in range(pods_per_run):
+                fake_api.set_pod(NAMESPACE, f'{run_name}-{pod_index}', {'runName': run_name}, 'Pending')
+
+        # Memory retained by operator caches is measured while all runs are tracked and none of them has finished
+        gc.collect()
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        for run_name in runs:
+            await nauta_operator.run_event(event={'type': 'ADDED'}, body=run_body(run_name, RunStatus.QUEUED),
+                                           namespace=NAMESPACE, name=run_name, logger=logger)
+            for pod_index in range(pods_per_run):
+                await nauta_operator.pod_event(**pod_event('ADDED', run_name, f'{run_name}-{pod_index}', 'Pending'))
+        gc.collect()
+        memory_per_run = (tracemalloc.get_traced_memory()[0] - memory_before) / max(runs_count, 1)
+        tracemalloc.stop()
+
+        transitions = generate_pod_transitions(runs, pods_per_run, failure_probability, rng)
+        fake_api.calls.clear()
+        start = time.monotonic()
+        for run_name, pod_name, phase in transitions:
+            fake_api.set_pod(NAMESPACE, pod_name, {'runName': run_name}, phase)
+            last_pod_event_times[run_name] = time.monotonic()
+            tasks.append(asyncio.ensure_future(
+                nauta_operator.pod_event(**pod_event('MODIFIED', run_name, pod_name, phase))))
+            await asyncio.sleep(0)
+        while tasks:
+            pending_tasks = tasks[:]
+            tasks.clear()
+            await asyncio.gather(*pending_tasks)
+        duration = time.monotonic() - start
+    finally:
+        await CustomResourceUpdateQueue.instance.stop()
+        CustomResourceApiClient.k8s_custom_object_api = original_custom_object_api
+        K8SApiClient.core_api = original_core_api
+        CustomResourceUpdateQueue.instance = original_update_queue
+
+    final_states = Counter(body['spec']['state'] for body in fake_api.custom_objects.values())
+    return BenchmarkResult(runs_count=runs_count, pods_per_run=pods_per_run, duration=duration,
+                           api_calls=fake_api.calls, latencies=latencies, memory_per_run=memory_per_run,
+                           final_states=final_states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of Run monitoring done by nauta_operator.')
+    parser.add_argument('--runs', type=int, default=200, help='Number of simulated runs.')
+    parser.add_argument('--pods', type=int, default=2, help='Number of pods of each run.')
+    parser.add_argument('--failure_probability', type=float, default=0.1,
+                        help='Probability that a pod ends in Failed phase.')
+    parser.add_argument('--api_latency', type=float, default=0.005,
+                        help='Latency of each call to fake kubernetes API, in seconds.')
+    parser.add_argument('--api_rate', type=float, default=CustomResourceUpdateQueue.DEFAULT_RATE,
+                        help='Rate limit of Run updates, in requests per second.')
+    parser.add_argument('--api_burst', type=int, default=CustomResourceUpdateQueue.DEFAULT_BURST,
+                        help='Burst size of Run updates.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of random phase transitions.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(run_benchmark(runs_count=args.runs, pods_per_run=args.pods,
+                                                   failure_probability=args.failure_probability,
+                                                   api_latency=args.api_latency, api_rate=args.api_rate,
+                                                   api_burst=args.api_burst, seed=args.seed))
+    print(result.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -15,14 +15,34 @@
 #
 
 import asyncio
+import copy
 import datetime
 
 import kopf
 import pykube
 
+from nauta_resources.platform_resource import K8SApiClient
 from nauta_resources.run import Run, RunStatus
 
-tasks = {}  # dict{namespace: dict{name: asyncio.Task}}
+FINAL_RUN_STATES = {RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED}
+
+UPDATE_RETRY_DELAY = 5  # seconds
+
+# State of runs is calculated from caches filled by watches on runs and pods, so kubernetes API is contacted
+# only when state of a run changes.
+runs = {}  # dict{namespace: dict{name: run body}}, only runs not in a final state are kept
+run_pods = {}  # dict{namespace: dict{run name: dict{pod name: pod phase}}}
+run_locks = {}  # dict{namespace: dict{name: asyncio.Lock}}
+run_retries = {}  # dict{namespace: dict{name: asyncio.TimerHandle}}, scheduled retries of failed updates
+# Events of a run may come out of order, e.g. an event with a non-final state after the run has been patched to
+# a final state, so runs which reached a final state are remembered until they are deleted.
+finished_runs = {}  # dict{namespace: dict{name: uid}}
+
+# Events of runs may come before events of their pods (e.g. after a restart of the operator), so states of runs
+# are not calculated until pods existing at the start of the operator are put into the cache.
+pods_listed = False
+pods_deleted_while_listing = set()  # set{(namespace, pod name)}
+pods_listing_lock = None
 
 try:
     cfg = pykube.KubeConfig.from_service_account()
@@ -40,72 +60,206 @@ async def handle_run_on_resume(namespace, name, logger, spec, **kwargs):
     except ValueError:
         raise kopf.PermanentError(f'Run {name} is invalid - cannot infer status from spec: {spec}')
 
-    if run_state in {RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED}:
+    if run_state in FINAL_RUN_STATES:
         logger.info(f'Run {name} already in final state: {run_state.value}.')
-        if namespace in tasks and name in tasks[namespace]:
-            del tasks[namespace][name]
-        return
-    elif not tasks.get(namespace, {}).get(name):
-        logger.info(f'Resuming monitoring task for run {name}.')
-        task = asyncio.create_task(monitor_run(namespace, name, logger))
-        tasks.setdefault(namespace, {})
-        tasks[namespace][name] = task
+    else:
+        logger.info(f'Resuming monitoring of run {name}.')
 
 
 @kopf.on.create('aipg.intel.com', 'v1', 'runs')
 async def run_created(namespace, name, logger, **kwargs):
     logger.warning(f'Run {name} created.')
-    task = asyncio.create_task(monitor_run(namespace, name, logger))
-    tasks.setdefault(namespace, {})
-    tasks[namespace][name] = task
 
 
 @kopf.on.delete('aipg.intel.com', 'v1', 'runs')
 async def run_deleted(namespace, name, logger, **kwargs):
     logger.warning(f'Run {name} deleted.')
-    if namespace in tasks and name in tasks[namespace]:
-        task = tasks[namespace][name]
-        task.cancel()  # it will also remove from `tasks`
+    forget_run(namespace, name)
+
+
+@kopf.on.event('aipg.intel.com', 'v1', 'runs')
+async def run_event(event, body, namespace, name, logger, **kwargs):
+    if event['type'] == 'DELETED':
+        forget_run(namespace, name)
+        return
+
+    if is_finished(namespace, name, body):
+        logger.debug(f'Ignoring event of Run {name}, which has already reached a final state.')
+        return
+    # run with the same name may have been created again
+    finished_runs.get(namespace, {}).pop(name, None)
+
+    run = Run.from_k8s_response_dict(copy.deepcopy(body))
+    if run.state in FINAL_RUN_STATES:
+        if name in runs.get(namespace, {}):
+            logger.info(f'Run {name} reached final state: {run.state.value}.')
+        finish_run(namespace, name, body)
+        return
+
+    if not cache_run(namespace, name, body):
+        logger.debug(f'Ignoring outdated event of Run {name}.')
+        return
+    await update_run_state(namespace, name, logger)
+
+
+@kopf.on.event('', 'v1', 'pods', labels={'runName': None})
+async def pod_event(event, meta, status, namespace, name, logger, **kwargs):
+    run_name = meta['labels']['runName']
+    pods = run_pods.setdefault(namespace, {}).setdefault(run_name, {})
+
+    if event['type'] == 'DELETED':
+        pods.pop(name, None)
+        if not pods:
+            del run_pods[namespace][run_name]
+        if not pods_listed:
+            pods_deleted_while_listing.add((namespace, name))
+    else:
+        pods[name] = status.get('phase')
+
+    await update_run_state(namespace, run_name, logger)
+
+
+def forget_run(namespace, name):
+    runs.get(namespace, {}).pop(name, None)
+    run_pods.get(namespace, {}).pop(name, None)
+    run_locks.get(namespace, {}).pop(name, None)
+    finished_runs.get(namespace, {}).pop(name, None)
+    retry = run_retries.get(namespace, {}).pop(name, None)
+    if retry:
+        retry.cancel()
+
+
+def finish_run(namespace, name, body):
+    forget_run(namespace, name)
+    finished_runs.setdefault(namespace, {})[name] = body['metadata'].get('uid')
+
+
+def is_finished(namespace, name, body) -> bool:
+    return name in finished_runs.get(namespace, {}) and finished_runs[namespace][name] == body['metadata'].get('uid')
+
+
+def get_resource_version(body):
+    try:
+        return int(body['metadata']['resourceVersion'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
 
+def cache_run(namespace, name, body) -> bool:
+    """
+    Puts body of a run into the cache, unless the cached body is newer.
+    :return: True if the body has been cached
+    """
+    cached_body = runs.get(namespace, {}).get(name)
+    if cached_body:
+        resource_version, cached_resource_version = get_resource_version(body), get_resource_version(cached_body)
+        if resource_version is not None and cached_resource_version is not None and \
+                resource_version < cached_resource_version:
+            return False
+    runs.setdefault(namespace, {})[name] = body
+    return True
+
+
+def schedule_retry(namespace, name, logger):
+    """
+    Retries update of a run state after UPDATE_RETRY_DELAY seconds, as there may be no further events
+    of the run or its pods (e.g. when all of them have already finished).
+    """
+    retries = run_retries.setdefault(namespace, {})
+    if name in retries:
+        return
+
+    def retry():
+        retries.pop(name, None)
+        asyncio.ensure_future(update_run_state(namespace, name, logger))
+
+    retries[name] = asyncio.get_event_loop().call_later(UPDATE_RETRY_DELAY, retry)
+
+
+async def list_run_pods(logger) -> bool:
+    """
+    Puts pods of runs, existing before the operator started, into the cache, unless it has been done already.
+    :return: True if the cache of pods is filled
+    """
+    global pods_listed, pods_listing_lock
+    if pods_listed:
+        return True
+
+    if not pods_listing_lock:
+        pods_listing_lock = asyncio.Lock()
+
+    async with pods_listing_lock:
+        if pods_listed:
+            return True
 
-async def monitor_run(namespace, name, logger):
-    interval = 1
-    retry_counter = 0
-    retry_limit = 5
-    while True:
         try:
-            await asyncio.sleep(interval)
-            logger.debug(f'Monitoring Run {name}')
-            run: Run = await Run.get(name=name, namespace=namespace)
-
-            if run.state in {RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED}:
-                logger.info(f'Run {name} reached final state: {run.state.value}.')
-                if namespace in tasks and name in tasks[namespace]:
-                    del tasks[namespace][name]
-                return
-
-            state_to_set = await run.calculate_current_state()
-            if run.state is not state_to_set:
-                logger.warning(f'Run {name} state changed from {run.state.value} to {state_to_set.value}')
-                utc_timestamp = datetime.datetime.utcnow().replace(microsecond=0).isoformat()
-                if run.state is RunStatus.QUEUED:
-                    logger.info(f'Setting Run {name} start time.')
-                    run.start_timestamp = f'{utc_timestamp}Z'
-                if run.state in {RunStatus.QUEUED, RunStatus.RUNNING} and \
-                        state_to_set not in {RunStatus.QUEUED, RunStatus.RUNNING}:
-                    logger.info(f'Setting Run {name} end time.')
-                    run.end_timestamp = f'{utc_timestamp}Z'
-                run.state = state_to_set
-                await run.update()
-
-        except asyncio.CancelledError:
-            logger.info(f'Monitoring of Run {name} is cancelled')
-            if namespace in tasks and name in tasks[namespace]:
-                del tasks[namespace][name]
+            core_api = await K8SApiClient.get()
+            pods = await core_api.list_pod_for_all_namespaces(label_selector='runName')
+        except Exception:
+            logger.exception('Unexpected error encountered when listing pods of runs.')
+            return False
+
+        for pod in pods.items:
+            pod_namespace, pod_name = pod.metadata.namespace, pod.metadata.name
+            if (pod_namespace, pod_name) in pods_deleted_while_listing:
+                continue
+            # phases received in pod events are newer than the listed ones
+            run_pods.setdefault(pod_namespace, {}).setdefault(pod.metadata.labels['runName'], {}) \
+                .setdefault(pod_name, pod.status.phase)
+
+        pods_deleted_while_listing.clear()
+        pods_listed = True
+        return True
+
+
+async def update_run_state(namespace, name, logger):
+    if name not in runs.get(namespace, {}):
+        return
+
+    if not await list_run_pods(logger):
+        schedule_retry(namespace, name, logger)
+        return
+
+    # Lock is held until the update is sent, so the next state of the run is calculated from the stored one - e.g.
+    # start time of a run is never set twice, as bodies older than the cached one are not cached. Patches of one run
+    # are therefore not merged by the update queue.
+    async with run_locks.setdefault(namespace, {}).setdefault(name, asyncio.Lock()):
+        run_body = runs.get(namespace, {}).get(name)
+        if not run_body:
             return
+
+        run = Run.from_k8s_response_dict(copy.deepcopy(run_body))
+        pod_phases = list(run_pods.get(namespace, {}).get(name, {}).values())
+        if not pod_phases and run.state is RunStatus.RUNNING:
+            # events of pods of a running run may come later than events of the run, e.g. after their deletion
+            return
+
+        state_to_set = run.calculate_state_from_pod_phases(pod_phases)
+        if run.state is state_to_set:
+            return
+
+        logger.warning(f'Run {name} state changed from {run.state.value} to {state_to_set.value}')
+        utc_timestamp = datetime.datetime.utcnow().replace(microsecond=0).isoformat()
+        if run.state is RunStatus.QUEUED:
+            logger.info(f'Setting Run {name} start time.')
+            run.start_timestamp = f'{utc_timestamp}Z'
+        if run.state in {RunStatus.QUEUED, RunStatus.RUNNING} and \
+                state_to_set not in {RunStatus.QUEUED, RunStatus.RUNNING}:
+            logger.info(f'Setting Run {name} end time.')
+            run.end_timestamp = f'{utc_timestamp}Z'
+        run.state = state_to_set
+
+        try:
+            updated_run_body = await run.update_queued()
         except Exception:
-            logger.exception(f'Unexpected error encountered when monitoring Run {name}.')
-            retry_counter += 1
-            logger.exception(f'Monitoring attempt: #{retry_counter}, retry limit: #{retry_limit}.')
-            if retry_counter >= retry_limit:
-                raise
+            # cached run is left unchanged, so the update will be retried on the next event of the run or its pods,
+            # or after UPDATE_RETRY_DELAY seconds
+            logger.exception(f'Unexpected error encountered when updating state of Run {name}.')
+            schedule_retry(namespace, name, logger)
+            return
+
+        if state_to_set in FINAL_RUN_STATES:
+            logger.info(f'Run {name} reached final state: {state_to_set.value}.')
+            finish_run(namespace, name, run_body)
+        elif name in runs.get(namespace, {}):
+            cache_run(namespace, name, updated_run_body)
@@ -14,9 +14,11 @@
 # limitations under the License.
 #
 
+import asyncio
 import http
-from typing import Dict, List, Optional, TypeVar
+from typing import Dict, List, Optional, Set, Tuple, TypeVar
 import logging
+import time
 
 import dpath.util
 import yaml
@@ -246,18 +248,14 @@ class CustomResource:
             logger.exception(f'Failed to delete {self.__class__.__name__} {self.name}.')
             raise
 
-    async def update(self):
-        logger.debug(f'Updating {self.__class__.__name__} {self.name}.')
-        k8s_custom_object_api = await CustomResourceApiClient.get()
-
+    def _get_patch_body(self) -> dict:
         patch_body = {}
-        if self._fields_to_update:
-            for field in self._fields_to_update:
-                dpath.util.new(patch_body, field, dpath.util.get(self._body, field, separator='.'), separator='.')
-            logger.debug(f'Patch body for {self.__class__.__name__} {self.name}: {patch_body}')
-        else:
-            logger.debug(f'No fields were changed in {self.__class__.__name__} {self.name}, skipping update.')
-            return
+        for field in self._fields_to_update:
+            dpath.util.new(patch_body, field, dpath.util.get(self._body, field, separator='.'), separator='.')
+        return patch_body
+
+    async def patch(self, patch_body: dict):
+        k8s_custom_object_api = await CustomResourceApiClient.get()
         try:
             response = await k8s_custom_object_api.patch_namespaced_custom_object(group=self.api_group_name,
                                                                                   namespace=self.namespace,
@@ -265,8 +263,189 @@ class CustomResource:
                                                                                   plural=self.crd_plural_name,
                                                                                   version=self.crd_version,
                                                                                   name=self.name)
-            self._fields_to_update = set()  # Clear after successful update
             return response
         except ApiException:
             logger.exception(f'Failed to update {self.__class__.__name__} {self.name}.')
             raise
+
+    async def update(self):
+        logger.debug(f'Updating {self.__class__.__name__} {self.name}.')
+
+        if self._fields_to_update:
+            patch_body = self._get_patch_body()
+            logger.debug(f'Patch body for {self.__class__.__name__} {self.name}: {patch_body}')
+        else:
+            logger.debug(f'No fields were changed in {self.__class__.__name__} {self.name}, skipping update.')
+            return
+
+        response = await self.patch(patch_body)
+        self._fields_to_update = set()  # Clear after successful update
+        return response
+
+    async def update_queued(self):
+        """
+        Works like update(), but the patch is sent through CustomResourceUpdateQueue, which merges it with other
+        pending patches of the same object and limits the rate of requests sent to kubernetes API.
+        """
+        logger.debug(f'Queueing update of {self.__class__.__name__} {self.name}.')
+
+        if not self._fields_to_update:
+            logger.debug(f'No fields were changed in {self.__class__.__name__} {self.name}, skipping update.')
+            return
+
+        response = await CustomResourceUpdateQueue.get().enqueue(self, self._get_patch_body())
+        self._fields_to_update = set()  # Clear after successful update
+        return response
+
+
+def merge_patch_bodies(target: dict, source: dict):
+    """
+    Merges source patch body into target one, values from source take precedence.
+    """
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch_bodies(target[key], value)
+        else:
+            target[key] = value
+
+
+class TokenBucket:
+    """
+    Limits rate of operations to `rate` per second on average, allowing bursts of up to `capacity` operations.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if not self._lock:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PendingUpdate:
+    def __init__(self, resource: CustomResource, patch_body: dict, future: asyncio.Future):
+        self.resource = resource
+        self.patch_body = patch_body
+        self.future = future
+
+
+class CustomResourceUpdateQueue:
+    """
+    Queue of patches of custom resources. Patches are scheduled per object - each of the workers takes a pending
+    patch of one object, so at most `workers` patches are sent concurrently. Patches of the same object are sent
+    one at a time, in order, and patches enqueued before the previous one is sent are merged into one. Requests to
+    kubernetes API are rate limited with a token bucket and retried with exponential backoff when API server
+    responds with 429 Too Many Requests. Singleton instance of the queue is returned by get() class method.
+    """
+    DEFAULT_RATE = 20  # requests per second
+    DEFAULT_BURST = 50
+    DEFAULT_WORKERS = 5
+    MAX_ATTEMPTS = 5
+    TOO_MANY_REQUESTS_BACKOFF = 1  # seconds, doubled with every attempt
+
+    instance: 'CustomResourceUpdateQueue' = None
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, workers: int = DEFAULT_WORKERS):
+        self._token_bucket = TokenBucket(rate=rate, capacity=burst)
+        self._workers_count = workers
+        self._workers: List[asyncio.Task] = []
+        # keys of objects: (namespace, kind, name)
+        self._pending: Dict[Tuple[str, str, str], PendingUpdate] = {}
+        self._in_flight: Set[Tuple[str, str, str]] = set()
+        self._ready_objects: Optional[asyncio.Queue] = None
+
+    @classmethod
+    def get(cls) -> 'CustomResourceUpdateQueue':
+        if not cls.instance:
+            cls.instance = cls()
+        return cls.instance
+
+    def enqueue(self, resource: CustomResource, patch_body: dict) -> asyncio.Future:
+        """
+        Schedules patch of a given resource.
+        :return: future resolved with response of kubernetes API when patch is sent
+        """
+        self._start_workers()
+
+        key = (resource.namespace, resource.__class__.__name__, resource.name)
+        pending_update = self._pending.get(key)
+        if pending_update:
+            logger.debug(f'Merging patch of {resource.__class__.__name__} {resource.name} with a pending one.')
+            merge_patch_bodies(pending_update.patch_body, patch_body)
+        else:
+            pending_update = self._pending[key] = PendingUpdate(
+                resource=resource, patch_body=patch_body, future=asyncio.get_event_loop().create_future())
+            # patch of an object being sent is scheduled when sending of the previous one finishes
+            if key not in self._in_flight:
+                self._ready_objects.put_nowait(key)
+
+        return pending_update.future
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._in_flight = set()
+        self._ready_objects = None
+
+    def _start_workers(self):
+        if self._workers:
+            return
+
+        self._ready_objects = asyncio.Queue()
+        for key in self._pending:
+            self._ready_objects.put_nowait(key)
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self._workers_count)]
+
+    async def _work(self):
+        while True:
+            key = await self._ready_objects.get()
+            pending_update = self._pending.pop(key, None)
+            if not pending_update:
+                continue
+
+            self._in_flight.add(key)
+            try:
+                await self._send(pending_update)
+            finally:
+                self._in_flight.discard(key)
+                if key in self._pending:
+                    self._ready_objects.put_nowait(key)
+
+    async def _send(self, pending_update: PendingUpdate):
+        resource = pending_update.resource
+        for attempt in range(self.MAX_ATTEMPTS):
+            await self._token_bucket.acquire()
+            try:
+                response = await resource.patch(pending_update.patch_body)
+            except ApiException as e:
+                if e.status == http.HTTPStatus.TOO_MANY_REQUESTS and attempt < self.MAX_ATTEMPTS - 1:
+                    logger.warning(f'Too many requests when updating {resource.__class__.__name__} '
+                                   f'{resource.name}, retrying.')
+                    await asyncio.sleep(self.TOO_MANY_REQUESTS_BACKOFF * 2 ** attempt)
+                    continue
+                pending_update.future.set_exception(e)
+                return
+            except Exception as e:
+                pending_update.future.set_exception(e)
+                return
+
+            pending_update.future.set_result(response)
+            return
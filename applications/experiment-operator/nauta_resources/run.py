@@ -223,12 +223,21 @@ class Run(CustomResource):
 
         pods = await self.get_pods()
 
-        if pods and any(pod.status.phase == 'Failed' for pod in pods):
+        return self.calculate_state_from_pod_phases([pod.status.phase for pod in pods] if pods else [])
+
+    def calculate_state_from_pod_phases(self, pod_phases: List[str]) -> RunStatus:
+        """
+        Calculates state of the Run basing on phases of its pods, without contacting kubernetes API.
+        """
+        if self.state in {RunStatus.COMPLETE, RunStatus.FAILED, RunStatus.CANCELLED}:
+            return self.state
+
+        if pod_phases and any(phase == 'Failed' for phase in pod_phases):
             return RunStatus.FAILED
-        elif not pods or (pods and any(pod.status.phase in {'Pending', 'Unknown'} for pod in pods)
-                          and self.state is not RunStatus.RUNNING):
+        elif not pod_phases or (any(phase in {'Pending', 'Unknown'} for phase in pod_phases)
+                                and self.state is not RunStatus.RUNNING):
             return RunStatus.QUEUED
-        elif pods and all(pod.status.phase == 'Succeeded' for pod in pods):
+        elif all(phase == 'Succeeded' for phase in pod_phases):
             return RunStatus.COMPLETE
         else:
             return RunStatus.RUNNING
@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import copy
+import time
+
+import pytest
+from asynctest import CoroutineMock
+from kubernetes_asyncio.client.rest import ApiException
+
+from nauta_resources.platform_resource import CustomResourceUpdateQueue, TokenBucket, merge_patch_bodies
+from nauta_resources.run import Run, RunStatus
+
+
+@pytest.fixture()
+def patch_mock(mocker):
+    async def patch(resource, patch_body):
+        return {'name': resource.name, 'patch': copy.deepcopy(patch_body)}
+
+    return mocker.patch('nauta_resources.run.Run.patch', autospec=True, side_effect=patch)
+
+
+def make_run(name: str, namespace: str = 'namespace') -> Run:
+    return Run(name=name, namespace=namespace)
+
+
+def test_merge_patch_bodies():
+    target = {'spec': {'state': 'QUEUED', 'start-time': 'a'}}
+
+    merge_patch_bodies(target, {'spec': {'state': 'RUNNING', 'end-time': 'b'}})
+
+    assert target == {'spec': {'state': 'RUNNING', 'start-time': 'a', 'end-time': 'b'}}
+
+
+@pytest.mark.asyncio
+async def test_update_queue_merges_patches_of_the_same_object(patch_mock):
+    queue = CustomResourceUpdateQueue()
+
+    try:
+        first_future = queue.enqueue(make_run('run-1'), {'spec': {'state': 'QUEUED'}})
+        second_future = queue.enqueue(make_run('run-1'), {'spec': {'state': 'RUNNING', 'start-time': 'a'}})
+        other_future = queue.enqueue(make_run('run-2'), {'spec': {'state': 'FAILED'}})
+
+        responses = await asyncio.gather(first_future, second_future, other_future)
+    finally:
+        await queue.stop()
+
+    assert patch_mock.call_count == 2
+    assert responses[0] == responses[1] == {'name': 'run-1',
+                                            'patch': {'spec': {'state': 'RUNNING', 'start-time': 'a'}}}
+    assert responses[2] == {'name': 'run-2', 'patch': {'spec': {'state': 'FAILED'}}}
+
+
+@pytest.mark.asyncio
+async def test_update_queue_sends_patches_of_one_namespace_concurrently(mocker):
+    in_flight = []
+    max_in_flight = 0
+
+    async def patch(resource, patch_body):
+        nonlocal max_in_flight
+        in_flight.append(resource.name)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(resource.name)
+
+    mocker.patch('nauta_resources.run.Run.patch', autospec=True, side_effect=patch)
+    queue = CustomResourceUpdateQueue(workers=3)
+
+    try:
+        await asyncio.gather(*[queue.enqueue(make_run(f'run-{i}'), {'spec': {'state': 'RUNNING'}}) for i in range(6)])
+    finally:
+        await queue.stop()
+
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_update_queue_serializes_patches_of_the_same_object(mocker):
+    sent_patches = []
+    first_patch_started = asyncio.Event()
+
+    async def patch(resource, patch_body):
+        first_patch_started.set()
+        sent_patches.append(copy.deepcopy(patch_body))
+        await asyncio.sleep(0.01)
+        return len(sent_patches)
+
+    mocker.patch('nauta_resources.run.Run.patch', autospec=True, side_effect=patch)
+    queue = CustomResourceUpdateQueue()
+
+    try:
+        first_future = queue.enqueue(make_run('run-1'), {'spec': {'state': 'RUNNING'}})
+        await first_patch_started.wait()
+        # enqueued while the first patch is being sent - merged and sent after it
+        second_future = queue.enqueue(make_run('run-1'), {'spec': {'state': 'COMPLETE'}})
+        third_future = queue.enqueue(make_run('run-1'), {'spec': {'end-time': 'b'}})
+
+        responses = await asyncio.gather(first_future, second_future, third_future)
+    finally:
+        await queue.stop()
+
+    assert responses == [1, 2, 2]
+    assert sent_patches == [{'spec': {'state': 'RUNNING'}}, {'spec': {'state': 'COMPLETE', 'end-time': 'b'}}]
+
+
+@pytest.mark.asyncio
+async def test_update_queued_clears_fields_to_update(patch_mock):
+    run = make_run('run-1')
+    run.state = RunStatus.RUNNING
+
+    try:
+        response = await run.update_queued()
+        assert await run.update_queued() is None
+    finally:
+        await CustomResourceUpdateQueue.get().stop()
+        CustomResourceUpdateQueue.instance = None
+
+    assert response == {'name': 'run-1', 'patch': {'spec': {'state': 'RUNNING'}}}
+    assert patch_mock.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_update_queue_retries_too_many_requests(mocker):
+    patch_mock = mocker.patch('nauta_resources.run.Run.patch',
+                              new=CoroutineMock(side_effect=[ApiException(status=429), {'patched': True}]))
+    mocker.patch.object(CustomResourceUpdateQueue, 'TOO_MANY_REQUESTS_BACKOFF', 0)
+    queue = CustomResourceUpdateQueue()
+
+    try:
+        response = await queue.enqueue(make_run('run-1'), {'spec': {'state': 'RUNNING'}})
+    finally:
+        await queue.stop()
+
+    assert response == {'patched': True}
+    assert patch_mock.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_update_queue_propagates_errors(mocker):
+    mocker.patch('nauta_resources.run.Run.patch', new=CoroutineMock(side_effect=ApiException(status=500)))
+    queue = CustomResourceUpdateQueue()
+
+    try:
+        with pytest.raises(ApiException):
+            await queue.enqueue(make_run('run-1'), {'spec': {'state': 'RUNNING'}})
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    token_bucket = TokenBucket(rate=50, capacity=2)
+
+    start = time.monotonic()
+    for _ in range(4):
+        await token_bucket.acquire()
+
+    # Two tokens are available immediately, each of the remaining ones is refilled after 1/50 s
+    assert time.monotonic() - start >= 0.035
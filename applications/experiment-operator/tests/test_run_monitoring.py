@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+from asynctest import CoroutineMock
+from kubernetes_asyncio.client import V1ObjectMeta, V1Pod, V1PodList, V1PodStatus
+
+from nauta_resources.run import Run, RunStatus
+
+with patch('pykube.KubeConfig'), patch('pykube.HTTPClient'):
+    import nauta_operator
+
+
+RUN_NAME = 'test-run'
+NAMESPACE = 'test-namespace'
+
+
+def run_body(state: RunStatus, resource_version: str = None, uid: str = None) -> dict:
+    metadata = {'name': RUN_NAME, 'namespace': NAMESPACE}
+    if resource_version:
+        metadata['resourceVersion'] = resource_version
+    if uid:
+        metadata['uid'] = uid
+    return {'apiVersion': 'aipg.intel.com/v1', 'kind': 'Run', 'metadata': metadata,
+            'spec': {'name': RUN_NAME, 'state': state.value}}
+
+
+def pod_event_kwargs(event_type: str, pod_name: str, phase: str) -> dict:
+    return {'event': {'type': event_type}, 'meta': {'name': pod_name, 'labels': {'runName': RUN_NAME}},
+            'status': {'phase': phase}, 'namespace': NAMESPACE, 'name': pod_name, 'logger': MagicMock()}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(mocker):
+    nauta_operator.runs.clear()
+    nauta_operator.run_pods.clear()
+    nauta_operator.run_locks.clear()
+    nauta_operator.run_retries.clear()
+    nauta_operator.finished_runs.clear()
+    mocker.patch.object(nauta_operator, 'pods_listed', True)
+    mocker.patch.object(nauta_operator, 'pods_listing_lock', None)
+
+
+@pytest.fixture()
+def update_mock(mocker):
+    async def update(run: Run):
+        return run._body
+
+    return mocker.patch('nauta_resources.run.Run.update_queued', autospec=True, side_effect=update)
+
+
+@pytest.mark.asyncio
+async def test_run_state_updated_only_on_transitions(update_mock):
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.QUEUED), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+    assert update_mock.call_count == 0
+
+    await nauta_operator.pod_event(**pod_event_kwargs('ADDED', 'pod-1', 'Pending'))
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Pending'))
+    assert update_mock.call_count == 0
+
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Running'))
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Running'))
+    assert update_mock.call_count == 1
+    updated_run = update_mock.call_args[0][0]
+    assert updated_run.state is RunStatus.RUNNING
+    assert updated_run.start_timestamp
+
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Succeeded'))
+    assert update_mock.call_count == 2
+    updated_run = update_mock.call_args[0][0]
+    assert updated_run.state is RunStatus.COMPLETE
+    assert updated_run.end_timestamp
+    assert RUN_NAME not in nauta_operator.runs.get(NAMESPACE, {})
+
+
+@pytest.mark.asyncio
+async def test_run_without_pods_is_queued(update_mock):
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.CREATING), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+
+    assert update_mock.call_count == 1
+    assert update_mock.call_args[0][0].state is RunStatus.QUEUED
+
+
+@pytest.mark.asyncio
+async def test_failed_update_is_retried(mocker):
+    update_mock = mocker.patch('nauta_resources.run.Run.update_queued', new=CoroutineMock(side_effect=RuntimeError))
+    nauta_operator.runs[NAMESPACE] = {RUN_NAME: run_body(RunStatus.QUEUED)}
+
+    await nauta_operator.pod_event(**pod_event_kwargs('ADDED', 'pod-1', 'Running'))
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Running'))
+
+    assert update_mock.call_count == 2
+    assert nauta_operator.runs[NAMESPACE][RUN_NAME]['spec']['state'] == RunStatus.QUEUED.value
+    nauta_operator.forget_run(NAMESPACE, RUN_NAME)
+
+
+@pytest.mark.asyncio
+async def test_failed_update_is_retried_without_events(mocker):
+    mocker.patch.object(nauta_operator, 'UPDATE_RETRY_DELAY', 0)
+    update_mock = mocker.patch('nauta_resources.run.Run.update_queued',
+                               new=CoroutineMock(side_effect=[RuntimeError, run_body(RunStatus.COMPLETE)]))
+    nauta_operator.runs[NAMESPACE] = {RUN_NAME: run_body(RunStatus.RUNNING)}
+
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Succeeded'))
+    assert RUN_NAME in nauta_operator.run_retries[NAMESPACE]
+
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+    assert update_mock.call_count == 2
+    assert RUN_NAME not in nauta_operator.runs[NAMESPACE]
+    assert not nauta_operator.run_retries[NAMESPACE]
+
+
+@pytest.mark.asyncio
+async def test_run_state_calculated_after_pods_listed(mocker, update_mock):
+    mocker.patch.object(nauta_operator, 'pods_listed', False)
+    core_api = MagicMock(list_pod_for_all_namespaces=CoroutineMock(side_effect=[RuntimeError, V1PodList(items=[
+        V1Pod(metadata=V1ObjectMeta(name=name, namespace=NAMESPACE, labels={'runName': RUN_NAME}),
+              status=V1PodStatus(phase='Running')) for name in ('pod-1', 'pod-2')
+    ])]))
+    mocker.patch('nauta_operator.K8SApiClient.get', new=CoroutineMock(return_value=core_api))
+    mocker.patch.object(nauta_operator, 'UPDATE_RETRY_DELAY', 60)
+
+    # listing of pods failed - state of the run is not changed to QUEUED although no pods of the run are known
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.RUNNING), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+    assert update_mock.call_count == 0
+    assert RUN_NAME in nauta_operator.run_retries[NAMESPACE]
+
+    await nauta_operator.pod_event(**pod_event_kwargs('DELETED', 'pod-2', 'Running'))
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.RUNNING), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+
+    assert update_mock.call_count == 0
+    assert nauta_operator.pods_listed
+    assert nauta_operator.run_pods[NAMESPACE][RUN_NAME] == {'pod-1': 'Running'}
+    nauta_operator.forget_run(NAMESPACE, RUN_NAME)
+
+
+@pytest.mark.asyncio
+async def test_final_and_deleted_runs_are_not_tracked(update_mock):
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.CANCELLED), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+    await nauta_operator.pod_event(**pod_event_kwargs('ADDED', 'pod-1', 'Failed'))
+    assert update_mock.call_count == 0
+
+    nauta_operator.runs[NAMESPACE] = {RUN_NAME: run_body(RunStatus.RUNNING)}
+    await nauta_operator.run_event(event={'type': 'DELETED'}, body=run_body(RunStatus.RUNNING), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+    assert RUN_NAME not in nauta_operator.runs[NAMESPACE]
+    assert RUN_NAME not in nauta_operator.run_pods[NAMESPACE]
+
+    await nauta_operator.pod_event(**pod_event_kwargs('DELETED', 'pod-1', 'Failed'))
+    assert RUN_NAME not in nauta_operator.run_pods[NAMESPACE]
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_run_events(update_mock):
+    await nauta_operator.run_event(event={'type': 'ADDED'}, body=run_body(RunStatus.QUEUED, '1', uid='uid-1'),
+                                   namespace=NAMESPACE, name=RUN_NAME, logger=MagicMock())
+    await nauta_operator.pod_event(**pod_event_kwargs('ADDED', 'pod-1', 'Running'))
+    assert update_mock.call_args[0][0].state is RunStatus.RUNNING
+    nauta_operator.runs[NAMESPACE][RUN_NAME]['metadata']['resourceVersion'] = '3'
+
+    # event older than the cached body of the run
+    await nauta_operator.run_event(event={'type': 'MODIFIED'}, body=run_body(RunStatus.QUEUED, '2', uid='uid-1'),
+                                   namespace=NAMESPACE, name=RUN_NAME, logger=MagicMock())
+    assert update_mock.call_count == 1
+    assert nauta_operator.runs[NAMESPACE][RUN_NAME]['spec']['state'] == RunStatus.RUNNING.value
+
+    await nauta_operator.pod_event(**pod_event_kwargs('MODIFIED', 'pod-1', 'Succeeded'))
+    assert update_mock.call_args[0][0].state is RunStatus.COMPLETE
+    assert update_mock.call_count == 2
+
+    # event sent before the run was patched to the final state, delivered after the pod was deleted
+    await nauta_operator.pod_event(**pod_event_kwargs('DELETED', 'pod-1', 'Succeeded'))
+    await nauta_operator.run_event(event={'type': 'MODIFIED'}, body=run_body(RunStatus.RUNNING, '3', uid='uid-1'),
+                                   namespace=NAMESPACE, name=RUN_NAME, logger=MagicMock())
+    assert update_mock.call_count == 2
+    assert RUN_NAME not in nauta_operator.runs[NAMESPACE]
+
+    # run with the same name created again is tracked
+    await nauta_operator.run_event(event={'type': 'ADDED'}, body=run_body(RunStatus.QUEUED, '5', uid='uid-2'),
+                                   namespace=NAMESPACE, name=RUN_NAME, logger=MagicMock())
+    assert RUN_NAME in nauta_operator.runs[NAMESPACE]
+    assert RUN_NAME not in nauta_operator.finished_runs[NAMESPACE]
+    nauta_operator.forget_run(NAMESPACE, RUN_NAME)
+
+
+@pytest.mark.asyncio
+async def test_running_run_without_known_pods_is_not_queued(update_mock):
+    await nauta_operator.run_event(event={'type': None}, body=run_body(RunStatus.RUNNING), namespace=NAMESPACE,
+                                   name=RUN_NAME, logger=MagicMock())
+
+    assert update_mock.call_count == 0
+    nauta_operator.forget_run(NAMESPACE, RUN_NAME)
@@ -0,0 +1,35 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+from benchmarks.run_monitoring import run_benchmark
+from nauta_resources.platform_resource import CustomResourceUpdateQueue
+
+
+@pytest.mark.asyncio
+async def test_run_monitoring_benchmark():
+    result = await run_benchmark(runs_count=50, pods_per_run=3, api_rate=1000, api_burst=100, seed=1)
+
+    # Every run finishes and its state is patched at most twice (QUEUED -> RUNNING -> final state), without
+    # listing pods or reading runs from kubernetes API
+    assert sum(result.final_states.values()) == 50
+    assert set(result.final_states) <= {'COMPLETE', 'FAILED'}
+    assert set(result.api_calls) == {'patch_namespaced_custom_object'}
+    assert result.api_calls['patch_namespaced_custom_object'] <= 2 * 50
+    assert len(result.latencies) == result.api_calls_count
+    assert 0 < result.memory_per_run < 16 * 1024
+    assert CustomResourceUpdateQueue.instance is None
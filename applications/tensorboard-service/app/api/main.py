@@ -17,11 +17,18 @@
 from http import HTTPStatus
 import json
 import logging as log
+import os
+import threading
+import time
+from typing import Optional
 
-from flask import Flask, request
+from flask import Flask, Response, g, request
 
 from tensorboard.tensorboard import TensorboardManager
-from api.models import TensorboardCreationRequestBody, TensorboardResponse, TensorboardResponsePreconditionFailed
+from api.metrics import LatencyHistogram
+from api.models import TensorboardCreationRequestBody, TensorboardResponse, TensorboardResponsePreconditionFailed, \
+    SummaryRequestBody, SummaryResponse
+from summaries.scalars import SummaryStore
 
 log.basicConfig(level=log.DEBUG)
 
@@ -30,6 +37,37 @@ app = Flask(__name__)
 # TODO: change to decorator
 CONTENT_TYPE_SLUG = {'Content-Type': 'application/json'}
 
+# manager (and kubernetes API clients it holds) is created once per worker process and reused by all requests
+tensorboard_manager: Optional[TensorboardManager] = None
+tensorboard_manager_lock = threading.Lock()
+
+request_latency = LatencyHistogram('tensorboard_service_request_duration_seconds')
+
+# summaries are kept after a restart only if SUMMARY_CACHE_DIR is placed on a volume (as in the helm chart)
+summary_store = SummaryStore(output_dir=TensorboardManager.OUTPUT_PUBLIC_MOUNT_PATH,
+                             cache_dir=os.environ.get('SUMMARY_CACHE_DIR', '/tmp/tensorboard-summaries'))
+
+
+def get_tensorboard_manager() -> TensorboardManager:
+    global tensorboard_manager
+    with tensorboard_manager_lock:
+        if tensorboard_manager is None:
+            tensorboard_manager = TensorboardManager.incluster_init()
+        return tensorboard_manager
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.monotonic()
+
+
+@app.after_request
+def observe_request_latency(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    request_latency.observe(method=request.method, endpoint=endpoint, status=response.status_code,
+                            latency=time.monotonic() - g.request_start)
+    return response
+
 
 def _generate_error_response(error_code: HTTPStatus, message: str) -> (str, HTTPStatus, dict):
     response = {
@@ -56,7 +94,7 @@ def create():
     except (KeyError, TypeError):
         return _generate_error_response(HTTPStatus.BAD_REQUEST, 'incorrect request body!')
 
-    tensb_mgr = TensorboardManager.incluster_init()
+    tensb_mgr = get_tensorboard_manager()
 
     valid_runs, invalid_runs = tensb_mgr.validate_runs(request_body.run_names)
 
@@ -88,7 +126,7 @@ def create():
 
 @app.route('/tensorboard/<id>', methods=['GET'])
 def get(id: str):
-    tensb_mgr = TensorboardManager.incluster_init()
+    tensb_mgr = get_tensorboard_manager()
 
     current_tensorboard_instance = tensb_mgr.get_by_id(id)
 
@@ -96,3 +134,32 @@ def get(id: str):
         return _generate_error_response(HTTPStatus.NOT_FOUND, 'Tensorboard instance with provided id does not exist.')
 
     return json.dumps(current_tensorboard_instance.to_dict()), CONTENT_TYPE_SLUG
+
+
+@app.route('/summary', methods=['POST'])
+def summary():
+    request_json_body = request.get_json(force=True)
+
+    try:
+        request_body = SummaryRequestBody.from_dict(request_json_body)
+    except (KeyError, TypeError):
+        return _generate_error_response(HTTPStatus.BAD_REQUEST, 'incorrect request body!')
+
+    if len(request_body.run_names) < 1:
+        return _generate_error_response(HTTPStatus.BAD_REQUEST, 'at least 1 run name is needed!')
+
+    unsafe_runs = [run for run in request_body.run_names
+                   if any(not part or part in {'.', '..'} or '/' in part for part in (run.owner, run.name))]
+    valid_runs, invalid_runs = TensorboardManager.validate_runs([run for run in request_body.run_names
+                                                                 if run not in unsafe_runs])
+
+    response = SummaryResponse(summaries=[(run, summary_store.get(owner=run.owner, name=run.name))
+                                          for run in valid_runs],
+                               tags=request_body.tags, invalid_runs=unsafe_runs + invalid_runs)
+
+    return json.dumps(response.to_dict()), HTTPStatus.OK, CONTENT_TYPE_SLUG
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(request_latency.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,58 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from bisect import bisect_left
+import threading
+from typing import Dict, List, Tuple
+
+# upper bounds of histogram buckets, in seconds
+DEFAULT_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class LatencyHistogram:
+    """
+    Cumulative histogram of request latencies, labelled by method, endpoint and status code and rendered
+    in Prometheus text exposition format. Note that each API worker process keeps its own histogram.
+    """
+
+    def __init__(self, name: str, buckets: List[float] = None):
+        self.name = name
+        self.buckets = sorted(buckets or DEFAULT_LATENCY_BUCKETS)
+        self._lock = threading.Lock()
+        # (method, endpoint, status): [counts of buckets..., count of +Inf bucket, sum of latencies]
+        self._series: Dict[Tuple[str, str, int], List[float]] = {}
+
+    def observe(self, method: str, endpoint: str, status: int, latency: float):
+        with self._lock:
+            series = self._series.setdefault((method, endpoint, status), [0] * (len(self.buckets) + 2))
+            series[bisect_left(self.buckets, latency)] += 1
+            series[-1] += latency
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} Latency of API requests in seconds.', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = sorted((labels, list(series)) for labels, series in self._series.items())
+
+        for (method, endpoint, status), series in series_items:
+            labels = f'method="{method}",endpoint="{endpoint}",status="{status}"'
+            cumulative_count = 0
+            for upper_bound, count in zip(self.buckets + ['+Inf'], series[:-1]):
+                cumulative_count += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{upper_bound}"}} {cumulative_count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative_count}')
+
+        return '\n'.join(lines) + '\n'
@@ -14,8 +14,9 @@
 # limitations under the License.
 #
 
-from typing import List
+from typing import List, Optional, Tuple
 
+from summaries.scalars import RunSummary
 from tensorboard.tensorboard import Tensorboard
 from tensorboard.models import Run, TensorboardStatus
 
@@ -83,3 +84,43 @@ class TensorboardResponsePreconditionFailed:
         initial['invalidRuns'] = invalid_runs_dict
 
         return initial
+
+
+class SummaryRequestBody:
+    def __init__(self, run_names: List[Run], tags: Optional[List[str]] = None):
+        self.run_names = run_names
+        self.tags = tags
+
+    @classmethod
+    def from_dict(cls, body):
+        runs = [Run(name=json_run['name'], owner=json_run['owner']) for json_run in body['runNames']]
+        tags = body.get('tags')
+        if tags is not None and not all(isinstance(tag, str) for tag in tags):
+            raise TypeError('tags have to be strings')
+
+        return cls(run_names=runs, tags=tags)
+
+
+class SummaryResponse:
+    def __init__(self, summaries: List[Tuple[Run, RunSummary]], tags: Optional[List[str]] = None,
+                 invalid_runs: List[Run] = None):
+        self.summaries = summaries
+        self.tags = tags
+        self.invalid_runs = invalid_runs
+
+    def to_dict(self):
+        runs = []
+        for run, summary in self.summaries:
+            run_dict = run.to_dict()
+            run_dict['scalars'] = {tag: series.to_dict() for tag, series in sorted(summary.series.items())
+                                   if self.tags is None or tag in self.tags}
+            runs.append(run_dict)
+
+        summary_dict = {
+            'runs': runs
+        }
+
+        if self.invalid_runs:
+            summary_dict['invalidRuns'] = [run.to_dict() for run in self.invalid_runs]
+
+        return summary_dict
@@ -23,11 +23,15 @@ import pytest
 from pytest_mock import MockFixture
 
 import api.main
+from api.metrics import LatencyHistogram
+from summaries.scalars import RunSummary, ScalarSeries
 from tensorboard.models import Tensorboard, TensorboardStatus
 
 
 @pytest.fixture
-def flask_client():
+def flask_client(mocker):
+    mocker.patch.object(api.main, 'tensorboard_manager', None)
+    mocker.patch.object(api.main, 'request_latency', LatencyHistogram('test_request_duration_seconds'))
     client = api.main.app.test_client()
     yield client
 
@@ -252,3 +256,87 @@ def test_create_partial_invalid_runs(mocker: MockFixture, flask_client: FlaskCli
     assert response_body_json['status'] == 'CREATING'
     assert response_body_json['url'] == fake_tensorboard_url
     assert response_body_json['invalidRuns'] == [request_body['runNames'][2]]
+
+
+# noinspection PyShadowingNames
+def test_summary(mocker: MockFixture, flask_client: FlaskClient):
+    tensorboard_mgr = MagicMock(validate_runs=lambda runs: ([runs[0]], [runs[1]]))
+    mocker.patch.object(api.main, 'TensorboardManager', new=tensorboard_mgr)
+    run_summary = RunSummary(max_points=10)
+    run_summary.series['loss'] = ScalarSeries(max_points=10)
+    run_summary.series['loss'].add(step=1, wall_time=1000.0, value=0.5)
+    run_summary.series['accuracy'] = ScalarSeries(max_points=10)
+    run_summary.series['accuracy'].add(step=1, wall_time=1000.0, value=0.75)
+    fake_summary_store = mocker.patch.object(api.main, 'summary_store')
+    fake_summary_store.get.return_value = run_summary
+    request_body = {
+        'runNames': [
+            {
+                'name': 'run-name-1',
+                'owner': 'carl'
+            },
+            {
+                'name': 'training-p-18-07-11-17-31-13',
+                'owner': 'jay'
+            },
+            {
+                'name': '..',
+                'owner': 'jay'
+            }
+        ],
+        'tags': ['loss']
+    }
+
+    response = flask_client.post('/summary', data=json.dumps(request_body))
+
+    assert response.status_code == HTTPStatus.OK
+    fake_summary_store.get.assert_called_once_with(owner='carl', name='run-name-1')
+    assert json.loads(response.data.decode('utf-8')) == {
+        'runs': [
+            {
+                'name': 'run-name-1',
+                'owner': 'carl',
+                'scalars': {
+                    'loss': {'steps': [1], 'wallTimes': [1000.0], 'values': [0.5]}
+                }
+            }
+        ],
+        'invalidRuns': [request_body['runNames'][2], request_body['runNames'][1]]
+    }
+
+
+@pytest.mark.parametrize('request_body', [{}, {'runNames': []}, {'runNames': [{'name': 'run'}]},
+                                          {'runNames': [{'name': 'run', 'owner': 'carl'}], 'tags': [1]}])
+# noinspection PyShadowingNames
+def test_summary_bad_request(flask_client: FlaskClient, request_body: dict):
+    response = flask_client.post('/summary', data=json.dumps(request_body))
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+# noinspection PyShadowingNames
+def test_tensorboard_manager_reused(mocker: MockFixture, flask_client: FlaskClient):
+    tensorboard_mgr = MagicMock()
+    tensorboard_mgr.incluster_init.return_value.get_by_id.return_value = Tensorboard(id='fake-id')
+    mocker.patch.object(api.main, 'TensorboardManager', new=tensorboard_mgr)
+
+    flask_client.get('/tensorboard/fake-id')
+    flask_client.get('/tensorboard/fake-id')
+
+    assert tensorboard_mgr.incluster_init.call_count == 1
+
+
+# noinspection PyShadowingNames
+def test_metrics(mocker: MockFixture, flask_client: FlaskClient):
+    tensorboard_mgr = MagicMock()
+    tensorboard_mgr.incluster_init.return_value.get_by_id.return_value = None
+    mocker.patch.object(api.main, 'TensorboardManager', new=tensorboard_mgr)
+
+    flask_client.get('/tensorboard/fake-id')
+    response = flask_client.get('/metrics')
+
+    metrics = response.data.decode('utf-8')
+    assert response.status_code == HTTPStatus.OK
+    assert 'test_request_duration_seconds_bucket{method="GET",endpoint="/tensorboard/<id>",status="404",' \
+           'le="+Inf"} 1' in metrics
+    assert 'test_request_duration_seconds_count{method="GET",endpoint="/tensorboard/<id>",status="404"} 1' in metrics
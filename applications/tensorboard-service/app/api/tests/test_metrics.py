@@ -0,0 +1,42 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from api.metrics import LatencyHistogram
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram('fake_duration_seconds', buckets=[0.1, 1.0])
+
+    histogram.observe(method='GET', endpoint='/fake', status=200, latency=0.05)
+    histogram.observe(method='GET', endpoint='/fake', status=200, latency=0.1)
+    histogram.observe(method='GET', endpoint='/fake', status=200, latency=0.5)
+    histogram.observe(method='GET', endpoint='/fake', status=200, latency=2.0)
+    histogram.observe(method='POST', endpoint='/fake', status=202, latency=0.5)
+
+    assert histogram.render().splitlines() == [
+        '# HELP fake_duration_seconds Latency of API requests in seconds.',
+        '# TYPE fake_duration_seconds histogram',
+        'fake_duration_seconds_bucket{method="GET",endpoint="/fake",status="200",le="0.1"} 2',
+        'fake_duration_seconds_bucket{method="GET",endpoint="/fake",status="200",le="1.0"} 3',
+        'fake_duration_seconds_bucket{method="GET",endpoint="/fake",status="200",le="+Inf"} 4',
+        'fake_duration_seconds_sum{method="GET",endpoint="/fake",status="200"} 2.65',
+        'fake_duration_seconds_count{method="GET",endpoint="/fake",status="200"} 4',
+        'fake_duration_seconds_bucket{method="POST",endpoint="/fake",status="202",le="0.1"} 0',
+        'fake_duration_seconds_bucket{method="POST",endpoint="/fake",status="202",le="1.0"} 1',
+        'fake_duration_seconds_bucket{method="POST",endpoint="/fake",status="202",le="+Inf"} 1',
+        'fake_duration_seconds_sum{method="POST",endpoint="/fake",status="202"} 0.5',
+        'fake_duration_seconds_count{method="POST",endpoint="/fake",status="202"} 1',
+    ]
@@ -24,9 +24,13 @@ log.basicConfig(level=log.DEBUG)
 
 log.debug('daemon started!')
 
-mgr = TensorboardManager.incluster_init()
+mgr = TensorboardManager.incluster_init(with_index=False)
 
 while True:
     mgr.delete_garbage()
+    try:
+        mgr.fill_pool()
+    except Exception:
+        log.exception('failed to fill pool of tensorboards')
     log.debug('sleeping for 5 seconds...')
     sleep(5)
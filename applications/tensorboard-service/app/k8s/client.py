@@ -36,10 +36,12 @@ class K8SPodPhase(Enum):
 
 class K8SAPIClient:
     def __init__(self):
-        self.apps_api_client = client.AppsV1Api()
-        self.extensions_v1beta1_api_client = client.ExtensionsV1beta1Api()
-        self.v1_api_client = client.CoreV1Api()
-        self.custom_objects_client = client.CustomObjectsApi()
+        # all APIs share one ApiClient, and so one pool of connections to kubernetes API server
+        api_client = client.ApiClient()
+        self.apps_api_client = client.AppsV1Api(api_client)
+        self.extensions_v1beta1_api_client = client.ExtensionsV1beta1Api(api_client)
+        self.v1_api_client = client.CoreV1Api(api_client)
+        self.custom_objects_client = client.CustomObjectsApi(api_client)
 
     def create_deployment(self, namespace: str, body: V1Deployment, **kwargs):
         self.apps_api_client.create_namespaced_deployment(namespace=namespace, body=body, **kwargs)
@@ -64,6 +66,9 @@ class K8SAPIClient:
 
         return deployment
 
+    def patch_deployment(self, name: str, namespace: str, body: dict, **kwargs) -> V1Deployment:
+        return self.apps_api_client.patch_namespaced_deployment(name=name, namespace=namespace, body=body, **kwargs)
+
     def delete_deployment(self, name: str, namespace: str, **kwargs):
         self.apps_api_client.delete_namespaced_deployment(name=name, namespace=namespace, body=V1DeleteOptions(),
                                                           **kwargs)
@@ -0,0 +1,149 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging as log
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from kubernetes import watch
+
+from k8s.client import K8SAPIClient
+
+
+class ResourceIndex:
+    """
+    In-memory cache of kubernetes objects of one kind, filled by list and kept up to date by a watch running in
+    a background thread. Objects are indexed by values of given labels.
+    """
+    WATCH_TIMEOUT = 300  # seconds, objects are re-listed after that time
+    RETRY_DELAY = 5  # seconds
+
+    def __init__(self, kind: str, list_func: Callable, namespace: str, label_selector: str,
+                 index_labels: List[str]):
+        self.kind = kind
+        self._list_func = list_func
+        self._namespace = namespace
+        self._label_selector = label_selector
+        self._lock = threading.Lock()
+        self._objects: Dict[str, object] = {}
+        # label: {label value: {object name: object}}
+        self._indices: Dict[str, Dict[str, Dict[str, object]]] = {label: {} for label in index_labels}
+        self._synced = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def get(self, label: str, value: str) -> Optional[object]:
+        with self._lock:
+            objects = self._indices[label].get(value)
+            return next(iter(objects.values())) if objects else None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'{self.kind}-informer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._list_and_watch()
+            except Exception:
+                self._synced.clear()
+                log.exception(f'Failed to watch {self.kind}, retrying in {self.RETRY_DELAY}s.')
+                time.sleep(self.RETRY_DELAY)
+
+    def _list_and_watch(self):
+        object_list = self._list_func(namespace=self._namespace, label_selector=self._label_selector)
+        self._replace(object_list.items)
+        self._synced.set()
+
+        for event in watch.Watch().stream(self._list_func, namespace=self._namespace,
+                                          label_selector=self._label_selector,
+                                          resource_version=object_list.metadata.resource_version,
+                                          timeout_seconds=self.WATCH_TIMEOUT):
+            if event['type'] == 'ERROR':
+                # e.g. resource version is too old - objects have to be listed again
+                log.debug(f'Watch of {self.kind} returned an error: {event["object"]}')
+                return
+            elif event['type'] == 'DELETED':
+                self._remove(event['object'].metadata.name)
+            else:
+                self._add(event['object'])
+
+    def _replace(self, objects: List[object]):
+        with self._lock:
+            self._objects = {}
+            self._indices = {label: {} for label in self._indices}
+            for k8s_object in objects:
+                self._add_unlocked(k8s_object)
+
+    def _add(self, k8s_object):
+        with self._lock:
+            self._remove_unlocked(k8s_object.metadata.name)
+            self._add_unlocked(k8s_object)
+
+    def _remove(self, name: str):
+        with self._lock:
+            self._remove_unlocked(name)
+
+    def _add_unlocked(self, k8s_object):
+        name = k8s_object.metadata.name
+        labels = k8s_object.metadata.labels or {}
+        self._objects[name] = k8s_object
+        for label, index in self._indices.items():
+            if label in labels:
+                index.setdefault(labels[label], {})[name] = k8s_object
+
+    def _remove_unlocked(self, name: str):
+        k8s_object = self._objects.pop(name, None)
+        if not k8s_object:
+            return
+        labels = k8s_object.metadata.labels or {}
+        for label, index in self._indices.items():
+            objects = index.get(labels.get(label))
+            if objects:
+                objects.pop(name, None)
+                if not objects:
+                    del index[labels[label]]
+
+
+class TensorboardIndex:
+    """
+    Watch-fed index of deployments, ingresses and pods of TensorBoard instances, keyed by their id and runs-hash.
+    """
+    LABEL_SELECTOR = 'type=nauta-tensorboard'
+
+    def __init__(self, namespace: str, api_client: K8SAPIClient):
+        self.deployments = ResourceIndex('deployments', api_client.apps_api_client.list_namespaced_deployment,
+                                         namespace=namespace, label_selector=self.LABEL_SELECTOR,
+                                         index_labels=['id', 'runs-hash'])
+        self.ingresses = ResourceIndex('ingresses', api_client.extensions_v1beta1_api_client.list_namespaced_ingress,
+                                       namespace=namespace, label_selector=self.LABEL_SELECTOR, index_labels=['id'])
+        self.pods = ResourceIndex('pods', api_client.v1_api_client.list_namespaced_pod,
+                                  namespace=namespace, label_selector=self.LABEL_SELECTOR, index_labels=['id'])
+
+    @property
+    def synced(self) -> bool:
+        return self.deployments.synced and self.ingresses.synced and self.pods.synced
+
+    def start(self):
+        self.deployments.start()
+        self.ingresses.start()
+        self.pods.start()
@@ -16,7 +16,7 @@
 
 from hashlib import sha1
 import os
-from typing import List
+from typing import Dict, List
 
 from kubernetes import client as k8s
 from nauta.config import NautaPlatformConfig
@@ -27,6 +27,15 @@ class K8STensorboardInstance:
     EXPERIMENTS_OUTPUT_VOLUME_NAME = 'output-public'
     TENSORBOARD_CONTAINER_MOUNT_PATH_PREFIX = '/mnt/exp'
 
+    # pooled instances are started before runs are known - whole output volume is mounted to TensorBoard container
+    # and runs are later linked into a logdir shared with activity proxy (see activity-proxy's logdir module)
+    POOL_LOGDIR_VOLUME_NAME = 'logdir'
+    POOL_OUTPUT_MOUNT_PATH = '/mnt/output'
+    POOL_RELOAD_INTERVAL = '2'  # seconds
+    POOL_STATE_LABEL = 'pool-state'
+    POOL_STATE_IDLE = 'idle'
+    POOL_STATE_ASSIGNED = 'assigned'
+
     def __init__(self, deployment: k8s.V1Deployment, service: k8s.V1Service, ingress: k8s.V1beta1Ingress,
                  pod: k8s.V1Pod = None):
         self.deployment = deployment
@@ -76,6 +85,76 @@ class K8STensorboardInstance:
             "--host", "127.0.0.1"
         ]
 
+        return cls._from_spec(id=id, labels=deployment_labels, selector_labels=deployment_labels,
+                              tensorboard_command=tensorboard_command, tensorboard_volume_mounts=volume_mounts)
+
+    @classmethod
+    def from_pool(cls, id: str):
+        k8s_name = 'tensorboard-' + id
+
+        selector_labels = {
+            'name': k8s_name,
+            'type': 'nauta-tensorboard',
+            'nauta_app_name': 'tensorboard',
+            'id': id
+        }
+
+        deployment_labels = dict(selector_labels)
+        deployment_labels[cls.POOL_STATE_LABEL] = cls.POOL_STATE_IDLE
+
+        tensorboard_command = [
+            "tensorboard",
+            "--logdir", cls.TENSORBOARD_CONTAINER_MOUNT_PATH_PREFIX,
+            "--reload_interval", cls.POOL_RELOAD_INTERVAL,
+            "--port", "6006",
+            "--host", "127.0.0.1"
+        ]
+
+        tensorboard_volume_mounts = [
+            k8s.V1VolumeMount(
+                name=cls.EXPERIMENTS_OUTPUT_VOLUME_NAME,
+                mount_path=cls.POOL_OUTPUT_MOUNT_PATH,
+                read_only=True
+            ),
+            k8s.V1VolumeMount(
+                name=cls.POOL_LOGDIR_VOLUME_NAME,
+                mount_path=cls.TENSORBOARD_CONTAINER_MOUNT_PATH_PREFIX,
+                read_only=True
+            )
+        ]
+
+        proxy_volume_mounts = [
+            k8s.V1VolumeMount(
+                name=cls.POOL_LOGDIR_VOLUME_NAME,
+                mount_path=cls.TENSORBOARD_CONTAINER_MOUNT_PATH_PREFIX
+            )
+        ]
+
+        proxy_env = [
+            k8s.V1EnvVar(name='LOGDIR_PATH', value=cls.TENSORBOARD_CONTAINER_MOUNT_PATH_PREFIX),
+            k8s.V1EnvVar(name='RUNS_OUTPUT_PATH', value=cls.POOL_OUTPUT_MOUNT_PATH)
+        ]
+
+        extra_volumes = [
+            k8s.V1Volume(
+                name=cls.POOL_LOGDIR_VOLUME_NAME,
+                empty_dir=k8s.V1EmptyDirVolumeSource()
+            )
+        ]
+
+        return cls._from_spec(id=id, labels=deployment_labels, selector_labels=selector_labels,
+                              tensorboard_command=tensorboard_command,
+                              tensorboard_volume_mounts=tensorboard_volume_mounts,
+                              proxy_volume_mounts=proxy_volume_mounts, proxy_env=proxy_env,
+                              extra_volumes=extra_volumes)
+
+    @classmethod
+    def _from_spec(cls, id: str, labels: Dict[str, str], selector_labels: Dict[str, str],
+                   tensorboard_command: List[str], tensorboard_volume_mounts: List[k8s.V1VolumeMount],
+                   proxy_volume_mounts: List[k8s.V1VolumeMount] = None, proxy_env: List[k8s.V1EnvVar] = None,
+                   extra_volumes: List[k8s.V1Volume] = None):
+        k8s_name = 'tensorboard-' + id
+
         nauta_config = NautaPlatformConfig.incluster_init()
 
         tensorboard_image = nauta_config.get_tensorboard_image()
@@ -85,16 +164,16 @@ class K8STensorboardInstance:
                                       kind='Deployment',
                                       metadata=k8s.V1ObjectMeta(
                                           name=k8s_name,
-                                          labels=deployment_labels
+                                          labels=labels
                                       ),
                                       spec=k8s.V1DeploymentSpec(
                                           replicas=1,
                                           selector=k8s.V1LabelSelector(
-                                              match_labels=deployment_labels
+                                              match_labels=selector_labels
                                           ),
                                           template=k8s.V1PodTemplateSpec(
                                               metadata=k8s.V1ObjectMeta(
-                                                  labels=deployment_labels
+                                                  labels=selector_labels
                                               ),
                                               spec=k8s.V1PodSpec(
                                                   tolerations=[k8s.V1Toleration(
@@ -121,10 +200,12 @@ class K8STensorboardInstance:
                                                           name='app',
                                                           image=tensorboard_image,
                                                           command=tensorboard_command,
-                                                          volume_mounts=volume_mounts),
+                                                          volume_mounts=tensorboard_volume_mounts),
                                                       k8s.V1Container(
                                                           name='proxy',
                                                           image=tensorboard_proxy_image,
+                                                          env=proxy_env,
+                                                          volume_mounts=proxy_volume_mounts,
                                                           ports=[
                                                               k8s.V1ContainerPort(
                                                                   container_port=80
@@ -148,7 +229,7 @@ class K8STensorboardInstance:
                                                               read_only=True
                                                           )
                                                       )
-                                                  ]
+                                                  ] + (extra_volumes or [])
                                               )
                                           )
                                       ))
@@ -93,6 +93,15 @@ def test_get_deployment_raises_other_api_exception(mocker, k8s_api_client_mock:
         k8s_api_client_mock.get_deployment(name='fake-name', namespace=MY_FAKE_NAMESPACE)
 
 
+# noinspection PyShadowingNames
+def test_patch_deployment(k8s_api_client_mock: K8SAPIClient):
+    k8s_api_client_mock.patch_deployment(name=FAKE_OBJECT_NAME, namespace=MY_FAKE_NAMESPACE, body={})
+
+    # noinspection PyUnresolvedReferences
+    k8s_api_client_mock.apps_api_client.patch_namespaced_deployment.assert_called_once_with(
+        name=FAKE_OBJECT_NAME, namespace=MY_FAKE_NAMESPACE, body={})
+
+
 # noinspection PyShadowingNames
 def test_delete_deployment(k8s_api_client_mock: K8SAPIClient):
     k8s_api_client_mock.delete_deployment(name='fake-name', namespace=MY_FAKE_NAMESPACE)
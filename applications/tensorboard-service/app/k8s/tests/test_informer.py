@@ -0,0 +1,93 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from unittest.mock import MagicMock
+
+from kubernetes.client import V1Deployment, V1DeploymentList, V1ListMeta, V1ObjectMeta
+import pytest
+
+from k8s.informer import ResourceIndex
+
+
+def _deployment(name: str, id: str, runs_hash: str = None) -> V1Deployment:
+    labels = {'id': id}
+    if runs_hash:
+        labels['runs-hash'] = runs_hash
+    return V1Deployment(metadata=V1ObjectMeta(name=name, labels=labels))
+
+
+@pytest.fixture
+def fake_watch(mocker):
+    return mocker.patch('kubernetes.watch.Watch')
+
+
+# noinspection PyShadowingNames
+def test_list_and_watch(fake_watch):
+    list_func = MagicMock(return_value=V1DeploymentList(
+        items=[_deployment('tensorboard-first', 'first', 'first-hash'), _deployment('tensorboard-second', 'second')],
+        metadata=V1ListMeta(resource_version='10')))
+    fake_watch.return_value.stream.return_value = iter([
+        {'type': 'MODIFIED', 'object': _deployment('tensorboard-second', 'second', 'second-hash')},
+        {'type': 'DELETED', 'object': _deployment('tensorboard-first', 'first', 'first-hash')},
+        {'type': 'ADDED', 'object': _deployment('tensorboard-third', 'third')},
+    ])
+    index = ResourceIndex('deployments', list_func, namespace='fake-namespace', label_selector='type=fake',
+                          index_labels=['id', 'runs-hash'])
+
+    # noinspection PyProtectedMember
+    index._list_and_watch()
+
+    assert index.synced
+    assert index.get('id', 'first') is None
+    assert index.get('runs-hash', 'first-hash') is None
+    assert index.get('runs-hash', 'second-hash').metadata.name == 'tensorboard-second'
+    assert index.get('id', 'third').metadata.name == 'tensorboard-third'
+    assert fake_watch.return_value.stream.call_args[1]['resource_version'] == '10'
+    list_func.assert_called_once_with(namespace='fake-namespace', label_selector='type=fake')
+
+
+# noinspection PyShadowingNames
+def test_list_and_watch_error_event(fake_watch):
+    list_func = MagicMock(return_value=V1DeploymentList(items=[_deployment('tensorboard-first', 'first')],
+                                                        metadata=V1ListMeta(resource_version='10')))
+    fake_watch.return_value.stream.return_value = iter([
+        {'type': 'ERROR', 'object': {'code': 410}},
+        {'type': 'ADDED', 'object': _deployment('tensorboard-second', 'second')},
+    ])
+    index = ResourceIndex('deployments', list_func, namespace='fake-namespace', label_selector='type=fake',
+                          index_labels=['id'])
+
+    # noinspection PyProtectedMember
+    index._list_and_watch()
+
+    assert index.get('id', 'first')
+    assert index.get('id', 'second') is None
+
+
+# noinspection PyShadowingNames
+def test_run_failure(mocker, fake_watch):
+    list_func = MagicMock(side_effect=RuntimeError)
+    mocker.patch('time.sleep').side_effect = KeyboardInterrupt
+    index = ResourceIndex('deployments', list_func, namespace='fake-namespace', label_selector='type=fake',
+                          index_labels=['id'])
+    # noinspection PyProtectedMember
+    index._synced.set()
+
+    with pytest.raises(KeyboardInterrupt):
+        # noinspection PyProtectedMember
+        index._run()
+
+    assert not index.synced
@@ -49,6 +49,24 @@ def test_generate_tensorboard_deployment(mocker):
     assert len(volume_mounts) == len(fake_runs)
 
 
+def test_generate_pooled_tensorboard_deployment(mocker):
+    mocker.patch('k8s.models.NautaPlatformConfig')
+
+    model_instance = K8STensorboardInstance.from_pool(id='a7db5449-6168-4010-9ce6-cbaefbbfa4a1')
+
+    deployment = model_instance.deployment
+    assert deployment.metadata.labels['pool-state'] == 'idle'
+    assert 'pool-state' not in deployment.spec.selector.match_labels
+    assert 'runs-hash' not in deployment.metadata.labels
+
+    tensorboard_container, proxy_container = deployment.spec.template.spec.containers
+    assert {mount.mount_path for mount in tensorboard_container.volume_mounts} == {'/mnt/output', '/mnt/exp'}
+    assert [mount.mount_path for mount in proxy_container.volume_mounts] == ['/mnt/exp']
+    assert {env.name: env.value for env in proxy_container.env} == {'LOGDIR_PATH': '/mnt/exp',
+                                                                    'RUNS_OUTPUT_PATH': '/mnt/output'}
+    assert model_instance.ingress.spec.rules[0].http.paths[0].path == '/tb/a7db5449-6168-4010-9ce6-cbaefbbfa4a1/'
+
+
 def test_generate_run_names_hash():
     fake_runs = [
         Run(
@@ -14,9 +14,12 @@
 # limitations under the License.
 #
 
-from typing import Dict
+import logging as log
+import threading
+import time
+from typing import Dict, Optional
 
-from kubernetes import client, config
+from kubernetes import client, config, watch
 from kubernetes.client import V1ConfigMap
 
 NAUTA_CONFIG_CONFIGMAP_NAME = 'nauta'
@@ -25,22 +28,95 @@ NAUTA_CONFIG_CONFIGMAP_NAMESPACE = 'nauta'
 NAUTA_CONFIG_TENSORBOARD_TIMEOUT = 'tensorboard.timeout'
 NAUTA_DEFAULT_TENSORBOARD_TIMEOUT = '1800'
 
+NAUTA_CONFIG_TENSORBOARD_POOL_SIZE = 'tensorboard.pool.size'
+NAUTA_DEFAULT_TENSORBOARD_POOL_SIZE = 0
+
+
+class ConfigMapCache:
+    """
+    Process-wide cache of platform configmap data. While the configmap is watched, cached data is kept up to date by
+    the watch and never expires. If watch is not running (e.g. it is not permitted or the connection was broken),
+    data is re-read when it is older than TTL.
+    """
+    TTL = 60  # seconds
+    WATCH_TIMEOUT = 300  # seconds, watch is restarted after that time
+    WATCH_RETRY_DELAY = 10  # seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: Optional[Dict[str, str]] = None
+        self.fetched_at = 0.0
+        self.watched = False
+        self.watcher: Optional[threading.Thread] = None
+
+    def get(self) -> Optional[Dict[str, str]]:
+        with self.lock:
+            if self.data is not None and (self.watched or time.monotonic() - self.fetched_at < self.TTL):
+                return self.data
+            return None
+
+    def set(self, data: Optional[Dict[str, str]]):
+        with self.lock:
+            self.data = data
+            self.fetched_at = time.monotonic()
+
 
 class NautaPlatformConfig:
+    cache = ConfigMapCache()
+    instance: 'NautaPlatformConfig' = None
+
     def __init__(self, k8s_api_client: client.CoreV1Api):
         self.client = k8s_api_client
 
     @classmethod
     def incluster_init(cls):
+        """
+        Returns process-wide instance of the config, which is created (and starts to watch the platform configmap)
+        on the first call.
+        """
+        if cls.instance:
+            return cls.instance
+
         config.load_incluster_config()
         v1 = client.CoreV1Api()
-        return cls(k8s_api_client=v1)
+        cls.instance = cls(k8s_api_client=v1)
+        cls.instance.start_watch()
+        return cls.instance
+
+    def start_watch(self):
+        with self.cache.lock:
+            if self.cache.watcher:
+                return
+            self.cache.watcher = threading.Thread(target=self._watch_platform_configmap, name='configmap-watch',
+                                                  daemon=True)
+            self.cache.watcher.start()
+
+    def _watch_platform_configmap(self):
+        while True:
+            try:
+                for event in watch.Watch().stream(self.client.list_namespaced_config_map,
+                                                  namespace=NAUTA_CONFIG_CONFIGMAP_NAMESPACE,
+                                                  field_selector=f'metadata.name={NAUTA_CONFIG_CONFIGMAP_NAME}',
+                                                  timeout_seconds=self.cache.WATCH_TIMEOUT):
+                    configmap: V1ConfigMap = event['object']
+                    self.cache.set(None if event['type'] == 'DELETED' else configmap.data)
+                    self.cache.watched = True
+                self.cache.watched = False
+            except Exception:
+                self.cache.watched = False
+                log.exception('Failed to watch platform configmap, falling back to periodic reads.')
+                time.sleep(self.cache.WATCH_RETRY_DELAY)
 
     def _fetch_platform_configmap(self) -> Dict[str, str]:
+        configmap_data = self.cache.get()
+        if configmap_data is not None:
+            return configmap_data
+
         configmap: V1ConfigMap = self.client.read_namespaced_config_map(name=NAUTA_CONFIG_CONFIGMAP_NAME,
                                                                         namespace=NAUTA_CONFIG_CONFIGMAP_NAMESPACE)
 
         configmap_data: Dict[str, str] = configmap.data
+        self.cache.set(configmap_data)
 
         return configmap_data
 
@@ -57,3 +133,10 @@ class NautaPlatformConfig:
         if data.get(NAUTA_CONFIG_TENSORBOARD_TIMEOUT):
             return data.get(NAUTA_CONFIG_TENSORBOARD_TIMEOUT)
         return NAUTA_CONFIG_TENSORBOARD_TIMEOUT
+
+    def get_tensorboard_pool_size(self) -> int:
+        data = self._fetch_platform_configmap()
+        try:
+            return int(data.get(NAUTA_CONFIG_TENSORBOARD_POOL_SIZE, NAUTA_DEFAULT_TENSORBOARD_POOL_SIZE))
+        except ValueError:
+            return NAUTA_DEFAULT_TENSORBOARD_POOL_SIZE
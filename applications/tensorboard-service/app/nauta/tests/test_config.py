@@ -18,9 +18,10 @@
 from unittest.mock import MagicMock
 
 from kubernetes.client import V1ConfigMap
+from kubernetes.client.rest import ApiException
 import pytest
 
-from nauta.config import NautaPlatformConfig
+from nauta.config import ConfigMapCache, NautaPlatformConfig
 
 
 fake_cm = V1ConfigMap(
@@ -32,6 +33,14 @@ fake_cm = V1ConfigMap(
 )
 
 
+@pytest.fixture(autouse=True)
+def config_cache(mocker) -> ConfigMapCache:
+    cache = ConfigMapCache()
+    mocker.patch.object(NautaPlatformConfig, 'cache', cache)
+    mocker.patch.object(NautaPlatformConfig, 'instance', None)
+    return cache
+
+
 @pytest.fixture
 def nauta_platform_config_mocked():
     # noinspection PyTypeChecker
@@ -42,11 +51,15 @@ def nauta_platform_config_mocked():
 
 def test_incluster_init(mocker):
     mocker.patch('nauta.config.config')
+    mocker.patch('nauta.config.client')
+    fake_start_watch = mocker.patch.object(NautaPlatformConfig, 'start_watch')
 
     nauta_config = NautaPlatformConfig.incluster_init()
 
     assert nauta_config
     assert nauta_config.client
+    assert NautaPlatformConfig.incluster_init() is nauta_config
+    assert fake_start_watch.call_count == 1
 
 
 # noinspection PyShadowingNames
@@ -59,6 +72,65 @@ def test_fetch_platform_configmap(mocker, nauta_platform_config_mocked: NautaPla
     assert configmap_dict == fake_cm.data
 
 
+# noinspection PyShadowingNames
+def test_fetch_platform_configmap_cached(mocker, nauta_platform_config_mocked: NautaPlatformConfig,
+                                         config_cache: ConfigMapCache):
+    fake_read = mocker.patch.object(nauta_platform_config_mocked.client, 'read_namespaced_config_map',
+                                    return_value=fake_cm)
+    fake_monotonic = mocker.patch('time.monotonic', return_value=1000.0)
+
+    # noinspection PyProtectedMember
+    nauta_platform_config_mocked._fetch_platform_configmap()
+    fake_monotonic.return_value += ConfigMapCache.TTL - 1
+    # noinspection PyProtectedMember
+    assert nauta_platform_config_mocked._fetch_platform_configmap() == fake_cm.data
+    assert fake_read.call_count == 1
+
+    fake_monotonic.return_value += 1
+    # noinspection PyProtectedMember
+    nauta_platform_config_mocked._fetch_platform_configmap()
+    assert fake_read.call_count == 2
+
+    config_cache.watched = True
+    fake_monotonic.return_value += 10 * ConfigMapCache.TTL
+    # noinspection PyProtectedMember
+    nauta_platform_config_mocked._fetch_platform_configmap()
+    assert fake_read.call_count == 2
+
+
+# noinspection PyShadowingNames
+def test_watch_platform_configmap(mocker, nauta_platform_config_mocked: NautaPlatformConfig,
+                                  config_cache: ConfigMapCache):
+    updated_cm = V1ConfigMap(data=dict(fake_cm.data, **{'tensorboard.timeout': '60'}))
+    fake_watch = mocker.patch('kubernetes.watch.Watch')
+    fake_watch.return_value.stream.side_effect = [
+        iter([{'type': 'ADDED', 'object': fake_cm}, {'type': 'MODIFIED', 'object': updated_cm}]),
+        KeyboardInterrupt
+    ]
+
+    with pytest.raises(KeyboardInterrupt):
+        # noinspection PyProtectedMember
+        nauta_platform_config_mocked._watch_platform_configmap()
+
+    assert config_cache.data == updated_cm.data
+    assert not config_cache.watched
+    assert fake_watch.return_value.stream.call_args[1]['field_selector'] == 'metadata.name=nauta'
+
+
+# noinspection PyShadowingNames
+def test_watch_platform_configmap_failure(mocker, nauta_platform_config_mocked: NautaPlatformConfig,
+                                          config_cache: ConfigMapCache):
+    fake_watch = mocker.patch('kubernetes.watch.Watch')
+    fake_watch.return_value.stream.side_effect = ApiException(status=403)
+    mocker.patch('time.sleep').side_effect = KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        # noinspection PyProtectedMember
+        nauta_platform_config_mocked._watch_platform_configmap()
+
+    assert not config_cache.watched
+
+
 # noinspection PyShadowingNames
 def test_get_tensorboard_image(mocker, nauta_platform_config_mocked: NautaPlatformConfig):
     mocker.patch.object(nauta_platform_config_mocked, '_fetch_platform_configmap').return_value = fake_cm.data
@@ -75,3 +147,13 @@ def test_get_activity_proxy_image(mocker, nauta_platform_config_mocked: NautaPla
     ap_image = nauta_platform_config_mocked.get_activity_proxy_image()
 
     assert ap_image == '127.0.0.1:30303/activity-proxy:dev'
+
+
+# noinspection PyShadowingNames
+@pytest.mark.parametrize('configmap_data,pool_size', [({}, 0), ({'tensorboard.pool.size': '4'}, 4),
+                                                      ({'tensorboard.pool.size': 'four'}, 0)])
+def test_get_tensorboard_pool_size(mocker, nauta_platform_config_mocked: NautaPlatformConfig, configmap_data,
+                                   pool_size):
+    mocker.patch.object(nauta_platform_config_mocked, '_fetch_platform_configmap').return_value = configmap_data
+
+    assert nauta_platform_config_mocked.get_tensorboard_pool_size() == pool_size
@@ -0,0 +1,190 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Minimal reader of TensorFlow event files, which extracts scalar summaries without depending on TensorFlow.
+Event files are TFRecord files (each record is: uint64 length, uint32 masked CRC of length, data, uint32 masked CRC
+of data) containing serialized tensorflow.Event protocol buffers.
+"""
+
+import struct
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+RECORD_HEADER = struct.Struct('<QI')
+RECORD_FOOTER_SIZE = 4
+MAX_RECORD_LENGTH = 256 * 1024 * 1024  # larger records are assumed to be a result of a corrupted file
+
+# protocol buffer wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+# tensorflow.DataType values of scalar types supported in tensor summaries
+DT_FLOAT = 1
+DT_DOUBLE = 2
+DT_INT32 = 3
+DT_INT64 = 9
+
+
+class ScalarEvent:
+    def __init__(self, tag: str, step: int, wall_time: float, value: float):
+        self.tag = tag
+        self.step = step
+        self.wall_time = wall_time
+        self.value = value
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _iter_fields(data: bytes) -> Iterator[Tuple[int, int, object]]:
+    """
+    Yields (field number, wire type, value) tuples of a serialized protocol buffer message. Values of varint fields
+    are ints, values of other fields are bytes.
+    """
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, position = _read_varint(data, position)
+        elif wire_type == WIRE_FIXED64:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+            value, position = data[position:position + length], position + length
+        elif wire_type == WIRE_FIXED32:
+            value, position = data[position:position + 4], position + 4
+        else:
+            raise ValueError(f'unsupported wire type: {wire_type}')
+        yield field_number, wire_type, value
+
+
+def _to_signed_64(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _parse_tensor_scalar(data: bytes) -> Optional[float]:
+    dtype = None
+    has_dimensions = False
+    content = b''
+    values: List[float] = []
+
+    for field_number, wire_type, value in _iter_fields(data):
+        if field_number == 1 and wire_type == WIRE_VARINT:
+            dtype = value
+        elif field_number == 2 and wire_type == WIRE_LENGTH_DELIMITED:
+            has_dimensions = any(dim_field == 2 for dim_field, _, _ in _iter_fields(value))
+        elif field_number == 4 and wire_type == WIRE_LENGTH_DELIMITED:
+            content = value
+        elif field_number == 5 and dtype == DT_FLOAT:
+            values.extend(struct.unpack(f'<{len(value) // 4}f', value))
+        elif field_number == 6 and dtype == DT_DOUBLE:
+            values.extend(struct.unpack(f'<{len(value) // 8}d', value))
+        elif field_number in (7, 10) and dtype in (DT_INT32, DT_INT64):
+            if wire_type == WIRE_VARINT:
+                values.append(_to_signed_64(value))
+            else:
+                position = 0
+                while position < len(value):
+                    varint, position = _read_varint(value, position)
+                    values.append(_to_signed_64(varint))
+
+    # only scalar (0-dimensional) tensors are taken into account
+    if has_dimensions:
+        return None
+
+    if content:
+        content_formats = {DT_FLOAT: '<f', DT_DOUBLE: '<d', DT_INT32: '<i', DT_INT64: '<q'}
+        if dtype in content_formats and len(content) == struct.calcsize(content_formats[dtype]):
+            return float(struct.unpack(content_formats[dtype], content)[0])
+        return None
+
+    return float(values[0]) if len(values) == 1 else None
+
+
+def parse_scalar_events(event_data: bytes) -> List[ScalarEvent]:
+    """
+    Returns scalars stored in a serialized tensorflow.Event, both as simple values (TF 1.x) and scalar tensors (TF 2.x).
+    """
+    wall_time = 0.0
+    step = 0
+    summary = None
+
+    for field_number, wire_type, value in _iter_fields(event_data):
+        if field_number == 1 and wire_type == WIRE_FIXED64:
+            wall_time = struct.unpack('<d', value)[0]
+        elif field_number == 2 and wire_type == WIRE_VARINT:
+            step = _to_signed_64(value)
+        elif field_number == 5 and wire_type == WIRE_LENGTH_DELIMITED:
+            summary = value
+
+    if summary is None:
+        return []
+
+    scalar_events = []
+    for field_number, wire_type, summary_value in _iter_fields(summary):
+        if field_number != 1 or wire_type != WIRE_LENGTH_DELIMITED:
+            continue
+
+        tag = None
+        scalar = None
+        for value_field_number, value_wire_type, value in _iter_fields(summary_value):
+            if value_field_number == 1 and value_wire_type == WIRE_LENGTH_DELIMITED:
+                tag = value.decode('utf-8', errors='replace')
+            elif value_field_number == 2 and value_wire_type == WIRE_FIXED32:
+                scalar = struct.unpack('<f', value)[0]
+            elif value_field_number == 8 and value_wire_type == WIRE_LENGTH_DELIMITED:
+                scalar = _parse_tensor_scalar(value)
+
+        if tag is not None and scalar is not None:
+            scalar_events.append(ScalarEvent(tag=tag, step=step, wall_time=wall_time, value=scalar))
+
+    return scalar_events
+
+
+def read_records(file: BinaryIO) -> Iterator[Tuple[bytes, int]]:
+    """
+    Yields (record data, offset of the next record) tuples of complete records, starting from current position
+    of the file. Reading stops at an incomplete record, e.g. one being written at the moment.
+    """
+    offset = file.tell()
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+
+        length, _ = RECORD_HEADER.unpack(header)
+        if length > MAX_RECORD_LENGTH:
+            raise ValueError(f'record at offset {offset} is too long: {length}')
+
+        data = file.read(length)
+        footer = file.read(RECORD_FOOTER_SIZE)
+        if len(data) < length or len(footer) < RECORD_FOOTER_SIZE:
+            return
+
+        offset += RECORD_HEADER.size + length + RECORD_FOOTER_SIZE
+        yield data, offset
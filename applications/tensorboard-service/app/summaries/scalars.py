@@ -0,0 +1,306 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from array import array
+from collections import OrderedDict
+import json
+import logging as log
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from summaries.event_file import parse_scalar_events, read_records
+
+EVENT_FILE_MARKER = 'tfevents'
+
+SUMMARY_FILE_VERSION = 1
+
+
+class ScalarSeries:
+    """
+    Downsampled series of values of one scalar tag. Every `stride`-th value is kept - when number of kept values
+    exceeds max_points, every other kept value is dropped and stride is doubled, so kept values stay evenly spread
+    over the whole series.
+    """
+
+    def __init__(self, max_points: int, stride: int = 1, seen: int = 0, steps: array = None,
+                 wall_times: array = None, values: array = None):
+        self.max_points = max_points
+        self.stride = stride
+        self.seen = seen
+        self.steps = steps if steps is not None else array('q')
+        self.wall_times = wall_times if wall_times is not None else array('d')
+        self.values = values if values is not None else array('d')
+
+    def add(self, step: int, wall_time: float, value: float):
+        if self.seen % self.stride == 0:
+            self.steps.append(step)
+            self.wall_times.append(wall_time)
+            self.values.append(value)
+            if len(self.steps) > self.max_points:
+                self.steps = self.steps[::2]
+                self.wall_times = self.wall_times[::2]
+                self.values = self.values[::2]
+                self.stride *= 2
+        self.seen += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'steps': self.steps.tolist(),
+            'wallTimes': self.wall_times.tolist(),
+            'values': self.values.tolist()
+        }
+
+    def copy(self) -> 'ScalarSeries':
+        return ScalarSeries(max_points=self.max_points, stride=self.stride, seen=self.seen, steps=self.steps[:],
+                            wall_times=self.wall_times[:], values=self.values[:])
+
+
+class RunSummary:
+    """
+    Downsampled scalars of a single run, updated incrementally - only records appended to event files since
+    the previous update are read. Scalars from event files in subdirectories of the run (e.g. train, eval) are
+    prefixed with the subdirectory path.
+
+    Summary is saved in a compact columnar file: JSON header line (positions in event files, series metadata)
+    followed by arrays of steps, wall times and values of each series.
+    """
+
+    def __init__(self, max_points: int):
+        self.max_points = max_points
+        self.file_offsets: Dict[str, int] = {}  # event file path relative to run directory: offset
+        self.series: Dict[str, ScalarSeries] = {}
+
+    def update(self, run_dir: str, event_files: List[str]) -> bool:
+        """
+        Reads new records of given event files. Returns True if anything was read.
+        """
+        updated = False
+        for relative_path in sorted(event_files):
+            offset = self.file_offsets.get(relative_path, 0)
+            try:
+                if os.path.getsize(os.path.join(run_dir, relative_path)) <= offset:
+                    continue
+
+                with open(os.path.join(run_dir, relative_path), mode='rb') as file:
+                    file.seek(offset)
+                    prefix = os.path.dirname(relative_path)
+                    for record, offset in read_records(file):
+                        self._add_record(record, prefix, relative_path)
+                        self.file_offsets[relative_path] = offset
+                        updated = True
+            except OSError:
+                # e.g. removed file or unavailable share - the file will be read again during the next update
+                log.exception(f'Failed to read event file {relative_path} of {run_dir}')
+            except ValueError:
+                # corrupted framing of records - next records cannot be found, so the file is not read any further
+                log.exception(f'Failed to read event file {relative_path} of {run_dir}')
+                self.file_offsets[relative_path] = sys.maxsize
+                updated = True
+        return updated
+
+    def _add_record(self, record: bytes, prefix: str, relative_path: str):
+        try:
+            events = parse_scalar_events(record)
+        except (ValueError, IndexError, UnicodeDecodeError, struct.error):
+            # only the corrupted record is skipped
+            log.exception(f'Failed to parse a record of event file {relative_path}')
+            return
+
+        for event in events:
+            tag = f'{prefix}/{event.tag}' if prefix else event.tag
+            series = self.series.get(tag)
+            if series is None:
+                series = self.series[tag] = ScalarSeries(max_points=self.max_points)
+            series.add(step=event.step, wall_time=event.wall_time, value=event.value)
+
+    def copy(self) -> 'RunSummary':
+        summary = RunSummary(max_points=self.max_points)
+        summary.file_offsets = dict(self.file_offsets)
+        summary.series = {tag: series.copy() for tag, series in self.series.items()}
+        return summary
+
+    def save(self, path: str):
+        tags = sorted(self.series)
+        header = {
+            'version': SUMMARY_FILE_VERSION,
+            'byteorder': sys.byteorder,
+            'maxPoints': self.max_points,
+            'files': self.file_offsets,
+            'series': [{'tag': tag, 'stride': self.series[tag].stride, 'seen': self.series[tag].seen,
+                        'count': len(self.series[tag].steps)} for tag in tags]
+        }
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, mode='wb') as file:
+            file.write(json.dumps(header).encode('utf-8') + b'\n')
+            for tag in tags:
+                series = self.series[tag]
+                series.steps.tofile(file)
+                series.wall_times.tofile(file)
+                series.values.tofile(file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, max_points: int) -> Optional['RunSummary']:
+        try:
+            with open(path, mode='rb') as file:
+                header = json.loads(file.readline().decode('utf-8'))
+                if header.get('version') != SUMMARY_FILE_VERSION or header.get('maxPoints') != max_points:
+                    return None
+
+                summary = cls(max_points=max_points)
+                summary.file_offsets = header['files']
+                for series_header in header['series']:
+                    arrays = [array('q'), array('d'), array('d')]
+                    for column in arrays:
+                        column.fromfile(file, series_header['count'])
+                        if header['byteorder'] != sys.byteorder:
+                            column.byteswap()
+                    summary.series[series_header['tag']] = ScalarSeries(
+                        max_points=max_points, stride=series_header['stride'], seen=series_header['seen'],
+                        steps=arrays[0], wall_times=arrays[1], values=arrays[2])
+                return summary
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, EOFError):
+            log.exception(f'Failed to load summary file {path}')
+            return None
+
+
+class SummaryStore:
+    """
+    Keeps downsampled scalars of runs stored in output_dir (in <owner>/<run name> directories). Summaries are saved
+    in cache_dir, so they are shared by all processes using the same cache_dir and survive restarts of processes
+    (and of the container, if cache_dir is placed on a volume). Up to max_cached_runs recently requested summaries
+    are kept in memory and tailed by a background thread every tail_interval seconds, so event files are read
+    during a request only when a summary of the run isn't cached yet. Run directory is searched for new event files
+    at most every RESCAN_INTERVAL seconds.
+    """
+    MAX_POINTS = 1000
+    RESCAN_INTERVAL = 10  # seconds
+    TAIL_INTERVAL = 2  # seconds
+    MAX_CACHED_RUNS = 256
+
+    def __init__(self, output_dir: str, cache_dir: str, max_points: int = MAX_POINTS,
+                 tail_interval: Optional[float] = TAIL_INTERVAL, max_cached_runs: int = MAX_CACHED_RUNS):
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.max_points = max_points
+        self.tail_interval = tail_interval
+        self.max_cached_runs = max_cached_runs
+        self._lock = threading.Lock()
+        self._run_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        # summaries in order of last request, the least recently requested first
+        self._summaries: 'OrderedDict[Tuple[str, str], RunSummary]' = OrderedDict()
+        self._event_files: Dict[Tuple[str, str], List[str]] = {}
+        self._scanned_at: Dict[Tuple[str, str], float] = {}
+        self._tailing_thread: Optional[threading.Thread] = None
+
+    def _find_event_files(self, run_dir: str) -> List[str]:
+        event_files = []
+        for dir_path, _, file_names in os.walk(run_dir):
+            for file_name in file_names:
+                if EVENT_FILE_MARKER in file_name:
+                    event_files.append(os.path.relpath(os.path.join(dir_path, file_name), run_dir))
+        return event_files
+
+    def get(self, owner: str, name: str) -> RunSummary:
+        """
+        Returns a copy of a summary of a given run, which is not modified by further updates.
+        """
+        run_key = (owner, name)
+        with self._lock:
+            run_lock = self._run_locks.setdefault(run_key, threading.Lock())
+            summary = self._summaries.get(run_key)
+            if summary is not None:
+                self._summaries.move_to_end(run_key)
+            self._start_tailing()
+
+        if summary is None:
+            summary = self._update(run_key, add=True)
+
+        with run_lock:
+            return summary.copy()
+
+    def update_all(self):
+        """
+        Reads new records of event files of all cached summaries.
+        """
+        with self._lock:
+            run_keys = list(self._summaries)
+
+        for run_key in run_keys:
+            try:
+                self._update(run_key, add=False)
+            except Exception:
+                log.exception(f'Failed to update summary of {run_key}')
+
+    def _start_tailing(self):
+        if self.tail_interval is None or self._tailing_thread:
+            return
+
+        self._tailing_thread = threading.Thread(target=self._tail, name='summaries-tailing', daemon=True)
+        self._tailing_thread.start()
+
+    def _tail(self):
+        while True:
+            time.sleep(self.tail_interval)
+            self.update_all()
+
+    def _update(self, run_key: Tuple[str, str], add: bool) -> Optional[RunSummary]:
+        owner, name = run_key
+        with self._lock:
+            run_lock = self._run_locks.setdefault(run_key, threading.Lock())
+
+        with run_lock:
+            run_dir = os.path.join(self.output_dir, owner, name)
+            summary_path = os.path.join(self.cache_dir, owner, f'{name}.summary')
+
+            with self._lock:
+                summary = self._summaries.get(run_key)
+            if summary is None:
+                if not add:
+                    # evicted in the meantime
+                    return None
+                summary = RunSummary.load(summary_path, max_points=self.max_points) or \
+                    RunSummary(max_points=self.max_points)
+                self._add(run_key, summary)
+
+            if time.monotonic() - self._scanned_at.get(run_key, float('-inf')) >= self.RESCAN_INTERVAL:
+                self._event_files[run_key] = self._find_event_files(run_dir)
+                self._scanned_at[run_key] = time.monotonic()
+
+            if summary.update(run_dir, self._event_files.get(run_key, [])):
+                try:
+                    summary.save(summary_path)
+                except OSError:
+                    log.exception(f'Failed to save summary of {run_key}')
+
+            return summary
+
+    def _add(self, run_key: Tuple[str, str], summary: RunSummary):
+        with self._lock:
+            self._summaries[run_key] = summary
+            while len(self._summaries) > self.max_cached_runs:
+                evicted_key, _ = self._summaries.popitem(last=False)
+                self._run_locks.pop(evicted_key, None)
+                self._event_files.pop(evicted_key, None)
+                self._scanned_at.pop(evicted_key, None)
@@ -0,0 +1,116 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import struct
+
+import pytest
+
+from summaries.event_file import DT_DOUBLE, DT_FLOAT, DT_INT64, parse_scalar_events, read_records
+
+
+def encode_varint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    encoded = b''
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded += bytes([byte | 0x80])
+        else:
+            return encoded + bytes([byte])
+
+
+def encode_field(field_number: int, wire_type: int, value) -> bytes:
+    key = encode_varint(field_number << 3 | wire_type)
+    if wire_type == 0:
+        return key + encode_varint(value)
+    elif wire_type == 2:
+        return key + encode_varint(len(value)) + value
+    return key + value
+
+
+def encode_event(step: int, wall_time: float, values) -> bytes:
+    """
+    :param values: list of (tag, encoded value field) tuples
+    """
+    summary = b''.join(encode_field(1, 2, encode_field(1, 2, tag.encode('utf-8')) + value_field)
+                       for tag, value_field in values)
+    return encode_field(1, 1, struct.pack('<d', wall_time)) + encode_field(2, 0, step) + encode_field(5, 2, summary)
+
+
+def simple_value(value: float) -> bytes:
+    return encode_field(2, 5, struct.pack('<f', value))
+
+
+def tensor_value(dtype: int, content: bytes = None, dims: int = 0, float_val: float = None) -> bytes:
+    tensor = encode_field(1, 0, dtype)
+    tensor += encode_field(2, 2, b''.join(encode_field(2, 2, encode_field(1, 0, 3)) for _ in range(dims)))
+    if content is not None:
+        tensor += encode_field(4, 2, content)
+    if float_val is not None:
+        tensor += encode_field(5, 2, struct.pack('<f', float_val))
+    return encode_field(8, 2, tensor)
+
+
+def encode_record(data: bytes) -> bytes:
+    return struct.pack('<QI', len(data), 0) + data + struct.pack('<I', 0)
+
+
+def test_parse_scalar_events():
+    event = encode_event(step=10, wall_time=1563000000.5, values=[
+        ('loss', simple_value(0.5)),
+        ('accuracy', tensor_value(DT_FLOAT, content=struct.pack('<f', 0.75))),
+        ('learning_rate', tensor_value(DT_DOUBLE, content=struct.pack('<d', 0.001))),
+        ('batch', tensor_value(DT_INT64, content=struct.pack('<q', 32))),
+        ('recall', tensor_value(DT_FLOAT, float_val=0.25)),
+        ('histogram', tensor_value(DT_DOUBLE, content=struct.pack('<6d', *range(6)), dims=2)),
+    ])
+
+    scalar_events = parse_scalar_events(event)
+
+    assert [(scalar.tag, scalar.value) for scalar in scalar_events] == [
+        ('loss', 0.5), ('accuracy', 0.75), ('learning_rate', 0.001), ('batch', 32.0), ('recall', 0.25)]
+    assert all(scalar.step == 10 and scalar.wall_time == 1563000000.5 for scalar in scalar_events)
+
+
+def test_parse_scalar_events_no_summary():
+    # e.g. first event of a file, containing file_version
+    event = encode_field(1, 1, struct.pack('<d', 1563000000.0)) + encode_field(3, 2, b'brain.Event:2')
+
+    assert parse_scalar_events(event) == []
+
+
+def test_read_records_stops_at_incomplete_record():
+    first, second = encode_record(b'first'), encode_record(b'second')
+    file = io.BytesIO(first + second[:-3])
+
+    assert list(read_records(file)) == [(b'first', len(first))]
+
+
+def test_read_records_from_offset():
+    first, second = encode_record(b'first'), encode_record(b'second')
+    file = io.BytesIO(first + second)
+    file.seek(len(first))
+
+    assert list(read_records(file)) == [(b'second', len(first) + len(second))]
+
+
+def test_read_records_corrupted():
+    file = io.BytesIO(struct.pack('<QI', 1 << 40, 0) + b'data')
+
+    with pytest.raises(ValueError):
+        list(read_records(file))
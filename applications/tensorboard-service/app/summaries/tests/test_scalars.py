@@ -0,0 +1,162 @@
+#
+# Copyright (c) 2019 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+
+from summaries.scalars import RunSummary, ScalarSeries, SummaryStore
+from summaries.tests.test_event_file import encode_event, encode_record, simple_value
+
+
+def write_events(path: str, events, mode: str = 'ab'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode=mode) as file:
+        for step, values in events:
+            file.write(encode_record(encode_event(step=step, wall_time=1000.0 + step,
+                                                  values=[(tag, simple_value(value)) for tag, value in values])))
+
+
+def test_scalar_series_downsampling():
+    series = ScalarSeries(max_points=4)
+
+    for step in range(10):
+        series.add(step=step, wall_time=float(step), value=float(step))
+
+    assert series.steps.tolist() == [0, 4, 8]
+    assert series.stride == 4
+    assert series.seen == 10
+    assert series.to_dict() == {'steps': [0, 4, 8], 'wallTimes': [0.0, 4.0, 8.0], 'values': [0.0, 4.0, 8.0]}
+
+
+def test_run_summary_incremental_update(tmpdir):
+    run_dir = str(tmpdir.join('run'))
+    write_events(os.path.join(run_dir, 'events.out.tfevents.1'), [(0, [('loss', 1.0)]), (1, [('loss', 0.5)])])
+    write_events(os.path.join(run_dir, 'eval', 'events.out.tfevents.2'), [(1, [('accuracy', 0.5)])])
+    summary = RunSummary(max_points=100)
+
+    assert summary.update(run_dir, ['events.out.tfevents.1', 'eval/events.out.tfevents.2'])
+    assert not summary.update(run_dir, ['events.out.tfevents.1', 'eval/events.out.tfevents.2'])
+
+    # partially written record is read when it is complete
+    with open(os.path.join(run_dir, 'events.out.tfevents.1'), mode='ab') as file:
+        record = encode_record(encode_event(step=2, wall_time=1002.0, values=[('loss', simple_value(0.25))]))
+        file.write(record[:10])
+    assert not summary.update(run_dir, ['events.out.tfevents.1'])
+    with open(os.path.join(run_dir, 'events.out.tfevents.1'), mode='ab') as file:
+        file.write(record[10:])
+    assert summary.update(run_dir, ['events.out.tfevents.1'])
+
+    assert summary.series['loss'].to_dict() == {'steps': [0, 1, 2], 'wallTimes': [1000.0, 1001.0, 1002.0],
+                                                'values': [1.0, 0.5, 0.25]}
+    assert summary.series['eval/accuracy'].values.tolist() == [0.5]
+
+
+def test_run_summary_corrupted_file(tmpdir):
+    run_dir = str(tmpdir.join('run'))
+    write_events(os.path.join(run_dir, 'events.out.tfevents.1'), [(0, [('loss', 1.0)])])
+    with open(os.path.join(run_dir, 'events.out.tfevents.1'), mode='ab') as file:
+        file.write(encode_record(b'\xff\xff'))
+    write_events(os.path.join(run_dir, 'events.out.tfevents.1'), [(1, [('loss', 0.5)])])
+    summary = RunSummary(max_points=100)
+
+    # only the corrupted record is skipped
+    assert summary.update(run_dir, ['events.out.tfevents.1'])
+    assert summary.series['loss'].values.tolist() == [1.0, 0.5]
+    assert not summary.update(run_dir, ['events.out.tfevents.1'])
+
+    # reading of a file with corrupted framing of records is stopped
+    with open(os.path.join(run_dir, 'events.out.tfevents.1'), mode='ab') as file:
+        file.write(b'\xff' * 16)
+    write_events(os.path.join(run_dir, 'events.out.tfevents.1'), [(2, [('loss', 0.25)])])
+    assert summary.update(run_dir, ['events.out.tfevents.1'])
+    assert summary.series['loss'].values.tolist() == [1.0, 0.5]
+
+
+def test_run_summary_save_and_load(tmpdir):
+    run_dir = str(tmpdir.join('run'))
+    write_events(os.path.join(run_dir, 'events.out.tfevents.1'),
+                 [(step, [('loss', 1.0 / (step + 1)), ('accuracy', step / 10)]) for step in range(10)])
+    summary = RunSummary(max_points=4)
+    summary.update(run_dir, ['events.out.tfevents.1'])
+    summary_path = str(tmpdir.join('cache', 'owner', 'run.summary'))
+
+    summary.save(summary_path)
+    loaded_summary = RunSummary.load(summary_path, max_points=4)
+
+    assert loaded_summary.file_offsets == summary.file_offsets
+    for tag in ('loss', 'accuracy'):
+        assert loaded_summary.series[tag].to_dict() == summary.series[tag].to_dict()
+        assert loaded_summary.series[tag].stride == summary.series[tag].stride
+        assert loaded_summary.series[tag].seen == summary.series[tag].seen
+    assert RunSummary.load(summary_path, max_points=8) is None
+    assert RunSummary.load(str(tmpdir.join('missing.summary')), max_points=4) is None
+
+
+def test_summary_store(mocker, tmpdir):
+    output_dir, cache_dir = str(tmpdir.join('output')), str(tmpdir.join('cache'))
+    write_events(os.path.join(output_dir, 'jeanne', 'training1', 'events.out.tfevents.1'), [(0, [('loss', 1.0)])])
+    fake_monotonic = mocker.patch('time.monotonic', return_value=1000.0)
+    store = SummaryStore(output_dir=output_dir, cache_dir=cache_dir, tail_interval=None)
+
+    summary = store.get('jeanne', 'training1')
+    assert summary.series['loss'].values.tolist() == [1.0]
+    assert os.path.isfile(os.path.join(cache_dir, 'jeanne', 'training1.summary'))
+
+    # cached summaries are updated in background - new event file is found after RESCAN_INTERVAL, appended
+    # records of known files are read during each update
+    write_events(os.path.join(output_dir, 'jeanne', 'training1', 'events.out.tfevents.1'), [(1, [('loss', 0.5)])])
+    write_events(os.path.join(output_dir, 'jeanne', 'training1', 'events.out.tfevents.2'), [(2, [('loss', 0.25)])])
+    assert store.get('jeanne', 'training1').series['loss'].values.tolist() == [1.0]
+    store.update_all()
+    assert store.get('jeanne', 'training1').series['loss'].values.tolist() == [1.0, 0.5]
+    fake_monotonic.return_value += SummaryStore.RESCAN_INTERVAL
+    store.update_all()
+    assert store.get('jeanne', 'training1').series['loss'].values.tolist() == [1.0, 0.5, 0.25]
+    # returned summaries are not modified by updates
+    assert summary.series['loss'].values.tolist() == [1.0]
+
+    # summary saved by one store is loaded by another one, without reading event files again
+    mocker.patch('summaries.scalars.read_records').side_effect = AssertionError
+    other_store = SummaryStore(output_dir=output_dir, cache_dir=cache_dir, tail_interval=None)
+    assert other_store.get('jeanne', 'training1').series['loss'].values.tolist() == [1.0, 0.5, 0.25]
+
+
+def test_summary_store_evicts_least_recently_requested(tmpdir):
+    output_dir, cache_dir = str(tmpdir.join('output')), str(tmpdir.join('cache'))
+    for name in ('training1', 'training2', 'training3'):
+        write_events(os.path.join(output_dir, 'jeanne', name, 'events.out.tfevents.1'), [(0, [('loss', 1.0)])])
+    store = SummaryStore(output_dir=output_dir, cache_dir=cache_dir, tail_interval=None, max_cached_runs=2)
+
+    store.get('jeanne', 'training1')
+    store.get('jeanne', 'training2')
+    store.get('jeanne', 'training1')
+    store.get('jeanne', 'training3')
+
+    assert list(store._summaries) == [('jeanne', 'training1'), ('jeanne', 'training3')]
+    assert ('jeanne', 'training2') not in store._run_locks
+
+
+def test_summary_store_tailing(mocker, tmpdir):
+    output_dir, cache_dir = str(tmpdir.join('output')), str(tmpdir.join('cache'))
+    write_events(os.path.join(output_dir, 'jeanne', 'training1', 'events.out.tfevents.1'), [(0, [('loss', 1.0)])])
+    fake_thread = mocker.patch('threading.Thread')
+    store = SummaryStore(output_dir=output_dir, cache_dir=cache_dir)
+
+    store.get('jeanne', 'training1')
+    store.get('jeanne', 'training1')
+
+    assert fake_thread.call_count == 1
+    assert fake_thread.call_args[1]['target'] == store._tail
+    assert fake_thread.return_value.start.call_count == 1
@@ -17,21 +17,28 @@
 from datetime import datetime
 import json
 import logging as log
-from typing import Optional
+from typing import List, Optional
 
 import dateutil.parser
 import requests
 import requests.exceptions
 
+from tensorboard.models import Run
 
-def try_get_last_request_datetime(proxy_address: str) -> Optional[datetime]:
+PROXY_REQUEST_TIMEOUT = 5  # seconds
+
+
+def try_get_last_request_datetime(proxy_address: str, timeout: float = PROXY_REQUEST_TIMEOUT) -> Optional[datetime]:
     # sometimes proxy times out with the response and that's okay - it might be too busy with getting the last request
     # timestamp. try again shortly - it should return proper response.
     try:
-        proxy_response = requests.get(f'http://{proxy_address}/inactivity', timeout=5)
+        proxy_response = requests.get(f'http://{proxy_address}/inactivity', timeout=timeout)
     except requests.exceptions.ConnectionError:
         log.exception('connection to proxy failed')
         return None
+    except requests.exceptions.Timeout:
+        log.warning(f'request to proxy {proxy_address} timed out')
+        return None
 
     proxy_resonse_body = proxy_response.content.decode('utf-8')
 
@@ -42,3 +49,12 @@ def try_get_last_request_datetime(proxy_address: str) -> Optional[datetime]:
     last_request_datetime: datetime = dateutil.parser.parse(last_request_datetime_str)
 
     return last_request_datetime
+
+
+def assign_runs(proxy_address: str, runs: List[Run], timeout: float = PROXY_REQUEST_TIMEOUT):
+    """
+    Assigns runs to a pooled TensorBoard instance, raises requests.exceptions.RequestException on failure.
+    """
+    proxy_response = requests.put(f'http://{proxy_address}/logdir', json={'runs': [run.to_dict() for run in runs]},
+                                  timeout=timeout)
+    proxy_response.raise_for_status()
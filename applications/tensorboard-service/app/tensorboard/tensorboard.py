@@ -14,11 +14,15 @@
 # limitations under the License.
 #
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from http import HTTPStatus
 import logging as log
+import os
 from os import path
-from typing import List, Optional
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 from uuid import uuid4
 
 from kubernetes import config
@@ -27,26 +31,51 @@ from kubernetes.client.rest import ApiException
 import requests
 
 from k8s.client import K8SAPIClient, K8SPodPhase
+from k8s.informer import TensorboardIndex
 import k8s.models
 from tensorboard.models import Tensorboard, TensorboardStatus, Run
-from tensorboard.proxy_client import try_get_last_request_datetime
+from tensorboard.proxy_client import assign_runs, try_get_last_request_datetime
 from nauta.config import NautaPlatformConfig
 
 
 class TensorboardManager:
     OUTPUT_PUBLIC_MOUNT_PATH = '/mnt/output'
     NGINX_INGRESS_ADDRESS = 'nauta-ingress.nauta'
+    GARBAGE_SWEEP_WORKERS = 16
+
+    # results of checking if TensorBoard is reachable through ingress are cached for a short time,
+    # negative results are cached shorter as they are expected to change soon
+    REACHABLE_CACHE_TTL = 10  # seconds
+    UNREACHABLE_CACHE_TTL = 1  # seconds
+    _reachability_cache: Dict[str, Tuple[bool, float]] = {}  # url: (is reachable, check time)
+    _reachability_cache_lock = threading.Lock()
+
+    # existence of run output directories is checked in parallel, as stat calls on a loaded NFS/Samba share
+    # are slow; results are cached shortly, missing directories shorter as they may appear any moment
+    RUN_DIR_CACHE_TTL = 5  # seconds
+    RUN_DIR_MISSING_CACHE_TTL = 1  # seconds
+    VALIDATE_RUNS_WORKERS = 16
+    # owner directory is listed once instead of checking each run separately when at least that many runs
+    # of the owner are requested, None disables listing
+    OWNER_LISTING_THRESHOLD: Optional[int] = 8
+    _run_dir_cache: Dict[Tuple[str, str], Tuple[bool, float]] = {}  # (owner, run name): (exists, check time)
+    _run_dir_cache_lock = threading.Lock()
 
     def __init__(self, namespace: str, api_client: K8SAPIClient,
-                 config: NautaPlatformConfig):
+                 config: NautaPlatformConfig, index: TensorboardIndex = None):
         self.client = api_client
         self.namespace = namespace
         self._config = config
+        self._index = index
         self._tb_timeout = self._config.get_tensorboard_timeout()
         self._last_tb_timeout_load = TensorboardManager._get_current_datetime()
 
     @classmethod
-    def incluster_init(cls):
+    def incluster_init(cls, with_index: bool = True):
+        """
+        :param with_index: whether TensorBoard objects should be watched and indexed, index is used only for
+         getting TensorBoards, so e.g. the daemon filling the pool can skip it
+        """
         config.load_incluster_config()
 
         nauta_config = NautaPlatformConfig.incluster_init()
@@ -54,13 +83,24 @@ class TensorboardManager:
         with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace", mode='r') as file:
             my_current_namespace = file.read()
 
-        return cls(namespace=my_current_namespace, api_client=K8SAPIClient(), config=nauta_config)
+        api_client = K8SAPIClient()
+        index = None
+        if with_index:
+            index = TensorboardIndex(namespace=my_current_namespace, api_client=api_client)
+            index.start()
+
+        return cls(namespace=my_current_namespace, api_client=api_client, config=nauta_config, index=index)
 
     @staticmethod
     def _get_current_datetime() -> datetime:
         return datetime.utcnow()
 
     def create(self, runs: List[Run]) -> Tensorboard:
+        if self._config.get_tensorboard_pool_size() > 0:
+            pooled_tensorboard = self._create_from_pool(runs)
+            if pooled_tensorboard:
+                return pooled_tensorboard
+
         new_tensorboard = Tensorboard(id=str(uuid4()))
 
         k8s_tensorboard_model = k8s.models.K8STensorboardInstance.from_runs(runs=runs, id=new_tensorboard.id)
@@ -73,9 +113,89 @@ class TensorboardManager:
 
         return new_tensorboard
 
+    def list_pool(self) -> List[V1Deployment]:
+        return self.client.list_deployments(
+            namespace=self.namespace,
+            label_selector=f'type=nauta-tensorboard,'
+                           f'{k8s.models.K8STensorboardInstance.POOL_STATE_LABEL}='
+                           f'{k8s.models.K8STensorboardInstance.POOL_STATE_IDLE}'
+        )
+
+    def _claim_pool_instance(self, deployment: V1Deployment, runs_hash: str) -> bool:
+        # resourceVersion makes the patch fail with 409 Conflict if the instance was claimed by someone else
+        try:
+            self.client.patch_deployment(name=deployment.metadata.name, namespace=self.namespace, body={
+                'metadata': {
+                    'resourceVersion': deployment.metadata.resource_version,
+                    'labels': {
+                        k8s.models.K8STensorboardInstance.POOL_STATE_LABEL:
+                            k8s.models.K8STensorboardInstance.POOL_STATE_ASSIGNED,
+                        'runs-hash': runs_hash
+                    }
+                }
+            })
+        except ApiException as ex:
+            if ex.status in (HTTPStatus.CONFLICT, HTTPStatus.NOT_FOUND):
+                return False
+            raise ex
+        return True
+
+    def _create_from_pool(self, runs: List[Run]) -> Optional[Tensorboard]:
+        runs_hash = k8s.models.K8STensorboardInstance.generate_run_names_hash(runs)
+
+        for deployment in self.list_pool():
+            if not self._claim_pool_instance(deployment, runs_hash):
+                continue
+
+            id = deployment.metadata.labels['id']
+            try:
+                assign_runs(proxy_address=deployment.metadata.name, runs=runs)
+            except Exception:
+                log.exception(f'failed to assign runs to pooled tensorboard {deployment.metadata.name}, removing...')
+                self.delete(deployment)
+                continue
+
+            log.debug(f'runs assigned to pooled tensorboard {deployment.metadata.name}')
+            return Tensorboard(id=id, url=f'/tb/{id}/')
+
+        log.debug('no idle pooled tensorboard available')
+        return None
+
+    def fill_pool(self):
+        pool_size = self._config.get_tensorboard_pool_size()
+        missing_count = pool_size - len(self.list_pool())
+
+        for _ in range(missing_count):
+            k8s_tensorboard_model = k8s.models.K8STensorboardInstance.from_pool(id=str(uuid4()))
+
+            self.client.create_deployment(namespace=self.namespace, body=k8s_tensorboard_model.deployment)
+            self.client.create_service(namespace=self.namespace, body=k8s_tensorboard_model.service)
+            self.client.create_ingress(namespace=self.namespace, body=k8s_tensorboard_model.ingress)
+            log.debug(f'pooled tensorboard {k8s_tensorboard_model.deployment.metadata.name} created')
+
     def list(self) -> List[V1Deployment]:
         return self.client.list_deployments(namespace=self.namespace, label_selector='type=nauta-tensorboard')
 
+    @staticmethod
+    def _check_tensorboard_nginx_reachable_cached(url) -> bool:
+        now = time.monotonic()
+        with TensorboardManager._reachability_cache_lock:
+            cached = TensorboardManager._reachability_cache.get(url)
+        if cached:
+            reachable, checked_at = cached
+            ttl = TensorboardManager.REACHABLE_CACHE_TTL if reachable else TensorboardManager.UNREACHABLE_CACHE_TTL
+            if now - checked_at < ttl:
+                return reachable
+
+        reachable = TensorboardManager._check_tensorboard_nginx_reachable(url)
+        with TensorboardManager._reachability_cache_lock:
+            # entries of removed tensorboards are dropped when they expire
+            for cached_url, (cached_reachable, checked_at) in list(TensorboardManager._reachability_cache.items()):
+                if now - checked_at >= TensorboardManager.REACHABLE_CACHE_TTL:
+                    del TensorboardManager._reachability_cache[cached_url]
+            TensorboardManager._reachability_cache[url] = (reachable, now)
+        return reachable
+
     @staticmethod
     def _check_tensorboard_nginx_reachable(url) -> bool:
         log.debug("Checking if Tensorboard is reachable from Nginx...")
@@ -112,12 +232,36 @@ class TensorboardManager:
             if not status.ready:
                 return TensorboardStatus.CREATING
 
-        if not TensorboardManager._check_tensorboard_nginx_reachable(tensorboard_ingress_url):
+        if not TensorboardManager._check_tensorboard_nginx_reachable_cached(tensorboard_ingress_url):
             return TensorboardStatus.CREATING
 
         return TensorboardStatus.RUNNING
 
+    def _get_from_index(self, id: str) -> Optional[Tensorboard]:
+        """
+        Returns TensorBoard found in the index, or None when index is not available or the TensorBoard is not there
+        (e.g. it has just been created and watch has not delivered it yet) - API has to be asked then.
+        """
+        if not self._index or not self._index.synced:
+            return None
+
+        deployment = self._index.deployments.get('id', id)
+        ingress = self._index.ingresses.get('id', id)
+        if deployment is None or ingress is None:
+            return None
+
+        url = ingress.spec.rules[0].http.paths[0].path
+        pod = self._index.pods.get('id', id)
+        if pod is None:
+            return Tensorboard(id=id, status=TensorboardStatus.CREATING, url=url)
+
+        return Tensorboard(id=id, status=self._check_tensorboard_status(pod, tensorboard_ingress_url=url), url=url)
+
     def get_by_id(self, id: str) -> Optional[Tensorboard]:
+        indexed_tensorboard = self._get_from_index(id)
+        if indexed_tensorboard:
+            return indexed_tensorboard
+
         name = 'tensorboard-' + id
         deployment = self.client.get_deployment(name=name, namespace=self.namespace)
 
@@ -141,6 +285,13 @@ class TensorboardManager:
     def get_by_runs(self, runs: List[Run]) -> Optional[Tensorboard]:
         runs_hash = k8s.models.K8STensorboardInstance.generate_run_names_hash(runs)
 
+        if self._index and self._index.synced:
+            indexed_deployment = self._index.deployments.get('runs-hash', runs_hash)
+            indexed_tensorboard = \
+                self._get_from_index(indexed_deployment.metadata.labels['id']) if indexed_deployment else None
+            if indexed_tensorboard:
+                return indexed_tensorboard
+
         deployments = self.client.list_deployments(namespace=self.namespace,
                                                    label_selector=f'runs-hash={runs_hash}')
 
@@ -189,8 +340,26 @@ class TensorboardManager:
             log.exception('Error during getting garbage collection timeout value')
             return 1800
 
+    def _get_last_request_datetime(self, deployment: V1Deployment) -> Optional[datetime]:
+        try:
+            return try_get_last_request_datetime(proxy_address=deployment.metadata.name)
+        except Exception:
+            log.exception(f'failed to get last request datetime of {deployment.metadata.name}')
+            return None
+
+    def _delete_garbage_deployment(self, deployment: V1Deployment) -> bool:
+        try:
+            self.delete(deployment)
+        except Exception:
+            log.exception(f'failed to remove garbage: {deployment.metadata.name}')
+            return False
+
+        log.debug(f'garbage removed: {deployment.metadata.name}')
+        return True
+
     def delete_garbage(self):
         log.debug("searching for garbage...")
+        sweep_start = time.monotonic()
 
         try:
             tensorboards = self.list()
@@ -201,20 +370,32 @@ class TensorboardManager:
             raise ex
 
         self.refresh_garbage_timeout()
+        garbage_timeout = timedelta(seconds=self.get_garbage_timeout())
 
-        for deployment in tensorboards:
-            meta: V1ObjectMeta = deployment.metadata
-            deployment_name = meta.name
+        # idle pooled instances wait for runs, so they are never treated as garbage
+        tensorboards = [deployment for deployment in tensorboards if (deployment.metadata.labels or {}).get(
+            k8s.models.K8STensorboardInstance.POOL_STATE_LABEL) != k8s.models.K8STensorboardInstance.POOL_STATE_IDLE]
 
-            last_request_datetime = try_get_last_request_datetime(proxy_address=deployment_name)
-            if last_request_datetime is None:
-                continue
+        if not tensorboards:
+            log.debug('no tensorboards found')
+            return
 
-            delta = TensorboardManager._get_current_datetime() - last_request_datetime
-            if delta >= timedelta(seconds=self.get_garbage_timeout()):
-                log.debug(f'garbage detected: {meta.name} , removing...')
-                self.delete(deployment)
-                log.debug(f'garbage removed: {meta.name}')
+        # proxies are asked for inactivity concurrently, so a single unresponsive proxy delays the sweep by at most
+        # the proxy request timeout
+        with ThreadPoolExecutor(max_workers=min(self.GARBAGE_SWEEP_WORKERS, len(tensorboards))) as executor:
+            last_request_datetimes = list(executor.map(self._get_last_request_datetime, tensorboards))
+
+            current_datetime = TensorboardManager._get_current_datetime()
+            garbage = [deployment for deployment, last_request_datetime in zip(tensorboards, last_request_datetimes)
+                       if last_request_datetime is not None
+                       and current_datetime - last_request_datetime >= garbage_timeout]
+
+            for deployment in garbage:
+                log.debug(f'garbage detected: {deployment.metadata.name} , removing...')
+            removed_count = sum(executor.map(self._delete_garbage_deployment, garbage))
+
+        log.info(f'garbage sweep took {time.monotonic() - sweep_start:.2f}s: {len(tensorboards)} tensorboards '
+                 f'checked, {removed_count} removed')
 
     @staticmethod
     def validate_runs(runs: List[Run]) -> (List[Run], List[Run]):
@@ -222,15 +403,75 @@ class TensorboardManager:
         :param runs: runs to validate
         :return: (valid_runs: List[Run], invalid_runs: List[Run])
         """
+        now = time.monotonic()
+        run_dirs_exist: Dict[Tuple[str, str], bool] = {}
+        with TensorboardManager._run_dir_cache_lock:
+            for run in runs:
+                cached = TensorboardManager._run_dir_cache.get((run.owner, run.name))
+                if cached:
+                    exists, checked_at = cached
+                    ttl = TensorboardManager.RUN_DIR_CACHE_TTL if exists \
+                        else TensorboardManager.RUN_DIR_MISSING_CACHE_TTL
+                    if now - checked_at < ttl:
+                        run_dirs_exist[(run.owner, run.name)] = exists
+
+        unchecked_runs_by_owner: Dict[str, List[str]] = {}
+        for run in runs:
+            if (run.owner, run.name) not in run_dirs_exist:
+                unchecked_runs_by_owner.setdefault(run.owner, [])
+                if run.name not in unchecked_runs_by_owner[run.owner]:
+                    unchecked_runs_by_owner[run.owner].append(run.name)
+
+        if unchecked_runs_by_owner:
+            with ThreadPoolExecutor(max_workers=TensorboardManager.VALIDATE_RUNS_WORKERS) as executor:
+                futures = []
+                for owner, names in unchecked_runs_by_owner.items():
+                    threshold = TensorboardManager.OWNER_LISTING_THRESHOLD
+                    if threshold is not None and len(names) >= threshold:
+                        futures.append(executor.submit(TensorboardManager._check_owner_run_dirs, owner, names))
+                    else:
+                        futures.extend(executor.submit(TensorboardManager._check_run_dir, owner, name)
+                                       for name in names)
+                checked = {}
+                for future in futures:
+                    checked.update(future.result())
+
+            run_dirs_exist.update(checked)
+            with TensorboardManager._run_dir_cache_lock:
+                for key, (cached_exists, checked_at) in list(TensorboardManager._run_dir_cache.items()):
+                    if now - checked_at >= TensorboardManager.RUN_DIR_CACHE_TTL:
+                        del TensorboardManager._run_dir_cache[key]
+                TensorboardManager._run_dir_cache.update({key: (exists, now) for key, exists in checked.items()})
 
         valid = []
         invalid = []
 
         for run in runs:
-            expected_output_dir = path.join(TensorboardManager.OUTPUT_PUBLIC_MOUNT_PATH, run.owner, run.name)
-            if path.isdir(expected_output_dir):
+            if run_dirs_exist[(run.owner, run.name)]:
                 valid.append(run)
             else:
                 invalid.append(run)
 
         return valid, invalid
+
+    @staticmethod
+    def _check_run_dir(owner: str, name: str) -> Dict[Tuple[str, str], bool]:
+        expected_output_dir = path.join(TensorboardManager.OUTPUT_PUBLIC_MOUNT_PATH, owner, name)
+        return {(owner, name): path.isdir(expected_output_dir)}
+
+    @staticmethod
+    def _check_owner_run_dirs(owner: str, names: List[str]) -> Dict[Tuple[str, str], bool]:
+        owner_dir = path.join(TensorboardManager.OUTPUT_PUBLIC_MOUNT_PATH, owner)
+        try:
+            with os.scandir(owner_dir) as entries:
+                run_dirs = {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            run_dirs = set()
+        except OSError:
+            log.exception(f'Failed to list {owner_dir}, checking runs separately')
+            checked = {}
+            for name in names:
+                checked.update(TensorboardManager._check_run_dir(owner, name))
+            return checked
+
+        return {(owner, name): name in run_dirs for name in names}
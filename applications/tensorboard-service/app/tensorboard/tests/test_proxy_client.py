@@ -21,6 +21,7 @@ import pytest
 import requests.exceptions
 
 import tensorboard.proxy_client
+from tensorboard.models import Run
 
 
 def test_try_get_last_request_datetime(mocker):
@@ -41,8 +42,26 @@ def test_try_get_last_request_datetime_raise_known_ex(mocker):
     assert last_request_datetimestamp is None
 
 
+def test_try_get_last_request_datetime_timeout(mocker):
+    mocker.patch('requests.get').side_effect = requests.exceptions.ReadTimeout
+
+    last_request_datetimestamp = tensorboard.proxy_client.try_get_last_request_datetime(proxy_address='fake')
+
+    assert last_request_datetimestamp is None
+
+
 def test_try_get_last_request_datetime_raise_unknown_ex(mocker):
     mocker.patch('requests.get').side_effect = TypeError
 
     with pytest.raises(TypeError):
         tensorboard.proxy_client.try_get_last_request_datetime(proxy_address='fake')
+
+
+def test_assign_runs(mocker):
+    fake_put = mocker.patch('requests.put')
+
+    tensorboard.proxy_client.assign_runs(proxy_address='fake', runs=[Run(name='training1', owner='jeanne')])
+
+    fake_put.assert_called_once_with('http://fake/logdir', json={'runs': [{'name': 'training1', 'owner': 'jeanne'}]},
+                                     timeout=tensorboard.proxy_client.PROXY_REQUEST_TIMEOUT)
+    assert fake_put.return_value.raise_for_status.call_count == 1
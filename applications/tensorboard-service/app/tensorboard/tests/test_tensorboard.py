@@ -24,7 +24,9 @@ from kubernetes.client import V1Deployment, V1ObjectMeta, V1beta1Ingress, V1Pod,
 from kubernetes.client.rest import ApiException
 import pytest
 from pytest_mock import MockFixture
+import requests.exceptions
 
+from k8s.informer import TensorboardIndex
 from k8s.models import K8STensorboardInstance
 import tensorboard.tensorboard
 from tensorboard.tensorboard import TensorboardManager
@@ -33,11 +35,18 @@ from tensorboard.models import TensorboardStatus, Run
 FAKE_NAMESPACE = "fake-namespace"
 
 
+@pytest.fixture(autouse=True)
+def reachability_cache(mocker):
+    mocker.patch.object(TensorboardManager, '_reachability_cache', {})
+    mocker.patch.object(TensorboardManager, '_run_dir_cache', {})
+
+
 @pytest.fixture
 def tensorboard_manager_mocked(mocker) -> TensorboardManager:
     mocker.patch('k8s.models.NautaPlatformConfig')
     # noinspection PyTypeChecker
-    mgr = TensorboardManager(api_client=mock.MagicMock(), namespace=FAKE_NAMESPACE, config=mock.MagicMock())
+    mgr = TensorboardManager(api_client=mock.MagicMock(), namespace=FAKE_NAMESPACE,
+                             config=mock.MagicMock(get_tensorboard_pool_size=mock.MagicMock(return_value=0)))
 
     return mgr
 
@@ -46,6 +55,7 @@ def test_incluster_init(mocker: MockFixture):
     fake_namespace = 'some-namespace'
     mocker.patch.object(tensorboard.tensorboard, 'config')
     mocker.patch('nauta.config.NautaPlatformConfig.incluster_init')
+    fake_index = mocker.patch.object(tensorboard.tensorboard, 'TensorboardIndex')
     mocker.patch('builtins.open', new=lambda *args, **kwargs: mock.MagicMock(
         __enter__=lambda *args, **kwargs: mock.MagicMock(
             read=lambda: fake_namespace
@@ -56,6 +66,19 @@ def test_incluster_init(mocker: MockFixture):
 
     assert mgr.namespace == fake_namespace
     assert mgr.client
+    assert fake_index.return_value.start.call_count == 1
+
+
+def test_incluster_init_without_index(mocker: MockFixture):
+    mocker.patch.object(tensorboard.tensorboard, 'config')
+    mocker.patch('nauta.config.NautaPlatformConfig.incluster_init')
+    fake_index = mocker.patch.object(tensorboard.tensorboard, 'TensorboardIndex')
+    mocker.patch('builtins.open')
+
+    mgr = TensorboardManager.incluster_init(with_index=False)
+
+    assert mgr._index is None
+    assert fake_index.call_count == 0
 
 
 # noinspection PyShadowingNames
@@ -86,6 +109,75 @@ def test_create(tensorboard_manager_mocked: TensorboardManager):
     assert tensorboard
 
 
+def _pool_deployment(id: str) -> V1Deployment:
+    return V1Deployment(metadata=V1ObjectMeta(name=f'tensorboard-{id}', resource_version='1',
+                                              labels={'id': id, 'pool-state': 'idle'}))
+
+
+# noinspection PyShadowingNames
+def test_create_from_pool(mocker, tensorboard_manager_mocked: TensorboardManager):
+    fake_runs = [Run(name="some-run-1", owner='alice')]
+    tensorboard_manager_mocked._config.get_tensorboard_pool_size.return_value = 2
+    tensorboard_manager_mocked.client.list_deployments.return_value = [_pool_deployment('first'),
+                                                                       _pool_deployment('second')]
+    tensorboard_manager_mocked.client.patch_deployment.side_effect = [ApiException(status=HTTPStatus.CONFLICT), None]
+    fake_assign_runs = mocker.patch.object(tensorboard.tensorboard, 'assign_runs')
+
+    created_tensorboard = tensorboard_manager_mocked.create(fake_runs)
+
+    assert created_tensorboard.id == 'second'
+    assert created_tensorboard.url == '/tb/second/'
+    assert tensorboard_manager_mocked.client.patch_deployment.call_count == 2
+    patch_body = tensorboard_manager_mocked.client.patch_deployment.call_args[1]['body']
+    assert patch_body['metadata']['resourceVersion'] == '1'
+    assert patch_body['metadata']['labels'] == {
+        'pool-state': 'assigned', 'runs-hash': K8STensorboardInstance.generate_run_names_hash(fake_runs)}
+    fake_assign_runs.assert_called_once_with(proxy_address='tensorboard-second', runs=fake_runs)
+    assert tensorboard_manager_mocked.client.create_deployment.call_count == 0
+
+
+# noinspection PyShadowingNames
+def test_create_from_pool_assign_failure(mocker, tensorboard_manager_mocked: TensorboardManager):
+    fake_runs = [Run(name="some-run-1", owner='alice')]
+    tensorboard_manager_mocked._config.get_tensorboard_pool_size.return_value = 1
+    tensorboard_manager_mocked.client.list_deployments.return_value = [_pool_deployment('first')]
+    mocker.patch.object(tensorboard.tensorboard, 'assign_runs').side_effect = requests.exceptions.ConnectionError
+    mocker.patch.object(tensorboard_manager_mocked, 'delete')
+
+    created_tensorboard = tensorboard_manager_mocked.create(fake_runs)
+
+    assert created_tensorboard.id != 'first'
+    # noinspection PyUnresolvedReferences
+    assert tensorboard_manager_mocked.delete.call_count == 1
+    assert tensorboard_manager_mocked.client.create_deployment.call_count == 1
+
+
+# noinspection PyShadowingNames
+def test_create_from_pool_claim_error(mocker, tensorboard_manager_mocked: TensorboardManager):
+    tensorboard_manager_mocked._config.get_tensorboard_pool_size.return_value = 1
+    tensorboard_manager_mocked.client.list_deployments.return_value = [_pool_deployment('first')]
+    tensorboard_manager_mocked.client.patch_deployment.side_effect = \
+        ApiException(status=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    with pytest.raises(ApiException):
+        tensorboard_manager_mocked.create([Run(name="some-run-1", owner='alice')])
+
+
+# noinspection PyShadowingNames
+def test_fill_pool(mocker, tensorboard_manager_mocked: TensorboardManager):
+    mocker.patch('k8s.models.NautaPlatformConfig')
+    tensorboard_manager_mocked._config.get_tensorboard_pool_size.return_value = 3
+    tensorboard_manager_mocked.client.list_deployments.return_value = [_pool_deployment('first')]
+
+    tensorboard_manager_mocked.fill_pool()
+
+    assert tensorboard_manager_mocked.client.list_deployments.call_args[1]['label_selector'] == \
+        'type=nauta-tensorboard,pool-state=idle'
+    assert tensorboard_manager_mocked.client.create_deployment.call_count == 2
+    assert tensorboard_manager_mocked.client.create_service.call_count == 2
+    assert tensorboard_manager_mocked.client.create_ingress.call_count == 2
+
+
 # noinspection PyShadowingNames
 def test_list(tensorboard_manager_mocked: TensorboardManager):
     tensorboard_manager_mocked.list()
@@ -157,6 +249,93 @@ def test_get_by_id(mocker: MockFixture,
     assert tensorboard.url == fake_tensorboard_path
 
 
+def _indexed_tensorboard_objects(id: str, runs_hash: str = 'fake-hash', pod_phase: str = 'Running'):
+    deployment = V1Deployment(metadata=V1ObjectMeta(name=f'tensorboard-{id}',
+                                                    labels={'id': id, 'runs-hash': runs_hash}))
+    ingress = V1beta1Ingress(metadata=V1ObjectMeta(name=f'tensorboard-{id}', labels={'id': id}),
+                             spec=V1beta1IngressSpec(rules=[V1beta1IngressRule(
+                                 http=V1beta1HTTPIngressRuleValue(paths=[V1beta1HTTPIngressPath(
+                                     backend=V1beta1IngressBackend(service_name='fake-service', service_port=80),
+                                     path=f'/tb/{id}/')]))]))
+    pod = V1Pod(metadata=V1ObjectMeta(name=f'tensorboard-{id}-pod', labels={'id': id}),
+                status=V1PodStatus(phase=pod_phase, container_statuses=[
+                    V1ContainerStatus(ready=True, image='', image_id='', name='', restart_count=0)]))
+    return deployment, ingress, pod
+
+
+def _fake_index(objects) -> TensorboardIndex:
+    index = TensorboardIndex(namespace=FAKE_NAMESPACE, api_client=mock.MagicMock())
+    deployments, ingresses, pods = zip(*objects) if objects else ([], [], [])
+    for resource_index, items in ((index.deployments, deployments), (index.ingresses, ingresses),
+                                  (index.pods, pods)):
+        # noinspection PyProtectedMember
+        resource_index._replace(list(items))
+        # noinspection PyProtectedMember
+        resource_index._synced.set()
+    return index
+
+
+# noinspection PyShadowingNames
+def test_get_by_id_from_index(mocker: MockFixture, tensorboard_manager_mocked: TensorboardManager):
+    tensorboard_manager_mocked._index = _fake_index([_indexed_tensorboard_objects('first'),
+                                                     _indexed_tensorboard_objects('second', pod_phase='Pending')])
+    fake_reachable = mocker.patch('tensorboard.tensorboard.TensorboardManager._check_tensorboard_nginx_reachable',
+                                  return_value=True)
+
+    first_tensorboard = tensorboard_manager_mocked.get_by_id(id='first')
+    second_tensorboard = tensorboard_manager_mocked.get_by_id(id='second')
+    tensorboard_manager_mocked.get_by_id(id='first')
+
+    assert first_tensorboard.status == TensorboardStatus.RUNNING
+    assert first_tensorboard.url == '/tb/first/'
+    assert second_tensorboard.status == TensorboardStatus.CREATING
+    # reachability of running tensorboard is checked once and then cached
+    assert fake_reachable.call_count == 1
+    assert tensorboard_manager_mocked.client.get_deployment.call_count == 0
+    assert tensorboard_manager_mocked.client.get_pod.call_count == 0
+
+
+# noinspection PyShadowingNames
+def test_get_by_id_index_miss(mocker: MockFixture, tensorboard_manager_mocked: TensorboardManager):
+    tensorboard_manager_mocked._index = _fake_index([_indexed_tensorboard_objects('first')])
+    mocker.patch.object(tensorboard_manager_mocked.client, 'get_deployment').return_value = None
+
+    assert tensorboard_manager_mocked.get_by_id(id='just-created') is None
+    assert tensorboard_manager_mocked.client.get_deployment.call_count == 1
+
+
+# noinspection PyShadowingNames
+def test_get_by_runs_from_index(mocker: MockFixture, tensorboard_manager_mocked: TensorboardManager):
+    runs = [Run(name='some-run-1', owner='alice')]
+    runs_hash = K8STensorboardInstance.generate_run_names_hash(runs)
+    tensorboard_manager_mocked._index = _fake_index([_indexed_tensorboard_objects('first'),
+                                                     _indexed_tensorboard_objects('second', runs_hash=runs_hash)])
+    mocker.patch('tensorboard.tensorboard.TensorboardManager._check_tensorboard_nginx_reachable', return_value=True)
+
+    found_tensorboard = tensorboard_manager_mocked.get_by_runs(runs)
+
+    assert found_tensorboard.id == 'second'
+    assert tensorboard_manager_mocked.client.list_deployments.call_count == 0
+
+
+# noinspection PyShadowingNames
+def test_check_tensorboard_nginx_reachable_cached(mocker: MockFixture):
+    fake_reachable = mocker.patch('tensorboard.tensorboard.TensorboardManager._check_tensorboard_nginx_reachable',
+                                  return_value=False)
+    fake_monotonic = mocker.patch('time.monotonic', return_value=1000.0)
+
+    assert not TensorboardManager._check_tensorboard_nginx_reachable_cached('/tb/first/')
+    assert not TensorboardManager._check_tensorboard_nginx_reachable_cached('/tb/first/')
+    assert fake_reachable.call_count == 1
+
+    fake_reachable.return_value = True
+    fake_monotonic.return_value += TensorboardManager.UNREACHABLE_CACHE_TTL
+    assert TensorboardManager._check_tensorboard_nginx_reachable_cached('/tb/first/')
+    fake_monotonic.return_value += TensorboardManager.REACHABLE_CACHE_TTL - 1
+    assert TensorboardManager._check_tensorboard_nginx_reachable_cached('/tb/first/')
+    assert fake_reachable.call_count == 2
+
+
 # noinspection PyShadowingNames
 def test_get_by_id_not_found(mocker: MockFixture, tensorboard_manager_mocked: TensorboardManager):
     mocker.patch.object(tensorboard_manager_mocked.client, 'get_deployment').return_value = None
@@ -382,6 +561,56 @@ def test_delete_garbage(mocker, tensorboard_manager_mocked: TensorboardManager,
     assert tensorboard_manager_mocked.delete.call_count == delete_count
 
 
+def test_delete_garbage_many_tensorboards(mocker, tensorboard_manager_mocked: TensorboardManager):
+    mocker.patch.object(TensorboardManager, '_get_current_datetime').return_value = \
+        datetime(year=2018, month=6, day=19, hour=13, minute=0)
+    mocker.patch.object(tensorboard_manager_mocked, 'list').return_value = [
+        V1Deployment(metadata=V1ObjectMeta(name=f'fake-name-{i}')) for i in range(5)
+    ]
+
+    def fake_delete(tensorboard_deployment: V1Deployment):
+        if tensorboard_deployment.metadata.name == 'fake-name-1':
+            raise ApiException(status=HTTPStatus.INTERNAL_SERVER_ERROR.value)
+
+    mocker.patch.object(tensorboard_manager_mocked, 'delete').side_effect = fake_delete
+
+    def fake_try_get_last_request_datetime(proxy_address: str):
+        if proxy_address == 'fake-name-0':
+            raise ValueError
+        elif proxy_address == 'fake-name-2':
+            return None
+        elif proxy_address == 'fake-name-3':
+            return datetime(year=2018, month=6, day=19, hour=12, minute=59)
+        return datetime(year=2018, month=6, day=19, hour=12, minute=0)
+
+    mocker.patch.object(tensorboard.tensorboard, 'try_get_last_request_datetime').\
+        side_effect = fake_try_get_last_request_datetime
+    mocker.patch.object(tensorboard_manager_mocked, 'refresh_garbage_timeout')
+    mocker.patch.object(tensorboard_manager_mocked, 'get_garbage_timeout').return_value = 1800
+
+    tensorboard_manager_mocked.delete_garbage()
+
+    # noinspection PyUnresolvedReferences
+    deleted_names = {call[0][0].metadata.name for call in tensorboard_manager_mocked.delete.call_args_list}
+    assert deleted_names == {'fake-name-1', 'fake-name-4'}
+
+
+def test_delete_garbage_skips_idle_pool(mocker, tensorboard_manager_mocked: TensorboardManager):
+    mocker.patch.object(TensorboardManager, '_get_current_datetime').return_value = \
+        datetime(year=2018, month=6, day=19, hour=13, minute=0)
+    mocker.patch.object(tensorboard_manager_mocked, 'list').return_value = [_pool_deployment('first')]
+    mocker.patch.object(tensorboard_manager_mocked, 'delete')
+    fake_try_get_last_request_datetime = mocker.patch.object(tensorboard.tensorboard, 'try_get_last_request_datetime')
+    mocker.patch.object(tensorboard_manager_mocked, 'refresh_garbage_timeout')
+    mocker.patch.object(tensorboard_manager_mocked, 'get_garbage_timeout').return_value = 1800
+
+    tensorboard_manager_mocked.delete_garbage()
+
+    assert fake_try_get_last_request_datetime.call_count == 0
+    # noinspection PyUnresolvedReferences
+    assert tensorboard_manager_mocked.delete.call_count == 0
+
+
 def test_delete_garbage_gateway_timeout(mocker, tensorboard_manager_mocked: TensorboardManager):
     mocker.patch.object(tensorboard_manager_mocked, 'list').side_effect = ApiException(
         status=HTTPStatus.GATEWAY_TIMEOUT.value
@@ -418,3 +647,43 @@ def test_validate_runs(mocker, tensorboard_manager_mocked: TensorboardManager):
 
     assert valid == [fake_runs[0], fake_runs[1]]
     assert invalid == [fake_runs[2]]
+
+
+# noinspection PyShadowingNames
+def test_validate_runs_cached(mocker, tensorboard_manager_mocked: TensorboardManager):
+    fake_isdir = mocker.patch('os.path.isdir', return_value=False)
+    fake_monotonic = mocker.patch('time.monotonic', return_value=1000.0)
+    fake_runs = [Run(name='training1', owner='jeanne')]
+
+    assert tensorboard_manager_mocked.validate_runs(fake_runs) == ([], fake_runs)
+    assert tensorboard_manager_mocked.validate_runs(fake_runs) == ([], fake_runs)
+    assert fake_isdir.call_count == 1
+
+    fake_isdir.return_value = True
+    fake_monotonic.return_value += TensorboardManager.RUN_DIR_MISSING_CACHE_TTL
+    assert tensorboard_manager_mocked.validate_runs(fake_runs) == (fake_runs, [])
+    fake_monotonic.return_value += TensorboardManager.RUN_DIR_CACHE_TTL - 1
+    assert tensorboard_manager_mocked.validate_runs(fake_runs) == (fake_runs, [])
+    assert fake_isdir.call_count == 2
+
+
+# noinspection PyShadowingNames
+def test_validate_runs_owner_listing(mocker, tmpdir, tensorboard_manager_mocked: TensorboardManager):
+    mocker.patch.object(TensorboardManager, 'OUTPUT_PUBLIC_MOUNT_PATH', str(tmpdir))
+    mocker.patch.object(TensorboardManager, 'OWNER_LISTING_THRESHOLD', 2)
+    fake_isdir = mocker.patch('os.path.isdir', return_value=True)
+    tmpdir.mkdir('jeanne').mkdir('training1')
+    tmpdir.join('jeanne', 'training2').write('not a directory')
+    fake_runs = [Run(name='training1', owner='jeanne'),
+                 Run(name='training2', owner='jeanne'),
+                 Run(name='training3', owner='jeanne'),
+                 Run(name='training4', owner='harold'),
+                 Run(name='training5', owner='harold'),
+                 Run(name='training6', owner='abbie')]
+
+    valid, invalid = tensorboard_manager_mocked.validate_runs(fake_runs)
+
+    assert valid == [fake_runs[0], fake_runs[5]]
+    assert invalid == fake_runs[1:5]
+    # only run of abbie is checked separately
+    fake_isdir.assert_called_once_with(str(tmpdir.join('abbie', 'training6')))
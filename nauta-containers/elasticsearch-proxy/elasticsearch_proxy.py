@@ -19,6 +19,7 @@ from flask import Response
 from flask import request
 
 import requests
+from requests.adapters import HTTPAdapter
 
 import base64
 from subprocess import check_output
@@ -32,14 +33,38 @@ REDIRECT_TO = f'http://{ip}:{ELASTICSEARCH_PORT}/'
 ADMIN_KEY = base64.b64encode(
     open("/var/es-proxy-auth/token").read().encode("ascii")).decode("ascii")
 
+# size of pool of keep-alive connections to Elasticsearch, should not be lower than number of concurrent
+# requests handled by a worker
+UPSTREAM_POOL_SIZE = 64
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# headers related to a single connection, which must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                      'transfer-encoding', 'upgrade'}
+
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE))
+
+
+def stream_upstream_response(original_response):
+    try:
+        # content is passed as it is, so gzip encoded responses are not decompressed and compressed again
+        yield from original_response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+    finally:
+        original_response.close()
+
 
 def create_flask_response(original_response):
     flask_response = Response(
-        response=original_response.content,
-        content_type=original_response.headers['content-type'])
+        response=stream_upstream_response(original_response),
+        direct_passthrough=True)
 
     flask_response.status_code = original_response.status_code
 
+    for header_key, header_value in original_response.headers.items():
+        if header_key.lower() not in HOP_BY_HOP_HEADERS and header_key.lower() != 'set-cookie':
+            flask_response.headers[header_key] = header_value
+
     for cookie_key, cookie_value in original_response.cookies.items():
         flask_response.set_cookie(cookie_key, value=cookie_value)
 
@@ -59,7 +84,7 @@ def redirect(url=""):
     if request.query_string:
         new_url = new_url + '?' + request.query_string.decode("ascii")
 
-    headers = dict(request.headers)
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
 
     if (
         not is_gui_search_scroll_request(url, request)
@@ -69,11 +94,12 @@ def redirect(url=""):
     ):
         return "", 403
 
-    response = requests.request(
+    response = session.request(
         request.method,
         str(REDIRECT_TO + new_url),
         data=request.get_data(),
         headers=headers,
-        cookies=request.cookies)
+        cookies=request.cookies,
+        stream=True)
 
     return create_flask_response(response)